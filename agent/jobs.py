@@ -0,0 +1,46 @@
+"""
+Job kinds for the background job queue (services/jobs.py, /jobs routes).
+
+Each runs in a worker process against a read-only service over a graph snapshot and
+returns something JSON-serialisable.
+"""
+from typing import Any, Callable, Dict, List, Optional
+from agent.orchestrator import audit_invoice, audit_invoices, vendor_risk
+from services.graph_service import GraphService
+from services.jobs import JobManager
+from services.reconciliation import ReconciliationEngine
+from services.risk_service import RiskService, MAX_CYCLE_LENGTH, MAX_CYCLES
+
+def analyze_invoice_job(gs: GraphService, invoice_id: str, period: Optional[str] = None) -> dict:
+    return audit_invoice(gs, invoice_id).model_dump()
+
+def analyze_invoices_job(gs: GraphService, invoice_ids: List[str], period: Optional[str] = None) -> list:
+    return [response.model_dump() for response in audit_invoices(gs, invoice_ids)]
+
+def vendor_risk_job(gs: GraphService, gstin: str) -> dict:
+    return vendor_risk(gs, gstin)
+
+def top_vendors_job(gs: GraphService, limit: int = 10, weight: Optional[str] = None, period: Optional[str] = None) -> list:
+    return RiskService(gs).get_top_risky_vendors(limit=limit, weight=weight, period=period)
+
+def period_cycles_job(gs: GraphService, period: str, max_length: int = MAX_CYCLE_LENGTH, limit: int = MAX_CYCLES) -> dict:
+    loops = RiskService(gs).find_period_cycles(period, max_length=max_length, limit=limit)
+    return {"period": period, "loop_count": len(loops), "loops": loops}
+
+def reconcile_period_job(gs: GraphService, period: str, gstin: Optional[str] = None) -> dict:
+    engine = ReconciliationEngine(gs)
+    mismatches = [{"invoice_id": invoice_id, "mismatch": mismatch.model_dump()}
+                  for invoice_id, mismatch in engine.reconcile_period(period, gstin=gstin)]
+    return {"mismatches": mismatches, "summary": engine.last_summary.model_dump()}
+
+JOB_KINDS: Dict[str, Callable[..., Any]] = {
+    "analyze-invoice": analyze_invoice_job,
+    "analyze-invoices": analyze_invoices_job,
+    "vendor-risk": vendor_risk_job,
+    "top-vendors": top_vendors_job,
+    "period-cycles": period_cycles_job,
+    "reconcile-period": reconcile_period_job,
+}
+
+# Process-wide instance used by the /jobs routes; workers are started on first submission
+job_manager = JobManager(JOB_KINDS)
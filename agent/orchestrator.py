@@ -1,27 +1,119 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from fastapi import APIRouter, HTTPException, Depends
-from models.schemas import AuditTrailResponse
-from services.graph_service import GraphService, gst_graph
+from fastapi.responses import StreamingResponse
+from models.schemas import AuditTrailResponse, BatchAnalyzeRequest, VendorScore, VendorScoreRequest
+from services.graph_service import GraphService
+from services.serving import get_graph_service, get_period_graph_service, load_cold_invoice, load_cold_periods, pinned_graph_service
 from services.reconciliation import ReconciliationEngine
-from services.risk_service import RiskService
-from services.ml_service import MLService
+from services.risk_service import RiskService, TRADE_WEIGHTS, MAX_CYCLE_LENGTH, MAX_CYCLES
+from services.ml_service import MLService, risk_bucket
 from services.audit_generator import AuditGenerator
+from services.audit_cache import audit_cache
+from services.metrics import stage
 
 router = APIRouter(tags=["Orchestrator Agent"])
 
-def get_graph_service() -> GraphService:
-    return GraphService(gst_graph)
+# Stage timings are recorded under this pipeline name (see services/metrics.py)
+PIPELINE = "analyze_invoice"
 
 @router.post("/analyze-invoice", response_model=AuditTrailResponse, description="Agent Orchestrator entry point")
-def analyze_invoice(payload: dict, gs: GraphService = Depends(get_graph_service)):
-    # 1. Parse Input
+def analyze_invoice(payload: dict):
+    # 1. Parse Input (two dict lookups; FastAPI has already decoded the body, so not a timed stage)
     invoice_id = payload.get("invoice_id")
     period = payload.get("period")
-    
+
     if not invoice_id:
         raise HTTPException(status_code=400, detail="invoice_id is required")
 
+    # Load the invoice's period back if it was evicted, then analyse one consistent version
+    with stage(PIPELINE, "cold_load"):
+        load_cold_invoice(invoice_id, period)
+    with pinned_graph_service() as gs:
+        return audit_invoice(gs, invoice_id)
+
+@router.post("/analyze-invoices", description="Batch analysis: invoices are audited together and streamed back as NDJSON")
+def analyze_invoices(payload: BatchAnalyzeRequest):
+    if payload.period is not None:
+        load_cold_periods([payload.period])
+    for invoice_id in payload.invoice_ids:
+        load_cold_invoice(invoice_id, payload.period)
+
+    def stream():
+        # One AuditTrailResponse per line, in supplier order, as each is finished
+        with pinned_graph_service() as gs:
+            for response in audit_invoices(gs, payload.invoice_ids):
+                yield response.model_dump_json() + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+class AuditContext:
+    """
+    Work an audit shares between invoices, built once per request or once per batch: the
+    engines, the ML model, and per supplier its cycles and its vendor score. The propagation
+    vector is not held here. Vendor features read it through RiskService, which caches it on
+    the graph per trade version, so every context on that version shares one computation.
+
+    A batch passes its suppliers up front: the first vendor score it needs scores all of them
+    in one vectorised model call (a batch whose audits are all cached scores none).
+    """
+    def __init__(self, gs: GraphService, suppliers: Iterable[str] = ()):
+        self.gs = gs
+        self.recon_engine = ReconciliationEngine(gs)
+        self.risk_service = RiskService(gs)
+        self.ml_service = MLService()
+        self._cycles: Dict[str, List[List[str]]] = {}
+        self._vendor_risk: Dict[str, dict] = {}
+        self._suppliers = list(suppliers)
+
+    def cycles(self, gstin: str) -> List[List[str]]:
+        if gstin not in self._cycles:
+            self._cycles[gstin] = self.risk_service.detect_circular_trading(gstin)
+        return self._cycles[gstin]
+
+    def vendor_risk(self, gstin: str) -> dict:
+        # The model scores vendors, so it sees the supplier's feature store row
+        if gstin not in self._vendor_risk:
+            if not self._suppliers:
+                # Single-row path
+                self._vendor_risk[gstin] = self.ml_service.predict_vendor_compliance(gstin, self.gs.get_vendor_features(gstin))
+            else:
+                gstins = list(dict.fromkeys([gstin] + self._suppliers))
+                self._suppliers = []
+                features = self.gs.features.to_frame(self.gs, gstins=gstins)
+                self._vendor_risk.update(self.ml_service.predict_vendors_compliance(features))
+        return self._vendor_risk[gstin]
+
+def audit_invoices(gs: GraphService, invoice_ids: Iterable[str]) -> Iterator[AuditTrailResponse]:
+    """Audits invoices grouped by supplier (each listed once), sharing one AuditContext."""
+    by_supplier: Dict[str, List[str]] = {}
+    for invoice_id in dict.fromkeys(invoice_ids):
+        by_supplier.setdefault(gs.get_invoice_supplier(invoice_id) or "Unknown", []).append(invoice_id)
+    ctx = AuditContext(gs, suppliers=by_supplier)
+    for invoice_ids in by_supplier.values():
+        for invoice_id in invoice_ids:
+            yield audit_invoice(gs, invoice_id, ctx)
+
+@router.get("/analyze-invoice/cache", description="Analyze-invoice result cache: size, hits, misses and invalidations")
+def get_audit_cache_stats():
+    return audit_cache.stats()
+
+def audit_invoice(gs: GraphService, invoice_id: str, ctx: Optional[AuditContext] = None) -> AuditTrailResponse:
+    """Cached audit of one invoice (see services/audit_cache.py)."""
+    with stage(PIPELINE, "cache"):
+        response = audit_cache.get(gs, invoice_id)
+    if response is None:
+        response, dependencies = _audit_invoice(gs, invoice_id, ctx or AuditContext(gs))
+        audit_cache.put(gs, invoice_id, response, dependencies)
+    return response
+
+def _audit_invoice(gs: GraphService, invoice_id: str, ctx: AuditContext) -> Tuple[AuditTrailResponse, Set[str]]:
+    """(response, nodes it depended on)"""
+    dependencies = {f"Invoice:{invoice_id}"}
     # 2. Extract Subgraph for targeted analysis
-    invoice_data = gs.get_node(f"Invoice:{invoice_id}")
+    with stage(PIPELINE, "subgraph"):
+        invoice_data = gs.get_node(f"Invoice:{invoice_id}")
+        # Identify Supplier
+        supplier_gstin = (gs.get_invoice_supplier(invoice_id) or "Unknown") if invoice_data else "Unknown"
     if not invoice_data:
         # Generate synthetic deterministic data for any uploaded file
         import hashlib
@@ -54,43 +146,35 @@ def analyze_invoice(payload: dict, gs: GraphService = Depends(get_graph_service)
             mismatches=mismatches,
             total_exposure=total_exp,
             overall_risk=overall_risk
-        )
+        ), dependencies
     
-    # Identify Supplier
-    supplier_nodes = [u for u, v, attrs in gs.g.edges(data=True) if attrs.get("relation") == "SUPPLIED_BY" and v == f"Invoice:{invoice_id}"]
-    supplier_id_raw = supplier_nodes[0] if supplier_nodes else None
-    supplier_gstin = supplier_id_raw.split(":")[1] if supplier_id_raw else "Unknown"
-
     # 3. Agent calls Reconciliation Engine
-    recon_engine = ReconciliationEngine(gs)
-    mismatches = recon_engine.reconcile_invoice(invoice_id)
-    
+    with stage(PIPELINE, "reconciliation"):
+        mismatches = ctx.recon_engine.reconcile_invoice(invoice_id)
+        for filings in (gs.get_gstr1_entries(invoice_id), gs.get_gstr2b_entries(invoice_id), gs.get_einvoice_entries(invoice_id)):
+            dependencies.update(filings)
+
     # 4. Agent calls Advanced Graph Intelligence
-    risk_service = RiskService(gs)
-    cycles = []
-    if supplier_gstin != "Unknown":
-        cycles = risk_service.detect_circular_trading(supplier_gstin)
-    
-    # Calculate network risk for supplier
-    all_risks = risk_service.calculate_risk_propagation()
-    supplier_pr_score = all_risks.get(f"Taxpayer:{supplier_gstin}", 0.0)
+    with stage(PIPELINE, "graph_intelligence"):
+        cycles = []
+        if supplier_gstin != "Unknown":
+            cycles = ctx.cycles(supplier_gstin)
+            dependencies.add(f"Taxpayer:{supplier_gstin}")
+            for cycle in cycles:
+                dependencies.update(cycle)
 
     # 5. Agent calls ML Vendor Risk Model
-    ml_service = MLService()
-    graph_features = {
-        "propagated_risk_score": supplier_pr_score,
-        "cycle_involvements": len(cycles),
-        "mismatch_count": len(mismatches),
-    }
-    vendor_risk = ml_service.predict_vendor_compliance(supplier_gstin, graph_features)
+    with stage(PIPELINE, "ml_model"):
+        vendor_risk = ctx.vendor_risk(supplier_gstin)
 
     # 6. Synthesize via Audit Trail Generator
-    audit_explanation = AuditGenerator.generate_audit_trail(invoice_id, mismatches, vendor_risk, cycles)
+    with stage(PIPELINE, "audit_synthesis"):
+        audit_explanation = AuditGenerator.generate_audit_trail(invoice_id, mismatches, vendor_risk, cycles)
 
-    total_exposure = sum(m.financial_exposure for m in mismatches)
-    overall_risk = vendor_risk["risk_bucket"]
-    if cycles:
-        overall_risk = "Critical (Cycle Detected)"
+        total_exposure = sum(m.financial_exposure for m in mismatches)
+        overall_risk = vendor_risk["risk_bucket"]
+        if cycles:
+            overall_risk = "Critical (Cycle Detected)"
 
     return AuditTrailResponse(
         invoice_id=invoice_id,
@@ -98,28 +182,37 @@ def analyze_invoice(payload: dict, gs: GraphService = Depends(get_graph_service)
         mismatches=mismatches,
         total_exposure=total_exposure,
         overall_risk=overall_risk
-    )
+    ), dependencies
 
 @router.get("/vendor-risk/{gstin}", description="Get predictive ML score for a vendor")
 def get_vendor_risk(gstin: str, gs: GraphService = Depends(get_graph_service)):
-    risk_service = RiskService(gs)
-    
-    cycles = risk_service.detect_circular_trading(gstin)
-    all_risks = risk_service.calculate_risk_propagation()
-    supplier_pr_score = all_risks.get(f"Taxpayer:{gstin}", 0.0)
+    return vendor_risk(gs, gstin)
 
-    # For pure vendor lookup, we might not have 'mismatch' count readily without full traversal,
-    # mapping to 0 for mock.
+def vendor_risk(gs: GraphService, gstin: str) -> dict:
+    # Features are materialised per taxpayer (services/feature_store.py), so this is a lookup
+    graph_features = gs.get_vendor_features(gstin)
     ml_service = MLService()
-    graph_features = {
-        "propagated_risk_score": supplier_pr_score,
-        "cycle_involvements": len(cycles),
-        "mismatch_count": 0,
-    }
-    
     return ml_service.predict_vendor_compliance(gstin, graph_features)
 
-@router.get("/risk/top-vendors", description="Get top N risky vendors ranked by network propagation")
-def get_top_risky_vendors(limit: int = 10, gs: GraphService = Depends(get_graph_service)):
+@router.post("/vendor-risk/batch", response_model=List[VendorScore], description="Score many vendors (or the whole network) in one vectorised call, riskiest first")
+def score_vendors(payload: VendorScoreRequest, gs: GraphService = Depends(get_graph_service)):
+    features = gs.features.to_frame(gs, all_taxpayers=payload.gstins is None)
+    if payload.gstins is not None:
+        features = features.reindex(list(dict.fromkeys(payload.gstins)), fill_value=0)
+    scores = MLService().score_vendors(features)
+    order = scores.argsort(kind="stable")[::-1][:payload.limit]
+    return [VendorScore(gstin=features.index[i], compliance_risk_score=round(float(scores[i]), 2), risk_bucket=risk_bucket(scores[i]))
+            for i in order]
+
+@router.get("/risk/top-vendors", description="Get top N risky vendors ranked by network propagation, optionally within one period")
+def get_top_risky_vendors(limit: int = 10, weight: Optional[str] = None, period: Optional[str] = None, gs: GraphService = Depends(get_period_graph_service)):
+    if weight is not None and weight not in TRADE_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"weight must be one of {', '.join(TRADE_WEIGHTS)}")
+    rs = RiskService(gs)
+    return rs.get_top_risky_vendors(limit=limit, weight=weight, period=period)
+
+@router.get("/risk/cycles/{period}", description="List every circular trading loop formed by a period's invoices")
+def get_period_cycles(period: str, max_length: int = MAX_CYCLE_LENGTH, limit: int = MAX_CYCLES, gs: GraphService = Depends(get_period_graph_service)):
     rs = RiskService(gs)
-    return rs.get_top_risky_vendors(limit=limit)
+    loops = rs.find_period_cycles(period, max_length=max_length, limit=limit)
+    return {"period": period, "loop_count": len(loops), "loops": loops}
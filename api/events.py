@@ -0,0 +1,24 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from services.event_stream import KINDS, event_broker
+
+router = APIRouter(tags=["events"])
+
+def _names(value: Optional[str]) -> Optional[list]:
+    return [name.strip() for name in value.split(",") if name.strip()] if value else None
+
+@router.get("/events", description="Server-Sent Events stream of what each ingest batch changed: new and resolved mismatches, "
+                                   "taxpayers joining or leaving trading loops, and vendors whose propagated risk moved. "
+                                   "`gstin`, `period` and `kinds` (mismatch, cycle, risk) are comma-separated filters")
+async def events(gstin: Optional[str] = None, period: Optional[str] = None, kinds: Optional[str] = None):
+    selected = _names(kinds) or list(KINDS)
+    unknown = sorted(set(selected) - set(KINDS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"kinds must be among {', '.join(KINDS)} (got {', '.join(unknown)})")
+    subscription = event_broker.subscribe(asyncio.get_running_loop(), gstins=_names(gstin), periods=_names(period),
+                                          kinds=selected)
+    # No caching or proxy buffering, or events arrive in lumps
+    return StreamingResponse(subscription.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
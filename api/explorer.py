@@ -0,0 +1,49 @@
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from services.graph_explorer import GraphExplorer, View, encode_columnar, encode_json
+from services.graph_service import GraphService
+from services.serving import get_graph_service, get_period_graph_service
+
+router = APIRouter(prefix="/graph", tags=["graph explorer"])
+
+# Binary columnar views (layout in services/graph_explorer.py)
+COLUMNAR_MEDIA_TYPE = "application/vnd.gst.columnar"
+
+def _encode(view: View, format: str) -> Response:
+    if format == "columnar":
+        return Response(encode_columnar(view), media_type=COLUMNAR_MEDIA_TYPE)
+    return Response(encode_json(view), media_type="application/json")
+
+def _names(value: Optional[str]) -> Optional[list]:
+    return [name.strip() for name in value.split(",") if name.strip()] if value else None
+
+@router.get("/overview", description="Taxpayer-level explorer view: trade edges aggregated from invoices (optionally one period's), "
+                                     "the heaviest `limit` by tax value, with cached 3-D layout coordinates")
+def graph_overview(
+    period: Optional[str] = None,
+    min_invoices: int = Query(1, ge=1),
+    limit: Optional[int] = Query(None, ge=1),
+    format: Literal["json", "columnar"] = "json",
+    gs: GraphService = Depends(get_period_graph_service),
+):
+    return _encode(GraphExplorer(gs).overview(period=period, min_invoices=min_invoices, limit=limit), format)
+
+@router.get("/neighbourhood/{node_id:path}",
+            description="One page of the nodes within `depth` hops of a node, breadth-first from `cursor`, with the edges "
+                        "between them; follow meta.next_cursor for the rest. `relations` and `node_types` are comma-separated")
+def graph_neighbourhood(
+    node_id: str,
+    depth: int = Query(1, ge=0, le=6),
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=100000),
+    relations: Optional[str] = None,
+    node_types: Optional[str] = None,
+    format: Literal["json", "columnar"] = "json",
+    gs: GraphService = Depends(get_graph_service),
+):
+    view = GraphExplorer(gs).neighbourhood(node_id, depth=depth, cursor=cursor, limit=limit,
+                                           relations=_names(relations), node_types=_names(node_types))
+    if view is None:
+        raise HTTPException(status_code=404, detail=f"Node {node_id} not found")
+    return _encode(view, format)
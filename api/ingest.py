@@ -1,64 +1,190 @@
-from fastapi import APIRouter, HTTPException, Depends
+import codecs
+import csv
+import json
+import time
+from collections import deque
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Union
+from pydantic import ValidationError
 from models.schemas import GSTR1Record, GSTR2BRecord, PurchaseRegisterEntry, EInvoiceRecord, EWayBillRecord, Invoice
-from services.graph_service import GraphService, gst_graph
+from services.graph_store import GraphStore, graph_store
+from services.ingest_service import IngestService, RECORD_MODELS
+import config
 
 router = APIRouter(prefix="/ingest", tags=["ingestion"])
 
-def get_graph_service() -> GraphService:
-    return GraphService(gst_graph)
+# Per-row errors beyond this many are counted but not echoed back
+MAX_REPORTED_ERRORS = 100
+
+def get_graph_store() -> GraphStore:
+    return graph_store
 
 @router.post("/invoice", description="Ingest base invoice data")
-def ingest_invoice(invoices: List[Invoice], gs: GraphService = Depends(get_graph_service)):
-    for inv in invoices:
-        gs.add_invoice(
-            invoice_id=inv.invoice_id,
-            supplier_gstin=inv.supplier_gstin,
-            buyer_gstin=inv.buyer_gstin,
-            period=inv.period,
-            attributes={"tax_value": inv.tax_value, "total_value": inv.total_value, "date": inv.date}
-        )
-    return {"status": "success", "count": len(invoices)}
+def ingest_invoice(invoices: List[Invoice], store: GraphStore = Depends(get_graph_store)):
+    count = IngestService(store).apply("invoice", invoices)
+    return {"status": "success", "count": count}
 
 @router.post("/gstr1", description="Ingest GSTR-1 records (Supplier side)")
-def ingest_gstr1(records: List[GSTR1Record], gs: GraphService = Depends(get_graph_service)):
-    for rec in records:
-        gs.add_gstr1_entry(
-            invoice_id=rec.invoice_id,
-            supplier_gstin=rec.supplier_gstin,
-            period=rec.period,
-            attributes={"tax_value": rec.tax_value}
-        )
-    return {"status": "success", "count": len(records)}
+def ingest_gstr1(records: List[GSTR1Record], store: GraphStore = Depends(get_graph_store)):
+    count = IngestService(store).apply("gstr1", records)
+    return {"status": "success", "count": count}
 
 @router.post("/gstr2b", description="Ingest GSTR-2B records (Buyer side auto-populated)")
-def ingest_gstr2b(records: List[GSTR2BRecord], gs: GraphService = Depends(get_graph_service)):
-    for rec in records:
-        gs.add_gstr2b_entry(
-            invoice_id=rec.invoice_id,
-            buyer_gstin=rec.buyer_gstin,
-            period=rec.period,
-            attributes={"itc_available": rec.itc_available}
-        )
-    return {"status": "success", "count": len(records)}
+def ingest_gstr2b(records: List[GSTR2BRecord], store: GraphStore = Depends(get_graph_store)):
+    count = IngestService(store).apply("gstr2b", records)
+    return {"status": "success", "count": count}
 
 @router.post("/purchase_register", description="Ingest Purchase Register (Buyer's internal books)")
-def ingest_pr(records: List[PurchaseRegisterEntry], gs: GraphService = Depends(get_graph_service)):
-    for rec in records:
-        gs.add_purchase_register_entry(
-            invoice_id=rec.invoice_id,
-            buyer_gstin=rec.buyer_gstin,
-            period=rec.period,
-            attributes={"tax_paid": rec.tax_paid}
-        )
-    return {"status": "success", "count": len(records)}
+def ingest_pr(records: List[PurchaseRegisterEntry], store: GraphStore = Depends(get_graph_store)):
+    count = IngestService(store).apply("purchase_register", records)
+    return {"status": "success", "count": count}
 
 @router.post("/einvoice", description="Ingest e-Invoice data")
-def ingest_einvoice(records: List[EInvoiceRecord], gs: GraphService = Depends(get_graph_service)):
-    for rec in records:
-        gs.add_einvoice_entry(
-            irn=rec.irn,
-            invoice_id=rec.invoice_id,
-            attributes={"tax_value": rec.tax_value, "date": rec.date, "supplier_gstin": rec.supplier_gstin, "buyer_gstin": rec.buyer_gstin}
-        )
-    return {"status": "success", "count": len(records)}
+def ingest_einvoice(records: List[EInvoiceRecord], store: GraphStore = Depends(get_graph_store)):
+    count = IngestService(store).apply("einvoice", records)
+    return {"status": "success", "count": count}
+
+@router.post(
+    "/stream/{kind}",
+    description="Streaming ingest of NDJSON (application/x-ndjson) or CSV (text/csv, header row required) bodies. "
+                "kind is one of invoice, gstr1, gstr2b, purchase_register, einvoice. "
+                "Rows are validated and applied in fixed-size chunks; bad rows, and chunks that fail to apply, "
+                "are reported without aborting the batch. Quoted CSV fields may span lines."
+)
+async def ingest_stream(kind: str, request: Request, store: GraphStore = Depends(get_graph_store)):
+    model = RECORD_MODELS.get(kind)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Unknown record type '{kind}'")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        rows = _csv_rows(_iter_lines(request))
+    elif content_type in ("application/x-ndjson", "application/ndjson", "application/jsonlines", "application/jsonl"):
+        rows = _ndjson_rows(_iter_lines(request))
+    else:
+        raise HTTPException(status_code=415, detail="Body must be application/x-ndjson or text/csv")
+
+    service = IngestService(store)
+    started = time.perf_counter()
+    accepted, rejected, errors = 0, 0, []
+    chunk, chunk_lines = [], []
+
+    def report(line_no: int, error: str):
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": error})
+
+    async def apply_chunk() -> int:
+        # A chunk that fails to apply is reported like a bad row, at its first line; later chunks still go in
+        try:
+            return await run_in_threadpool(service.apply, kind, chunk)
+        except Exception as exc:
+            report(chunk_lines[0], f"Chunk of {len(chunk)} rows (lines {chunk_lines[0]}-{chunk_lines[-1]}) "
+                                   f"failed to apply: {exc}")
+            nonlocal rejected
+            rejected += len(chunk)
+            return 0
+
+    async for line_no, row in rows:
+        try:
+            if isinstance(row, Exception):
+                raise row
+            chunk.append(model.model_validate(row))
+            chunk_lines.append(line_no)
+        except (ValueError, ValidationError) as exc:
+            rejected += 1
+            report(line_no, str(exc))
+            continue
+        if len(chunk) >= config.INGEST_CHUNK_SIZE:
+            accepted += await apply_chunk()
+            chunk, chunk_lines = [], []
+    if chunk:
+        accepted += await apply_chunk()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "status": "success" if rejected == 0 else "partial",
+        "kind": kind,
+        "accepted": accepted,
+        "rejected": rejected,
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "rows_per_second": accepted / elapsed if elapsed > 0 else 0.0,
+    }
+
+async def _iter_lines(request: Request):
+    """Yields (line_number, text) from the request body as it arrives."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    line_no = 0
+    async for data in request.stream():
+        buffer += decoder.decode(data)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield line_no + 1, buffer.rstrip("\r")
+
+async def _ndjson_rows(lines):
+    """(line number, row dict, or the ValueError that line raised) per non-blank NDJSON line."""
+    async for line_no, line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("Each NDJSON line must be a JSON object")
+        except ValueError as exc:
+            row = exc
+        yield line_no, row
+
+class _PendingLines:
+    """Iterator csv.reader pulls lines from; it is only asked for a record once all of its lines are queued."""
+    def __init__(self):
+        self.queue = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.queue:
+            raise StopIteration
+        return self.queue.popleft()
+
+async def _csv_rows(lines):
+    """
+    (line number of its first line, row dict, or the ValueError it raised) per CSV record,
+    keyed by the header row. One csv.reader reads the whole body, so quoted fields may span
+    lines. Empty cells become None.
+    """
+    pending = _PendingLines()
+    reader = csv.reader(pending)
+    header = []
+    start, in_quotes = None, False
+    async for line_no, line in lines:
+        if start is None:
+            if not line.strip():
+                continue
+            start = line_no
+        pending.queue.append(line + "\n")
+        # An odd number of quote characters leaves a quoted field open ("" escapes count twice)
+        in_quotes ^= line.count('"') % 2 == 1
+        if in_quotes:
+            continue
+        record_start, start = start, None
+        try:
+            values = next(reader)
+        except csv.Error as exc:
+            yield record_start, ValueError(str(exc))
+            continue
+        if not header:
+            header.extend(v.strip() for v in values)
+            continue
+        if len(values) != len(header):
+            yield record_start, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        yield record_start, {k: (v if v != "" else None) for k, v in zip(header, values)}
+    if start is not None:
+        pending.queue.clear()
+        yield start, ValueError("Unterminated quoted field at end of body")
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException
+from models.schemas import JobRequest, JobStatus
+from agent.jobs import JOB_KINDS, job_manager
+from services.jobs import JobQueueFull
+from services.risk_service import TRADE_WEIGHTS
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+@router.post("", response_model=JobStatus, status_code=202,
+             description=f"Submit a background analytics job ({', '.join(JOB_KINDS)}); identical jobs are reused")
+def submit_job(request: JobRequest):
+    weight = request.params.get("weight")
+    if weight is not None and weight not in TRADE_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"weight must be one of {', '.join(TRADE_WEIGHTS)}")
+    try:
+        job, reused = job_manager.submit(request.kind, request.params, request.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.status(reused=reused)
+
+@router.get("/{job_id}", response_model=JobStatus, description="Job status")
+def get_job(job_id: str):
+    return _job(job_id).status()
+
+@router.get("/{job_id}/result", description="Result of a finished job")
+def get_job_result(job_id: str):
+    job = _job(job_id)
+    if job.state == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.state != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}")
+    return job.result
+
+@router.delete("/{job_id}", response_model=JobStatus, description="Cancel a job")
+def cancel_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.status()
+
+def _job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
@@ -0,0 +1,44 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services import metrics
+from services.audit_cache import audit_cache
+from services.event_stream import event_broker
+from services.serving import pinned_graph_service
+
+router = APIRouter(tags=["metrics"])
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+AUDIT_CACHE_ENTRIES = metrics.registry.register(metrics.Gauge("gst_audit_cache_entries", "Analyze-invoice results cached"))
+AUDIT_CACHE_LOOKUPS = metrics.registry.register(metrics.Counter("gst_audit_cache_lookups_total", "Analyze-invoice cache lookups", ("result",)))
+AUDIT_CACHE_DROPS = metrics.registry.register(metrics.Counter("gst_audit_cache_dropped_total", "Analyze-invoice cache entries dropped", ("reason",)))
+EVENT_SUBSCRIBERS = metrics.registry.register(metrics.Gauge("gst_event_subscribers", "Clients connected to /events"))
+EVENTS_SENT = metrics.registry.register(metrics.Counter("gst_events_total", "Change stream activity", ("type",)))
+
+def collect_graph():
+    # Counts are cached per graph version, so a scrape between writes is a dict lookup
+    with pinned_graph_service() as gs:
+        nodes, edges = gs.graph_counts()
+        metrics.GRAPH_VERSION.set(value=gs.version)
+    metrics.GRAPH_NODES.replace({(node_type,): n for node_type, n in nodes.items()})
+    metrics.GRAPH_EDGES.replace({(relation,): n for relation, n in edges.items()})
+
+def collect_audit_cache():
+    stats = audit_cache.stats()
+    AUDIT_CACHE_ENTRIES.set(value=stats["entries"])
+    AUDIT_CACHE_LOOKUPS.replace({("hit",): stats["hits"], ("miss",): stats["misses"]})
+    AUDIT_CACHE_DROPS.replace({("invalidated",): stats["invalidations"], ("evicted",): stats["evictions"]})
+
+def collect_events():
+    stats = event_broker.stats()
+    EVENT_SUBSCRIBERS.set(value=stats["subscribers"])
+    # batches heard, deltas computed, events delivered to clients, client queues overflowed
+    EVENTS_SENT.replace({(kind,): stats[kind] for kind in ("batches", "deltas", "delivered", "overflows")})
+
+metrics.registry.collectors += [collect_graph, collect_audit_cache, collect_events]
+
+@router.get("/metrics", response_class=PlainTextResponse,
+            description="Prometheus metrics: stage and request latency, ingest throughput, graph size, cache stats")
+def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,38 @@
+import json
+import time
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from models.schemas import LedgerSummary
+from services.graph_service import GraphService
+from services.ledger import LedgerReconciliation
+from services.serving import get_period_graph_service
+from services.reconciliation import ReconciliationEngine
+
+router = APIRouter(prefix="/reconcile", tags=["reconciliation"])
+
+@router.get("/period/{period}", description="Batch-reconcile every invoice in a period, streamed as NDJSON")
+def reconcile_period(period: str, gstin: Optional[str] = None, gs: GraphService = Depends(get_period_graph_service)):
+    engine = ReconciliationEngine(gs)
+
+    def stream():
+        # One line per mismatch, followed by a final summary line with throughput
+        for invoice_id, mismatch in engine.reconcile_period(period, gstin=gstin):
+            yield json.dumps({"invoice_id": invoice_id, "mismatch": mismatch.model_dump()}) + "\n"
+        yield json.dumps({"summary": engine.last_summary.model_dump()}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/summary", response_model=LedgerSummary,
+            description="Ledger reconciliation for a period: invoice vs GSTR-1 vs GSTR-2B vs Purchase Register vs e-invoice tax, "
+                        "with exposure and ITC at risk, grouped by supplier, buyer or supplier-buyer pair (riskiest first)")
+def reconcile_summary(
+    period: str,
+    group_by: Literal["supplier", "buyer", "pair"] = "supplier",
+    gstin: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    gs: GraphService = Depends(get_period_graph_service),
+):
+    started = time.perf_counter()
+    summary = LedgerReconciliation(gs).summary(period, group_by=group_by, gstin=gstin, limit=limit)
+    return LedgerSummary(period=period, group_by=group_by, gstin=gstin, elapsed_seconds=time.perf_counter() - started, **summary)
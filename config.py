@@ -0,0 +1,88 @@
+import os
+
+# Runtime settings, overridable through environment variables.
+
+# Number of trade-projection changes (invoices ingested, taxpayer risk scores updated)
+# tolerated before cached risk propagation scores are recomputed. 0 = always fresh.
+PROPAGATION_STALENESS_THRESHOLD = int(os.getenv("GST_PROPAGATION_STALENESS_THRESHOLD", "0"))
+
+# Risk propagation backend: "networkx" (nx.pagerank on dict-of-dicts) or
+# "sparse" (CSR power iteration with NumPy/SciPy, for very large networks)
+RISK_PROPAGATION_BACKEND = os.getenv("GST_RISK_PROPAGATION_BACKEND", "networkx")
+
+# Rows validated and applied per chunk by the streaming ingest routes
+INGEST_CHUNK_SIZE = int(os.getenv("GST_INGEST_CHUNK_SIZE", "5000"))
+
+# Directory for durable state: graph snapshots and the ingest write-ahead log.
+# Empty = in-memory only (state is lost on restart).
+DATA_DIR = os.getenv("GST_DATA_DIR", "")
+# Seconds between background snapshots (only taken when the graph changed)
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("GST_SNAPSHOT_INTERVAL_SECONDS", "300"))
+# Number of snapshots kept on disk (at least 1)
+SNAPSHOT_RETAIN = int(os.getenv("GST_SNAPSHOT_RETAIN", "2"))
+# fsync the WAL after every batch (disable only for throwaway environments)
+WAL_FSYNC = os.getenv("GST_WAL_FSYNC", "1") not in ("0", "false", "False")
+
+# Seconds a writer may keep batches in a forked copy of the graph before publishing them, while
+# readers have the current version pinned (longer if the copy took longer). Batches written in that
+# window share one fork (a full graph copy) instead of forking each; they become visible when the
+# window ends or the last reader unpins, whichever is first. 0 = fork and publish every batch.
+WRITE_FORK_INTERVAL_SECONDS = float(os.getenv("GST_WRITE_FORK_INTERVAL_SECONDS", "0.25"))
+
+# Period retention: keep only the N most recent tax periods' invoices and filings in memory;
+# older periods are evicted to cold storage under GST_DATA_DIR/cold and loaded back on demand.
+# 0 = keep every period resident. Requires GST_DATA_DIR.
+RETAIN_PERIODS = int(os.getenv("GST_RETAIN_PERIODS", "0"))
+# A period outside the retention window that was loaded back on demand is evicted again
+# once it has not been used for this many seconds
+COLD_IDLE_SECONDS = float(os.getenv("GST_COLD_IDLE_SECONDS", "600"))
+
+# Process role. "standalone" (default): one process ingests and serves everything.
+# "writer": owns ingestion and the data directory, and republishes the graph as a snapshot
+# every GST_PUBLISH_INTERVAL_SECONDS. "reader": serves the analysis endpoints from the
+# writer's latest snapshot, memory-mapped read-only; run any number of them. See services/serving.py.
+ROLE = os.getenv("GST_ROLE", "standalone")
+PUBLISH_INTERVAL_SECONDS = float(os.getenv("GST_PUBLISH_INTERVAL_SECONDS", "30"))
+# How often readers check for a newly published snapshot
+READER_POLL_SECONDS = float(os.getenv("GST_READER_POLL_SECONDS", "2"))
+
+# Background jobs (/jobs): worker processes for heavy analytics, how many jobs may wait for
+# a worker before submissions are refused, and how many finished jobs are kept for lookup
+JOB_WORKERS = int(os.getenv("GST_JOB_WORKERS", str(os.cpu_count() or 1)))
+JOB_QUEUE_SIZE = int(os.getenv("GST_JOB_QUEUE_SIZE", "100"))
+JOB_RETAIN = int(os.getenv("GST_JOB_RETAIN", "1000"))
+# Jobs run on the latest snapshot rather than taking one each: a job may run on a snapshot taken
+# up to this many seconds before it was submitted. Older than that, it waits for the next snapshot,
+# which is then taken early (see services/jobs.py)
+JOB_MAX_LAG_SECONDS = float(os.getenv("GST_JOB_MAX_LAG_SECONDS", "30"))
+
+# Directory holding trained vendor-risk model artifacts (see services/risk_model.py); the
+# newest version is loaded at startup. Without one, vendors are scored with the heuristic.
+MODEL_DIR = os.getenv("GST_MODEL_DIR", "artifacts")
+
+# Fuzzy invoice matching (services/invoice_matching.py): filings whose invoice number has no
+# exact match are linked to the invoice they match with at least this confidence; amounts
+# within this relative tolerance (or one rupee) count as equal
+MATCH_THRESHOLD = float(os.getenv("GST_MATCH_THRESHOLD", "0.75"))
+MATCH_AMOUNT_TOLERANCE = float(os.getenv("GST_MATCH_AMOUNT_TOLERANCE", "0.01"))
+
+# Analyze-invoice result cache (services/audit_cache.py): number of audits kept (0 disables),
+# and how many published writes (ingest batches) an entry may outlive before it is recomputed anyway
+AUDIT_CACHE_SIZE = int(os.getenv("GST_AUDIT_CACHE_SIZE", "10000"))
+AUDIT_CACHE_MAX_LAG = int(os.getenv("GST_AUDIT_CACHE_MAX_LAG", "100"))
+# Most invoices one /analyze-invoices request may list (each may load a cold period back)
+ANALYZE_BATCH_MAX_INVOICES = int(os.getenv("GST_ANALYZE_BATCH_MAX_INVOICES", "10000"))
+
+# Graph explorer (services/graph_explorer.py): most nodes one neighbourhood expansion walks
+# (pages are cut from that walk), and the share of taxpayers that may be new since the cached
+# layout before it is recomputed instead of new taxpayers being placed next to their partners
+EXPLORER_MAX_NODES = int(os.getenv("GST_EXPLORER_MAX_NODES", "200000"))
+EXPLORER_LAYOUT_REFRESH = float(os.getenv("GST_EXPLORER_LAYOUT_REFRESH", "0.1"))
+
+# Change stream (GET /events, services/event_stream.py): how far a vendor's propagated risk
+# (0-100) must move from the last value pushed before it is pushed again, how many undelivered
+# batches a slow client may have queued before they are replaced by a single "resync" event,
+# and seconds between keep-alive comments on an idle stream
+EVENTS_RISK_DELTA = float(os.getenv("GST_EVENTS_RISK_DELTA", "5.0"))
+EVENTS_QUEUE_SIZE = int(os.getenv("GST_EVENTS_QUEUE_SIZE", "100"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("GST_EVENTS_HEARTBEAT_SECONDS", "15"))
@@ -1,20 +1,99 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-import networkx as nx
-from api import ingest
+import asyncio
+import time
+from fastapi.concurrency import run_in_threadpool
+import config
+from api import events, explorer, ingest, jobs, metrics, reconcile
 from agent import orchestrator
-
-# Global Graph instance
-gst_graph = nx.DiGraph()
+from services.graph_store import GraphStore, graph_store
+from services.persistence import graph_persistence
+from services.period_shards import PeriodShards
+from agent.jobs import job_manager
+from services.metrics import MetricsMiddleware
+from services.ml_service import load_vendor_risk_model
+from services.serving import published_graph
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Setup - initialize graph, models, etc.
     print("Initializing GST Intelligence Engine...")
+    snapshot_task = None
+    follow_task = None
+    if config.ROLE not in ("standalone", "writer", "reader"):
+        raise RuntimeError(f"Unknown GST_ROLE '{config.ROLE}'")
+    if config.ROLE != "standalone" and not config.DATA_DIR:
+        raise RuntimeError("GST_ROLE=writer/reader needs GST_DATA_DIR (the directory snapshots are published through)")
+    model = load_vendor_risk_model(config.MODEL_DIR)
+    if model is not None:
+        print(f"Loaded vendor-risk model v{model.version} from {config.MODEL_DIR} (ROC AUC {model.meta['metrics']['roc_auc']:.3f})")
+    else:
+        print(f"No vendor-risk model in {config.MODEL_DIR}; scoring vendors with the heuristic "
+              "(train one with python -m services.risk_model)")
+    if config.ROLE == "reader":
+        # Serve the writer's published snapshot; never touch the WAL
+        await run_in_threadpool(published_graph.refresh, config.DATA_DIR)
+        print(f"Reader serving snapshot {published_graph.snapshot} from {config.DATA_DIR}")
+        follow_task = asyncio.create_task(follow_published(config.DATA_DIR))
+    elif config.DATA_DIR:
+        # Restore the last snapshot plus WAL before accepting traffic
+        graph_persistence.open(config.DATA_DIR)
+        recovered = await run_in_threadpool(graph_persistence.recover, graph_store)
+        g = graph_store.service().g
+        print(f"Recovered graph from {config.DATA_DIR}: snapshot={recovered['snapshot']}, "
+              f"replayed {recovered['wal_batches']} WAL batches ({recovered['wal_rows']} rows), "
+              f"{g.number_of_nodes()} nodes, {g.number_of_edges()} edges")
+        snapshot_task = asyncio.create_task(periodic_snapshots(graph_store))
     yield
     # Cleanup
     print("Shutting down engine...")
+    job_manager.shutdown()
+    if follow_task is not None:
+        follow_task.cancel()
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+        if graph_store.version != graph_persistence.last_snapshot_version:
+            await run_in_threadpool(graph_persistence.snapshot, graph_store)
+        graph_persistence.close()
+
+async def periodic_snapshots(store: GraphStore):
+    # A writer's snapshots are what the readers serve, so it takes them at the publish interval
+    interval = config.PUBLISH_INTERVAL_SECONDS if config.ROLE == "writer" else config.SNAPSHOT_INTERVAL_SECONDS
+    while True:
+        await wait_for_snapshot_due(interval)
+        # Evict periods that fell out of the retention window before snapshotting, so the
+        # snapshot only carries resident periods
+        evicted = await run_in_threadpool(enforce_retention, store)
+        if evicted:
+            print(f"Evicted periods to cold storage: {', '.join(evicted)}")
+        if store.version != graph_persistence.last_snapshot_version:
+            await run_in_threadpool(graph_persistence.snapshot, store)
+        job_manager.snapshot_taken()
+
+async def wait_for_snapshot_due(interval: float):
+    # Sleeps for the interval, or less if a queued job needs a newer snapshot (services/jobs.py)
+    deadline = time.monotonic() + interval
+    while not job_manager.snapshot_requested.is_set() and time.monotonic() < deadline:
+        await asyncio.sleep(min(1.0, deadline - time.monotonic()))
+    job_manager.snapshot_requested.clear()
+
+def enforce_retention(store: GraphStore):
+    # Checked on a pinned view first so an idle tick doesn't take the write lock (or fork)
+    with store.read() as gs:
+        if not PeriodShards(gs).retention_candidates():
+            return []
+    with graph_persistence.lock, store.write() as gs:
+        return PeriodShards(gs).enforce_retention()
+
+async def follow_published(data_dir: str):
+    while True:
+        await asyncio.sleep(config.READER_POLL_SECONDS)
+        try:
+            await run_in_threadpool(published_graph.refresh, data_dir)
+        except (OSError, ValueError) as e:
+            # The writer may prune a snapshot while it is being opened; retry on the next tick
+            print(f"Could not load published snapshot: {e}")
 
 app = FastAPI(
     title="GST Intelligence Engine",
@@ -29,10 +108,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser clients read the opt-in stage breakdown (X-GST-Timing)
+    expose_headers=["Server-Timing"],
 )
+# Request counts and latency per route, and the Server-Timing breakdown
+app.add_middleware(MetricsMiddleware)
 
-app.include_router(ingest.router)
+# Readers only serve analysis; ingestion goes to the writer
+if config.ROLE != "reader":
+    app.include_router(ingest.router)
+    # Change events come from this process's ingest batches
+    app.include_router(events.router)
 app.include_router(orchestrator.router)
+app.include_router(reconcile.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
+app.include_router(explorer.router)
 
 @app.get("/")
 def read_root():
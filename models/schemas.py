@@ -1,6 +1,7 @@
 from typing import Literal, Optional, List, Dict, Any
 from pydantic import BaseModel, Field
 from datetime import date
+import config
 
 # Base Models representing Graph Nodes
 
@@ -69,3 +70,67 @@ class AuditTrailResponse(BaseModel):
     mismatches: List[MismatchOutput]
     total_exposure: float
     overall_risk: str
+
+class BatchAnalyzeRequest(BaseModel):
+    invoice_ids: List[str] = Field(..., max_length=config.ANALYZE_BATCH_MAX_INVOICES)
+    period: Optional[str] = None
+
+class VendorScoreRequest(BaseModel):
+    gstins: Optional[List[str]] = None  # None = every taxpayer in the network
+    limit: Optional[int] = None
+
+class VendorScore(BaseModel):
+    gstin: str
+    compliance_risk_score: float
+    risk_bucket: str
+
+class PeriodReconciliationSummary(BaseModel):
+    period: str
+    gstin: Optional[str] = None
+    invoices_processed: int
+    mismatch_count: int
+    elapsed_seconds: float
+    invoices_per_second: float
+
+class LedgerSummaryRow(BaseModel):
+    supplier_gstin: Optional[str] = None
+    buyer_gstin: Optional[str] = None
+    invoices: int
+    invoice_tax: float
+    gstr1_tax: float
+    gstr2b_itc: float
+    pr_tax_paid: float
+    einvoice_tax: float
+    exposure: float
+    itc_at_risk: float
+    not_in_gstr1: int
+    not_in_gstr2b: int
+    not_in_pr: int
+    missing_irn: int
+    mismatched: int
+
+class LedgerSummary(BaseModel):
+    period: str
+    group_by: Literal["supplier", "buyer", "pair"]
+    gstin: Optional[str] = None
+    totals: LedgerSummaryRow
+    rows: List[LedgerSummaryRow]
+    elapsed_seconds: float
+
+class JobRequest(BaseModel):
+    kind: str
+    params: Dict[str, Any] = Field(default_factory=dict)
+    priority: int = 0
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    params: Dict[str, Any]
+    priority: int
+    status: Literal["pending", "running", "done", "failed", "cancelled"]
+    graph_version: int
+    reused: bool = False
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
@@ -0,0 +1,156 @@
+"""
+LRU cache of analyze-invoice results (AuditTrailResponse), keyed by invoice id.
+
+Each entry records the graph version it was computed at and the nodes it depended on: the
+invoice, its filings, its supplier and every taxpayer on the supplier's trading loops. The
+cache listens to GraphStore publishes (GraphStore.on_publish) and drops only the entries a
+write touched:
+- entries depending on a node the write touched;
+- entries depending on a taxpayer whose features changed (its invoices or their filings);
+- entries whose supplier could now sit on a new trading loop: a new trade edge u -> v closes
+  a loop through supplier s only if u and v share a strongly connected component and
+  d(s, u) + 1 + d(v, s) <= MAX_CYCLE_LENGTH, found with two bounded BFS walks from the edge.
+  A removed edge breaks only loops whose taxpayers were already dependencies.
+Writes that replace the graph wholesale, or add more than MAX_LOOP_CHECKS in-loop trade
+edges, clear the cache. So does any version change the cache didn't hear about (snapshot
+refreshes in a reader, unpinned offline writes).
+
+The supplier's propagated risk score depends on the whole trade network and is not tracked
+per entry. Like GST_PROPAGATION_STALENESS_THRESHOLD for propagation itself, entries that have
+outlived GST_AUDIT_CACHE_MAX_LAG published writes are recomputed instead.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+import networkx as nx
+import config
+from models.schemas import AuditTrailResponse
+from services.graph_service import GraphService
+from services.graph_store import graph_store
+from services.risk_service import MAX_CYCLE_LENGTH
+
+# New in-loop trade edges a publish may bring before the cache is cleared instead of each
+# edge's loops being walked
+MAX_LOOP_CHECKS = 64
+
+class AuditCache:
+    def __init__(self, max_entries: int = None, max_lag: int = None):
+        self.max_entries = config.AUDIT_CACHE_SIZE if max_entries is None else max_entries
+        self.max_lag = config.AUDIT_CACHE_MAX_LAG if max_lag is None else max_lag
+        # invoice id -> (response, graph version, publish count, dependencies), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # node -> invoice ids whose entries depend on it
+        self._dependents: Dict[str, Set[str]] = {}
+        # Graph version the entries are valid for, and writes published since the cache started
+        self.version = -1
+        self.publishes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, gs: GraphService, invoice_id: str) -> Optional[AuditTrailResponse]:
+        with self._lock:
+            entry = self._entries.get(invoice_id) if self._sync(gs) else None
+            if entry is not None and self.publishes - entry[2] > self.max_lag:
+                self._drop(invoice_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(invoice_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, gs: GraphService, invoice_id: str, response: AuditTrailResponse, dependencies: Iterable[str]):
+        """Stores a result computed on `gs`; ignored if the graph has moved on since."""
+        if self.max_entries <= 0:
+            return
+        dependencies = frozenset(dependencies)
+        with self._lock:
+            if not self._sync(gs):
+                return
+            self._drop(invoice_id)
+            self._entries[invoice_id] = (response, gs.version, self.publishes, dependencies)
+            for node in dependencies:
+                self._dependents.setdefault(node, set()).add(invoice_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def on_publish(self, gs: GraphService, previous: int, changes: dict):
+        """GraphStore publish listener: invalidates the entries the write touched."""
+        with self._lock:
+            # Only edges inside a strongly connected component close any loop at all
+            looping = [(u, v) for u, v in changes["trade_edges"] if self._entries and gs.cycle_index.same_component(u, v)]
+            if changes["all"] or self.version != previous or len(looping) > MAX_LOOP_CHECKS:
+                self._clear()
+            elif self._entries:
+                stale: Set[str] = set()
+                for node in changes["nodes"] | changes["taxpayers"]:
+                    stale |= self._dependents.get(node, set())
+                for supplier, buyer in looping:
+                    for taxpayer in _loop_members(gs.trade_graph, supplier, buyer):
+                        stale |= self._dependents.get(taxpayer, set())
+                for invoice_id in stale:
+                    self._drop(invoice_id)
+                self.invalidations += len(stale)
+            self.version = gs.version
+            self.publishes += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "graph_version": self.version,
+                "publishes": self.publishes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
+
+    def _sync(self, gs: GraphService) -> bool:
+        # A newer version than the last publish heard about means writes we can't account for
+        if gs.version > self.version:
+            self._clear()
+            self.version = gs.version
+        return gs.version == self.version
+
+    def _clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._dependents.clear()
+
+    def _drop(self, invoice_id: str):
+        entry = self._entries.pop(invoice_id, None)
+        if entry is None:
+            return
+        for node in entry[3]:
+            dependents = self._dependents.get(node)
+            if dependents is not None:
+                dependents.discard(invoice_id)
+                if not dependents:
+                    del self._dependents[node]
+
+def _loop_members(trade_graph: nx.DiGraph, supplier: str, buyer: str) -> Set[str]:
+    """Taxpayers on some loop of at most MAX_CYCLE_LENGTH taxpayers through supplier -> buyer."""
+    if not trade_graph.has_edge(supplier, buyer):
+        return set()
+    reach = MAX_CYCLE_LENGTH - 1
+    to_supplier = nx.single_source_shortest_path_length(trade_graph.reverse(copy=False), supplier, cutoff=reach)
+    from_buyer = nx.single_source_shortest_path_length(trade_graph, buyer, cutoff=reach)
+    return {node for node, d in to_supplier.items()
+            if node in from_buyer and d + 1 + from_buyer[node] <= MAX_CYCLE_LENGTH}
+
+# Process-wide cache used by the analyze-invoice routes, kept in step with the live graph
+audit_cache = AuditCache()
+graph_store.on_publish(audit_cache.on_publish)
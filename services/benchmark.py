@@ -0,0 +1,226 @@
+"""
+Benchmark suite: streams a seeded synthetic network (services/synthetic_data.py) through the
+ingest path in-process, then times the analysis the API serves on top of it:
+
+  ingest        records/s through IngestService, overall and per record kind
+  propagation   one cold risk propagation over the trade projection
+  cycles        cycle index build, detect_circular_trading for sampled suppliers, and
+                find_period_cycles for every period
+  analyze       /analyze-invoice latency (p50/p95/p99) for sampled invoices, with the result
+                cache off and then warm
+  memory        peak RSS after each stage
+
+The route handler is called directly, so HTTP parsing and serialisation are not included.
+Results are written as JSON with flat metric names. Metrics ending in _per_s are better
+higher; every other metric is better lower. Comparing two runs flags regressions beyond a
+tolerance:
+
+    python -m services.benchmark --taxpayers 2000 --invoices-per-period 2000 --periods 6 --out bench.json
+    python -m services.benchmark ... --out new.json --compare bench.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+import numpy as np
+import config
+from services.synthetic_data import KINDS, SyntheticNetwork
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def _latencies(prefix: str, seconds: List[float]) -> Dict[str, float]:
+    ms = np.array(seconds) * 1e3
+    if not len(ms):
+        return {}
+    return {
+        f"{prefix}_p50_ms": float(np.percentile(ms, 50)),
+        f"{prefix}_p95_ms": float(np.percentile(ms, 95)),
+        f"{prefix}_p99_ms": float(np.percentile(ms, 99)),
+        f"{prefix}_mean_ms": float(ms.mean()),
+    }
+
+def run(network: SyntheticNetwork, batch_size: int = 5000, audit_samples: int = 1000,
+        cycle_samples: int = 200, seed: int = 0) -> Dict:
+    """Runs every stage against the process-wide graph store, which must be empty."""
+    from agent.orchestrator import analyze_invoice
+    from services.audit_cache import audit_cache
+    from services.cycle_index import CycleIndex
+    from services.graph_store import graph_store
+    from services.ingest_service import IngestService
+    from services.persistence import graph_persistence
+    from services.risk_service import RiskService
+
+    metrics: Dict[str, float] = {}
+    rng = random.Random(seed)
+
+    # Ingest, timed per apply() so record generation doesn't count
+    ingest = IngestService(graph_store, graph_persistence)
+    elapsed = {kind: 0.0 for kind in KINDS}
+    counts = {kind: 0 for kind in KINDS}
+    invoice_ids: List[str] = []
+    for batch in network.batches(batch_size):
+        for kind in KINDS:
+            if not batch[kind]:
+                continue
+            started = time.perf_counter()
+            counts[kind] += ingest.apply(kind, batch[kind], log=False)
+            elapsed[kind] += time.perf_counter() - started
+        invoice_ids.extend(rec.invoice_id for rec in batch["invoice"])
+    total = sum(elapsed.values())
+    metrics["ingest_seconds"] = total
+    metrics["ingest_records_per_s"] = sum(counts.values()) / total if total else 0.0
+    for kind in KINDS:
+        if elapsed[kind]:
+            metrics[f"ingest_{kind}_records_per_s"] = counts[kind] / elapsed[kind]
+    metrics["peak_rss_after_ingest_mb"] = peak_rss_mb()
+
+    with graph_store.read() as gs:
+        graph = {
+            "nodes": gs.g.number_of_nodes(),
+            "edges": gs.g.number_of_edges(),
+            "taxpayers": gs.trade_graph.number_of_nodes(),
+            "trade_edges": gs.trade_graph.number_of_edges(),
+            **counts,
+        }
+        risk = RiskService(gs)
+
+        # Cold propagation: drop whatever ingest left cached
+        gs.g.graph.pop("propagation_cache", None)
+        started = time.perf_counter()
+        risk.calculate_risk_propagation()
+        metrics["propagation_seconds"] = time.perf_counter() - started
+        metrics["peak_rss_after_propagation_mb"] = peak_rss_mb()
+
+        started = time.perf_counter()
+        CycleIndex(gs.trade_graph).rebuild()
+        metrics["cycle_index_build_seconds"] = time.perf_counter() - started
+        suppliers = sorted(gs.trade_graph.nodes)
+        sampled = rng.sample(suppliers, min(cycle_samples, len(suppliers)))
+        seconds = []
+        for node in sampled:
+            started = time.perf_counter()
+            risk.detect_circular_trading(node.split(":", 1)[1])
+            seconds.append(time.perf_counter() - started)
+        metrics.update(_latencies("detect_cycles", seconds))
+        started = time.perf_counter()
+        for period in network.periods:
+            risk.find_period_cycles(period)
+        metrics["period_cycles_seconds"] = time.perf_counter() - started
+        metrics["peak_rss_after_cycles_mb"] = peak_rss_mb()
+
+    # Analyze-invoice, cold (cache off) and warm (second pass over the same invoices)
+    sampled = rng.sample(invoice_ids, min(audit_samples, len(invoice_ids)))
+    max_entries = audit_cache.max_entries
+    try:
+        for label, entries, passes in (("analyze", 0, 1), ("analyze_cached", max(max_entries, len(sampled)), 2)):
+            audit_cache.max_entries = entries
+            audit_cache.clear()
+            for _ in range(passes):
+                seconds = []
+                for invoice_id in sampled:
+                    started = time.perf_counter()
+                    analyze_invoice({"invoice_id": invoice_id})
+                    seconds.append(time.perf_counter() - started)
+            metrics.update(_latencies(label, seconds))
+    finally:
+        audit_cache.max_entries = max_entries
+        audit_cache.clear()
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return {"graph": graph, "metrics": metrics}
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 0.1) -> List[Dict]:
+    """Per metric in both runs: values, relative change and whether it regressed beyond `tolerance`."""
+    rows = []
+    for name, before in baseline["metrics"].items():
+        after = current["metrics"].get(name)
+        if after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        worse = -change if name.endswith("_per_s") else change
+        rows.append({"metric": name, "baseline": before, "current": after, "change": change,
+                     "regressed": worse > tolerance})
+    return rows
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main(argv: Optional[List[str]] = None):
+    from services.ml_service import load_vendor_risk_model
+    parser = argparse.ArgumentParser(description="Benchmark ingest and analysis on a seeded synthetic GST network")
+    parser.add_argument("--taxpayers", type=int, default=2000, help="GSTINs in the network")
+    parser.add_argument("--invoices-per-period", type=int, default=2000)
+    parser.add_argument("--periods", type=int, default=6)
+    parser.add_argument("--fraud-rate", type=float, default=0.08, help="Share of taxpayers trading in fraud rings")
+    parser.add_argument("--missing-filing-rate", type=float, default=0.03)
+    parser.add_argument("--irn-mismatch-rate", type=float, default=0.01)
+    parser.add_argument("--ring-density", type=float, default=0.15, help="Share of invoices traded inside rings")
+    parser.add_argument("--ring-length", type=int, nargs=2, default=(3, 5), metavar=("MIN", "MAX"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=5000, help="Invoices per ingest batch")
+    parser.add_argument("--audit-samples", type=int, default=1000, help="Invoices timed through /analyze-invoice")
+    parser.add_argument("--cycle-samples", type=int, default=200, help="Suppliers timed through cycle detection")
+    parser.add_argument("--out", help="Write results as JSON")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    params = {
+        "n_taxpayers": args.taxpayers,
+        "n_invoices": args.invoices_per_period * args.periods,
+        "n_periods": args.periods,
+        "fraud_rate": args.fraud_rate,
+        "missing_filing_rate": args.missing_filing_rate,
+        "irn_mismatch_rate": args.irn_mismatch_rate,
+        "ring_density": args.ring_density,
+        "ring_length": tuple(args.ring_length),
+        "seed": args.seed,
+    }
+    model = load_vendor_risk_model(config.MODEL_DIR)
+    results = run(SyntheticNetwork(**params), batch_size=args.batch_size, audit_samples=args.audit_samples,
+                  cycle_samples=args.cycle_samples, seed=args.seed)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {"risk_propagation_backend": config.RISK_PROPAGATION_BACKEND,
+                   "vendor_risk_model": model.version if model is not None else None},
+        "params": {**params, "batch_size": args.batch_size, "audit_samples": args.audit_samples,
+                   "cycle_samples": args.cycle_samples},
+        **results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"Graph: {report['graph']['nodes']} nodes, {report['graph']['edges']} edges, "
+          f"{report['graph']['invoice']} invoices, {report['graph']['trade_edges']} trade edges")
+    for name, value in report["metrics"].items():
+        print(f"  {name:40s} {value:14.3f}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, report, args.tolerance)
+        print(f"Compared with {args.compare} (tolerance {args.tolerance:.0%}):")
+        for row in rows:
+            flag = "  REGRESSED" if row["regressed"] else ""
+            print(f"  {row['metric']:40s} {row['baseline']:14.3f} -> {row['current']:14.3f} ({row['change']:+.1%}){flag}")
+        if any(row["regressed"] for row in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
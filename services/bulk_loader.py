@@ -0,0 +1,273 @@
+"""
+Offline bulk loader for portal dumps.
+
+Reads CSV, Parquet or GST portal JSON files with pandas, builds node and edge lists with
+vectorised column operations and inserts them through GraphService.add_bulk, then writes a
+snapshot into the data directory the server recovers from at startup (GST_DATA_DIR).
+
+    python -m services.bulk_loader --invoices inv.parquet --gstr1 gstr1_*.json \\
+        --gstr2b gstr2b.csv --einvoice irn.json --data-dir data/
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+import networkx as nx
+import pandas as pd
+import config
+from services.graph_store import GraphStore
+from services.persistence import GraphPersistence
+from services.ingest_service import IngestService, RECORD_MODELS
+from services.invoice_matching import AMOUNT_FIELDS, resolve_filings
+from services.period_shards import PeriodShards
+
+logger = logging.getLogger(__name__)
+
+# Columns every flat (CSV/Parquet/record JSON) file must provide, per record type
+REQUIRED_COLUMNS = {kind: [name for name, field in model.model_fields.items() if field.is_required()] for kind, model in RECORD_MODELS.items()}
+
+NUMERIC_COLUMNS = {
+    "invoice": ["tax_value", "total_value"],
+    "gstr1": ["tax_value"],
+    "gstr2b": ["itc_available"],
+    "purchase_register": ["tax_paid"],
+    "einvoice": ["tax_value"],
+}
+
+# Invoices first so the filings below can attach to them
+LOAD_ORDER = ["invoice", "gstr1", "gstr2b", "purchase_register", "einvoice"]
+
+def read_table(path: str, kind: str) -> pd.DataFrame:
+    """Reads one input file into the flat column layout of the record type's schema."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".csv", ".txt"):
+        df = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[""])
+    elif ext in (".parquet", ".pq"):
+        df = pd.read_parquet(path)
+    elif ext in (".json", ".ndjson", ".jsonl"):
+        df = _read_json(path, kind)
+    else:
+        raise ValueError(f"Unsupported file type: {path}")
+
+    missing = [c for c in REQUIRED_COLUMNS[kind] if c not in df.columns]
+    if missing:
+        raise ValueError(f"{path}: missing columns for {kind}: {', '.join(missing)}")
+
+    for col in NUMERIC_COLUMNS[kind]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    before = len(df)
+    df = df.dropna(subset=REQUIRED_COLUMNS[kind])
+    if len(df) < before:
+        logger.warning("%s: dropped %d rows with missing or non-numeric required values", path, before - len(df))
+    for col in REQUIRED_COLUMNS[kind]:
+        if col not in NUMERIC_COLUMNS[kind]:
+            df[col] = df[col].astype(str)
+    return df
+
+def _read_json(path: str, kind: str) -> pd.DataFrame:
+    if path.endswith((".ndjson", ".jsonl")):
+        return pd.read_json(path, lines=True, dtype=False)
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    if isinstance(data, list) and kind == "einvoice" and data and "Irn" in data[0]:
+        return _portal_einvoice(data)
+    if isinstance(data, list):
+        return pd.DataFrame.from_records(data)
+    if kind == "gstr1" and "b2b" in data:
+        return _portal_gstr1(data)
+    if kind == "gstr2b" and "docdata" in data.get("data", data):
+        return _portal_gstr2b(data.get("data", data))
+    raise ValueError(f"{path}: unrecognised JSON layout for {kind}")
+
+def _portal_period(fp: str) -> str:
+    """Portal return periods are MMYYYY; the graph uses YYYY-MM."""
+    return f"{fp[2:]}-{fp[:2]}"
+
+def _portal_gstr1(data: dict) -> pd.DataFrame:
+    """GSTR-1 portal JSON: b2b[] -> inv[] -> itms[] -> itm_det with per-rate tax amounts."""
+    items = pd.json_normalize(data["b2b"], record_path=["inv", "itms"], meta=["ctin", ["inv", "inum"]])
+    tax_cols = [c for c in ("itm_det.iamt", "itm_det.camt", "itm_det.samt", "itm_det.csamt") if c in items.columns]
+    items["tax_value"] = items[tax_cols].apply(pd.to_numeric, errors="coerce").fillna(0.0).sum(axis=1)
+    df = items.groupby(["ctin", "inv.inum"], as_index=False)["tax_value"].sum()
+    return pd.DataFrame({
+        "invoice_id": df["inv.inum"].astype(str),
+        "supplier_gstin": data["gstin"],
+        "buyer_gstin": df["ctin"],
+        "period": _portal_period(data["fp"]),
+        "tax_value": df["tax_value"],
+    })
+
+def _portal_gstr2b(data: dict) -> pd.DataFrame:
+    """GSTR-2B portal JSON: docdata.b2b[] (one entry per supplier) -> inv[] with tax heads and itcavl."""
+    inv = pd.json_normalize(data["docdata"]["b2b"], record_path=["inv"], meta=["ctin"])
+    tax_cols = [c for c in ("igst", "cgst", "sgst", "cess") if c in inv.columns]
+    tax = inv[tax_cols].apply(pd.to_numeric, errors="coerce").fillna(0.0).sum(axis=1)
+    eligible = inv["itcavl"].ne("N") if "itcavl" in inv.columns else True
+    return pd.DataFrame({
+        "invoice_id": inv["inum"].astype(str),
+        "supplier_gstin": inv["ctin"],
+        "buyer_gstin": data["gstin"],
+        "period": _portal_period(data["rtnprd"]),
+        "itc_available": tax.where(eligible, 0.0),
+    })
+
+def _portal_einvoice(data: List[dict]) -> pd.DataFrame:
+    """E-invoice JSON as returned by the IRP: Irn, DocDtls, SellerDtls, BuyerDtls, ValDtls."""
+    df = pd.json_normalize(data)
+    tax_cols = [c for c in ("ValDtls.IgstVal", "ValDtls.CgstVal", "ValDtls.SgstVal", "ValDtls.CesVal") if c in df.columns]
+    return pd.DataFrame({
+        "irn": df["Irn"],
+        "invoice_id": df["DocDtls.No"].astype(str),
+        "supplier_gstin": df["SellerDtls.Gstin"],
+        "buyer_gstin": df["BuyerDtls.Gstin"],
+        "tax_value": df[tax_cols].apply(pd.to_numeric, errors="coerce").fillna(0.0).sum(axis=1),
+        "date": df.get("DocDtls.Dt", pd.Series("", index=df.index)).astype(str),
+    })
+
+def load_frame(store: GraphStore, kind: str, df: pd.DataFrame, persistence: Optional[GraphPersistence] = None) -> int:
+    """
+    Inserts one record type's rows into the graph; returns the number of rows loaded.
+    With `persistence`, evicted periods the rows belong to are loaded back first.
+    The loader is offline (nothing else reads the store), so it writes to the graph directly.
+    """
+    if df.empty:
+        return 0
+    gs = store.service()
+    if persistence is not None and "period" in df.columns:
+        shards = PeriodShards(gs, persistence)
+        shards.ensure_resident(df["period"].unique().tolist())
+        shards.ensure_invoices(df["invoice_id"].astype(str))
+    if kind == "invoice":
+        # Re-ingested invoices need add_invoice's link replacement; new ones go in bulk
+        df = df.drop_duplicates("invoice_id", keep="last")
+        existing = df["invoice_id"].map(lambda i: (gs.get_node(f"Invoice:{i}") or {}).get("type") == "Invoice")
+        if existing.any():
+            records = [RECORD_MODELS["invoice"].model_validate(r) for r in df[existing].to_dict("records")]
+            ingest = IngestService(store, persistence) if persistence is not None else IngestService(store)
+            ingest.apply("invoice", records)
+            df = df[~existing]
+            if df.empty:
+                return int(existing.sum())
+        nodes, edges = _invoice_graph(df)
+        gs.add_bulk(nodes, edges)
+        return len(df) + int(existing.sum())
+
+    if kind in AMOUNT_FIELDS:
+        # Filings whose invoice number has drifted attach to the invoice they match
+        df = resolve_filings(gs, kind, df)
+    nodes, edges = BUILDERS[kind](df)
+    gs.add_bulk(nodes, edges)
+    return len(df)
+
+def _records(df: pd.DataFrame, columns: List[str]) -> List[dict]:
+    records = df[columns].to_dict("records")
+    if "match_confidence" in df.columns:
+        for rec, filed, confidence in zip(records, df["filed_invoice_id"], df["match_confidence"]):
+            if pd.notna(confidence):
+                rec.update(filed_invoice_id=filed, match_confidence=float(confidence))
+    return records
+
+def _invoice_graph(df: pd.DataFrame):
+    inv = "Invoice:" + df["invoice_id"]
+    sup = "Taxpayer:" + df["supplier_gstin"]
+    buy = "Taxpayer:" + df["buyer_gstin"]
+    if "date" not in df.columns:
+        df = df.assign(date=None)
+    attrs = _records(df.assign(financial_value=df["tax_value"], type="Invoice"),
+                     ["tax_value", "total_value", "date", "type", "invoice_id", "period", "financial_value"])
+    taxpayers = pd.unique(pd.concat([df["supplier_gstin"], df["buyer_gstin"]]))
+    nodes = list(zip(inv, attrs))
+    nodes += [(f"Taxpayer:{g}", {"type": "Taxpayer", "gstin": g}) for g in taxpayers]
+    edges = list(zip(sup, inv, ["SUPPLIED_BY"] * len(df))) + list(zip(inv, buy, ["PURCHASED_BY"] * len(df)))
+    return nodes, edges
+
+def _gstr1_graph(df: pd.DataFrame):
+    node = "GSTR1:" + df["supplier_gstin"] + ":" + df["period"] + ":" + df["invoice_id"]
+    nodes = list(zip(node, _records(df.assign(type="GSTR1"), ["tax_value", "type", "period"])))
+    edges = list(zip("Invoice:" + df["invoice_id"], node, ["REPORTED_IN"] * len(df)))
+    edges += list(zip("Taxpayer:" + df["supplier_gstin"], node, ["FILED_BY"] * len(df)))
+    return nodes, edges
+
+def _gstr2b_graph(df: pd.DataFrame):
+    node = "GSTR2B:" + df["buyer_gstin"] + ":" + df["period"] + ":" + df["invoice_id"]
+    nodes = list(zip(node, _records(df.assign(type="GSTR2B"), ["itc_available", "type", "period"])))
+    edges = list(zip("Invoice:" + df["invoice_id"], node, ["REFLECTED_IN"] * len(df)))
+    edges += list(zip(node, "Taxpayer:" + df["buyer_gstin"], ["CLAIMED_IN"] * len(df)))
+    return nodes, edges
+
+def _purchase_register_graph(df: pd.DataFrame):
+    node = "PR:" + df["buyer_gstin"] + ":" + df["period"] + ":" + df["invoice_id"]
+    nodes = list(zip(node, _records(df.assign(type="PurchaseRegister"), ["tax_paid", "type", "period"])))
+    edges = list(zip("Invoice:" + df["invoice_id"], node, ["RECORDED_IN_PR"] * len(df)))
+    return nodes, edges
+
+def _einvoice_graph(df: pd.DataFrame):
+    node = "EInvoice:" + df["irn"]
+    if "date" not in df.columns:
+        df = df.assign(date=None)
+    nodes = list(zip(node, _records(df.assign(type="EInvoice"), ["tax_value", "date", "supplier_gstin", "buyer_gstin", "type", "irn"])))
+    edges = list(zip("Invoice:" + df["invoice_id"], node, ["GENERATED_IRN"] * len(df)))
+    return nodes, edges
+
+BUILDERS = {
+    "gstr1": _gstr1_graph,
+    "gstr2b": _gstr2b_graph,
+    "purchase_register": _purchase_register_graph,
+    "einvoice": _einvoice_graph,
+}
+
+def load_files(store: GraphStore, inputs: Dict[str, List[str]], persistence: Optional[GraphPersistence] = None) -> Dict[str, int]:
+    """Loads {kind: [paths]} in dependency order; returns rows loaded per kind."""
+    counts = {}
+    for kind in LOAD_ORDER:
+        for path in inputs.get(kind, []):
+            started = time.perf_counter()
+            n = load_frame(store, kind, read_table(path, kind), persistence)
+            counts[kind] = counts.get(kind, 0) + n
+            elapsed = time.perf_counter() - started
+            logger.info("%s: %d %s rows in %.2fs (%.0f rows/s)", path, n, kind, elapsed, n / elapsed if elapsed > 0 else 0.0)
+    return counts
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Bulk-load GST portal dumps into a graph snapshot")
+    parser.add_argument("--invoices", nargs="*", default=[], help="Invoice files")
+    parser.add_argument("--gstr1", nargs="*", default=[], help="GSTR-1 files (CSV/Parquet or portal JSON)")
+    parser.add_argument("--gstr2b", nargs="*", default=[], help="GSTR-2B files (CSV/Parquet or portal JSON)")
+    parser.add_argument("--purchase-register", nargs="*", default=[], help="Purchase Register files")
+    parser.add_argument("--einvoice", nargs="*", default=[], help="E-invoice files (CSV/Parquet or IRP JSON)")
+    parser.add_argument("--data-dir", default=config.DATA_DIR or None, help="Data directory to write the snapshot into (default: GST_DATA_DIR)")
+    parser.add_argument("--append", action="store_true", help="Recover the data directory's current state first and add to it")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not args.data_dir:
+        parser.error("--data-dir or GST_DATA_DIR is required")
+
+    store = GraphStore(nx.DiGraph())
+    persistence = GraphPersistence()
+    persistence.open(args.data_dir)
+    if args.append:
+        persistence.recover(store)
+    elif persistence.current_snapshot() is not None or persistence.has_wal():
+        parser.error(f"{args.data_dir} already holds graph state; pass --append to add to it")
+
+    started = time.perf_counter()
+    counts = load_files(store, {
+        "invoice": args.invoices,
+        "gstr1": args.gstr1,
+        "gstr2b": args.gstr2b,
+        "purchase_register": args.purchase_register,
+        "einvoice": args.einvoice,
+    }, persistence)
+    gs = store.service()
+    evicted = PeriodShards(gs, persistence).enforce_retention()
+    if evicted:
+        logger.info("Evicted periods outside the retention window: %s", ", ".join(evicted))
+    path = persistence.snapshot(store)
+    persistence.close()
+    logger.info("Loaded %s in %.2fs; snapshot with %d nodes, %d edges written to %s",
+                counts, time.perf_counter() - started, gs.g.number_of_nodes(), gs.g.number_of_edges(), path)
+
+if __name__ == "__main__":
+    main()
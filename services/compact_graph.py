@@ -0,0 +1,482 @@
+"""
+Compact, columnar encoding of the GST graph.
+
+Node keys are kept once in a sorted UTF-8 string pool and addressed by integer id, node
+types and edge relations are small integer codes, numeric attributes live in typed
+float64 columns (NaN = absent) and repeated string attributes (period, date, ...) are
+dictionary-encoded. Adjacency is stored as forward and reverse CSR arrays. Every array
+is a plain NumPy array, so a saved graph can be memory-mapped back without parsing.
+
+CompactGraphService exposes the read side of the GraphService API over this encoding.
+The mutable write path stays on the networkx DiGraph; this is the frozen form used for
+snapshots and read replicas.
+
+    python -m services.compact_graph --invoices 50000   # memory per invoice, before/after
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import bisect
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import networkx as nx
+from services.cycle_index import CycleIndex
+from services.feature_store import FeatureStore
+from services.graph_service import GraphService
+
+NODE_TYPES = ("Taxpayer", "Invoice", "GSTR1", "GSTR2B", "PurchaseRegister", "EInvoice")
+RELATIONS = ("SUPPLIED_BY", "PURCHASED_BY", "REPORTED_IN", "FILED_BY", "REFLECTED_IN", "CLAIMED_IN", "RECORDED_IN_PR", "GENERATED_IRN")
+NUMERIC_ATTRS = ("tax_value", "total_value", "financial_value", "itc_available", "tax_paid", "risk_score")
+STRING_ATTRS = ("period", "date", "supplier_gstin", "buyer_gstin", "business_name", "constitution")
+# Attributes that repeat the id embedded in the node key ("Invoice:{invoice_id}" ...)
+DERIVED_ATTRS = {"Taxpayer": "gstin", "Invoice": "invoice_id", "EInvoice": "irn"}
+
+_TYPE_CODE = {t: i for i, t in enumerate(NODE_TYPES)}
+_RELATION_CODE = {r: i for i, r in enumerate(RELATIONS)}
+_INVOICE = _TYPE_CODE["Invoice"]
+
+class StringPool:
+    """Strings packed into one UTF-8 byte blob plus an offsets array."""
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: List[str]) -> "StringPool":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i: int) -> str:
+        return self.raw(i).decode("utf-8")
+
+    def to_list(self) -> List[str]:
+        # Slice one in-memory copy of the blob instead of touching the (possibly mmapped) array per string
+        blob = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+class _SortedPoolKeys:
+    """Sequence view for bisect over a pool whose strings are stored in sorted order."""
+    def __init__(self, pool: StringPool):
+        self.pool = pool
+
+    def __len__(self):
+        return len(self.pool)
+
+    def __getitem__(self, i):
+        return self.pool.raw(i)
+
+class CompactGraph:
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.arrays = arrays
+        self.meta = meta
+        self.keys = StringPool(arrays["key_blob"], arrays["key_offsets"])
+        self._sorted_keys = _SortedPoolKeys(self.keys)
+        self.node_type = arrays["node_type"]
+        self.numeric = {a: arrays[f"num_{a}"] for a in meta["numeric_attrs"]}
+        self.string_codes = {a: arrays[f"str_{a}"] for a in meta["string_attrs"]}
+        self.string_values = {a: StringPool(arrays[f"strpool_{a}_blob"], arrays[f"strpool_{a}_offsets"]).to_list() for a in meta["string_attrs"]}
+        self.extras = {int(k): v for k, v in meta.get("extras", {}).items()}
+        # Per-process mutable state (caches), mirroring nx.DiGraph.graph
+        self.graph: Dict[str, Any] = {"version": meta.get("version", 0)}
+        self.nodes = _NodeView(self)
+
+    # Construction and persistence
+
+    @classmethod
+    def from_graph(cls, g: nx.DiGraph) -> "CompactGraph":
+        keys = sorted(g.nodes)
+        n = len(keys)
+        position = {k: i for i, k in enumerate(keys)}
+        pool = StringPool.from_strings(keys)
+        arrays: Dict[str, np.ndarray] = {"key_blob": pool.blob, "key_offsets": pool.offsets}
+
+        node_type = np.full(n, -1, dtype=np.int8)
+        numeric = {a: np.full(n, np.nan) for a in NUMERIC_ATTRS}
+        string_codes = {a: np.full(n, -1, dtype=np.int32) for a in STRING_ATTRS}
+        string_lookup: Dict[str, Dict[str, int]] = {a: {} for a in STRING_ATTRS}
+        extras: Dict[int, dict] = {}
+
+        for i, key in enumerate(keys):
+            attrs = g.nodes[key]
+            ntype = attrs.get("type")
+            if ntype in _TYPE_CODE:
+                node_type[i] = _TYPE_CODE[ntype]
+            derived = DERIVED_ATTRS.get(ntype)
+            for attr, value in attrs.items():
+                if attr == "type" and ntype in _TYPE_CODE:
+                    continue
+                if attr == derived and value == key.split(":", 1)[1]:
+                    continue
+                if attr in numeric and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    numeric[attr][i] = value
+                elif attr in string_codes and isinstance(value, str):
+                    lookup = string_lookup[attr]
+                    string_codes[attr][i] = lookup.setdefault(value, len(lookup))
+                elif value is not None:
+                    extras.setdefault(i, {})[attr] = value
+
+        arrays["node_type"] = node_type
+        for a in NUMERIC_ATTRS:
+            arrays[f"num_{a}"] = numeric[a]
+        for a in STRING_ATTRS:
+            arrays[f"str_{a}"] = string_codes[a]
+            values_pool = StringPool.from_strings(list(string_lookup[a]))
+            arrays[f"strpool_{a}_blob"] = values_pool.blob
+            arrays[f"strpool_{a}_offsets"] = values_pool.offsets
+
+        m = g.number_of_edges()
+        src = np.empty(m, dtype=np.int32)
+        dst = np.empty(m, dtype=np.int32)
+        rel = np.empty(m, dtype=np.int8)
+        for j, (u, v, relation) in enumerate(g.edges(data="relation")):
+            src[j], dst[j] = position[u], position[v]
+            rel[j] = _RELATION_CODE.get(relation, -1)
+        arrays["out_ptr"], arrays["out_idx"], arrays["out_rel"] = _csr(src, dst, rel, n)
+        arrays["in_ptr"], arrays["in_idx"], arrays["in_rel"] = _csr(dst, src, rel, n)
+
+        trade = g.graph.get("trade_graph", nx.DiGraph())
+        arrays["trade_src"] = np.fromiter((position[u] for u, _ in trade.edges()), dtype=np.int32, count=trade.number_of_edges())
+        arrays["trade_dst"] = np.fromiter((position[v] for _, v in trade.edges()), dtype=np.int32, count=trade.number_of_edges())
+        arrays["trade_count"] = np.fromiter((d["invoice_count"] for _, _, d in trade.edges(data=True)), dtype=np.int64, count=trade.number_of_edges())
+        arrays["trade_taxable"] = np.fromiter((d["taxable_value"] for _, _, d in trade.edges(data=True)), dtype=np.float64, count=trade.number_of_edges())
+        arrays["trade_tax"] = np.fromiter((d["tax_value"] for _, _, d in trade.edges(data=True)), dtype=np.float64, count=trade.number_of_edges())
+
+        meta = {
+            "numeric_attrs": list(NUMERIC_ATTRS),
+            "string_attrs": list(STRING_ATTRS),
+            "extras": {str(i): v for i, v in extras.items()},
+            "version": g.graph.get("version", 0),
+            "trade_version": trade.graph.get("version", 0),
+        }
+        return cls(arrays, meta)
+
+    def save(self, path: str):
+        """Writes one .npy file per array plus meta.json into directory `path`."""
+        os.makedirs(path, exist_ok=True)
+        for name, arr in self.arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(arr), allow_pickle=False)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(self.meta, fh, default=str)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CompactGraph":
+        """Opens a saved graph; with mmap=True arrays are mapped read-only rather than read into memory."""
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        arrays = {}
+        for fname in os.listdir(path):
+            if fname.endswith(".npy"):
+                arrays[fname[:-4]] = np.load(os.path.join(path, fname), mmap_mode="r" if mmap else None, allow_pickle=False)
+        return cls(arrays, meta)
+
+    def to_graph(self, g: Optional[nx.DiGraph] = None) -> nx.DiGraph:
+        """
+        Rebuilds a mutable networkx graph (with indexes and trade projection) from this encoding.
+        When `g` is given its contents are replaced in place, so module-level singletons keep working.
+        """
+        if g is None:
+            g = nx.DiGraph()
+        g.clear()
+        keys = self.keys.to_list()
+        g.add_nodes_from(zip(keys, self.iter_node_attrs(keys)))
+        g.add_edges_from((u, v, {"relation": r} if r is not None else {}) for u, v, r in self.iter_edges(keys))
+        g.graph["version"] = self.meta.get("version", 0)
+        # Let GraphService derive the relation index, then install the stored projection
+        g.graph["trade_graph"] = self.trade_graph()
+        GraphService(g)
+        return g
+
+    def iter_edges(self, keys: Optional[List[str]] = None) -> Iterator[Tuple[str, str, Optional[str]]]:
+        """(source key, target key, relation) for every edge, read from the forward CSR in bulk."""
+        if keys is None:
+            keys = self.keys.to_list()
+        out_ptr, out_idx, out_rel = self.arrays["out_ptr"], self.arrays["out_idx"], self.arrays["out_rel"]
+        src = np.repeat(np.arange(len(keys)), np.diff(out_ptr))
+        for u, v, r in zip(src.tolist(), out_idx.tolist(), out_rel.tolist()):
+            yield keys[u], keys[v], RELATIONS[r] if r >= 0 else None
+
+    # Read API
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def number_of_nodes(self) -> int:
+        return len(self.keys)
+
+    def number_of_edges(self) -> int:
+        return len(self.arrays["out_idx"])
+
+    def node_index(self, key: str) -> int:
+        """Integer id for a node key, or -1. Binary search over the sorted key pool."""
+        target = key.encode("utf-8")
+        i = bisect.bisect_left(self._sorted_keys, target)
+        if i < len(self.keys) and self.keys.raw(i) == target:
+            return i
+        return -1
+
+    def has_node(self, key: str) -> bool:
+        return self.node_index(key) >= 0
+
+    def node_attrs(self, i: int) -> dict:
+        key = self.keys[i]
+        attrs = {}
+        code = int(self.node_type[i])
+        if code >= 0:
+            ntype = NODE_TYPES[code]
+            attrs["type"] = ntype
+            if ntype in DERIVED_ATTRS:
+                attrs[DERIVED_ATTRS[ntype]] = key.split(":", 1)[1]
+        for a, col in self.numeric.items():
+            value = col[i]
+            if not math.isnan(value):
+                attrs[a] = float(value)
+        for a, codes in self.string_codes.items():
+            c = codes[i]
+            if c >= 0:
+                attrs[a] = self.string_values[a][c]
+        attrs.update(self.extras.get(i, {}))
+        return attrs
+
+    def iter_node_attrs(self, keys: Optional[List[str]] = None) -> Iterator[dict]:
+        """node_attrs for every node in key order, reading each column once."""
+        if keys is None:
+            keys = self.keys.to_list()
+        types = self.node_type.tolist()
+        numeric = [(a, col.tolist()) for a, col in self.numeric.items()]
+        strings = [(a, codes.tolist(), self.string_values[a]) for a, codes in self.string_codes.items()]
+        for i, key in enumerate(keys):
+            attrs = {}
+            code = types[i]
+            if code >= 0:
+                ntype = NODE_TYPES[code]
+                attrs["type"] = ntype
+                if ntype in DERIVED_ATTRS:
+                    attrs[DERIVED_ATTRS[ntype]] = key.split(":", 1)[1]
+            for a, col in numeric:
+                if col[i] == col[i]:  # not NaN
+                    attrs[a] = col[i]
+            for a, codes, values in strings:
+                if codes[i] >= 0:
+                    attrs[a] = values[codes[i]]
+            if i in self.extras:
+                attrs.update(self.extras[i])
+            yield attrs
+
+    def get_node(self, key: str) -> Optional[dict]:
+        i = self.node_index(key)
+        return self.node_attrs(i) if i >= 0 else None
+
+    def neighbours(self, key: str, direction: str = "out", relation: Optional[str] = None) -> List[Tuple[str, Optional[str]]]:
+        """(neighbour key, relation) pairs, optionally filtered to one relation."""
+        i = self.node_index(key)
+        if i < 0:
+            return []
+        prefix = "out" if direction == "out" else "in"
+        ptr, idx, rel = self.arrays[f"{prefix}_ptr"], self.arrays[f"{prefix}_idx"], self.arrays[f"{prefix}_rel"]
+        lo, hi = int(ptr[i]), int(ptr[i + 1])
+        codes = rel[lo:hi]
+        targets = idx[lo:hi]
+        if relation is not None:
+            wanted = _RELATION_CODE.get(relation, -2)
+            targets = targets[codes == wanted]
+            return [(self.keys[int(t)], relation) for t in targets]
+        return [(self.keys[int(t)], RELATIONS[c] if c >= 0 else None) for t, c in zip(targets, codes)]
+
+    def invoices_for_period(self, period: str) -> List[str]:
+        return [self.keys[int(i)] for i in self.period_invoice_ids(period)]
+
+    def period_invoice_ids(self, period: str) -> np.ndarray:
+        """Integer ids of the period's Invoice nodes."""
+        values = self.string_values["period"]
+        if period not in values:
+            return np.empty(0, dtype=np.int64)
+        code = values.index(period)
+        return np.flatnonzero((self.node_type == _INVOICE) & (self.string_codes["period"] == code))
+
+    def relation_edges(self, relation: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(source ids, target ids) of every edge with the given relation, from the forward CSR."""
+        out_ptr = self.arrays["out_ptr"]
+        src = np.repeat(np.arange(len(out_ptr) - 1), np.diff(out_ptr))
+        mask = self.arrays["out_rel"] == _RELATION_CODE.get(relation, -2)
+        return src[mask], np.asarray(self.arrays["out_idx"])[mask]
+
+    def trade_graph(self) -> nx.DiGraph:
+        """The taxpayer trade projection as a (small) networkx graph."""
+        t = nx.DiGraph(version=self.meta.get("trade_version", 0))
+        a = self.arrays
+        for u, v, c, tv, tx in zip(a["trade_src"].tolist(), a["trade_dst"].tolist(), a["trade_count"].tolist(),
+                                   a["trade_taxable"].tolist(), a["trade_tax"].tolist()):
+            t.add_edge(self.keys[u], self.keys[v], invoice_count=c, taxable_value=tv, tax_value=tx)
+        return t
+
+    @property
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in self.arrays.values()) + len(json.dumps(self.meta, default=str))
+
+class _NodeView:
+    """Just enough of nx's NodeView for GraphService's read paths: view[key] and view(data=True)."""
+    def __init__(self, cg: CompactGraph):
+        self.cg = cg
+
+    def __getitem__(self, key: str) -> dict:
+        i = self.cg.node_index(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.cg.node_attrs(i)
+
+    def __contains__(self, key: str) -> bool:
+        return self.cg.has_node(key)
+
+    def __call__(self, data: bool = False) -> Iterator:
+        for i in range(len(self.cg)):
+            yield (self.cg.keys[i], self.cg.node_attrs(i)) if data else self.cg.keys[i]
+
+class _CompactIndex:
+    """GraphIndex lookalike answering targets/sources/invoices_by_period from CSR arrays."""
+    def __init__(self, cg: CompactGraph):
+        self.cg = cg
+        self.invoices_by_period = _PeriodLookup(cg)
+
+    def targets(self, relation: str, u: str) -> List[str]:
+        return [k for k, _ in self.cg.neighbours(u, "out", relation)]
+
+    def sources(self, relation: str, v: str) -> List[str]:
+        return [k for k, _ in self.cg.neighbours(v, "in", relation)]
+
+class _PeriodLookup:
+    def __init__(self, cg: CompactGraph):
+        self.cg = cg
+
+    def get(self, period: str, default=()):
+        return self.cg.invoices_for_period(period) or default
+
+class CompactGraphService(GraphService):
+    """Read-only GraphService over a CompactGraph (e.g. a memory-mapped snapshot)."""
+    read_only = True
+
+    def __init__(self, compact: CompactGraph):
+        self.g = compact
+        self.index = _CompactIndex(compact)
+        if "trade_graph" not in compact.graph:
+            compact.graph["trade_graph"] = compact.trade_graph()
+            compact.graph["cycle_index"] = CycleIndex(compact.graph["trade_graph"])
+            compact.graph["features"] = FeatureStore()
+        self.trade_graph = compact.graph["trade_graph"]
+        self.cycle_index = compact.graph["cycle_index"]
+        self.features = compact.graph["features"]
+
+    def _touch(self, trade: bool = False):
+        raise RuntimeError("Compact graph snapshots are read-only")
+
+    def clear_graph(self):
+        raise RuntimeError("Compact graph snapshots are read-only")
+
+    def get_node(self, node_id: str) -> dict:
+        return self.g.get_node(node_id)
+
+    def graph_counts(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        return _named_counts(self.g.node_type, NODE_TYPES), _named_counts(self.g.arrays["out_rel"], RELATIONS)
+
+    def get_edge_data(self, source: str, target: str) -> dict:
+        for key, relation in self.g.neighbours(source, "out"):
+            if key == target:
+                return {"relation": relation} if relation else {}
+        return None
+
+    def _adjacent(self, node_id: str, direction: str) -> Iterator[Tuple[str, Optional[str]]]:
+        if direction in ("out", "both"):
+            yield from self.g.neighbours(node_id, "out")
+        if direction in ("in", "both"):
+            yield from self.g.neighbours(node_id, "in")
+
+    def neighbourhood(self, start: str, max_depth: int = 2, **filters) -> nx.DiGraph:
+        """Small networkx copy of the neighbourhood (there is no live graph to take a view of)."""
+        nodes = {node for node, _, _ in self.traverse(start, max_depth=max_depth, **filters)}
+        sub = nx.DiGraph()
+        sub.add_nodes_from((n, self.g.get_node(n)) for n in nodes)
+        for n in nodes:
+            for v, relation in self.g.neighbours(n, "out"):
+                if v in nodes:
+                    sub.add_edge(n, v, relation=relation)
+        return sub
+
+def _named_counts(codes: np.ndarray, names: Tuple[str, ...]) -> Dict[str, int]:
+    # Code -1 is anything outside the known names
+    counts = np.bincount(np.asarray(codes, dtype=np.int64) + 1, minlength=len(names) + 1)
+    return {name: int(n) for name, n in zip(("unknown",) + names, counts.tolist()) if n}
+
+def _csr(src: np.ndarray, dst: np.ndarray, rel: np.ndarray, n: int):
+    order = np.lexsort((dst, src))
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=ptr[1:])
+    return ptr, dst[order], rel[order]
+
+def graph_nbytes(g: nx.DiGraph) -> int:
+    """Approximate deep size of a networkx graph's node, adjacency and attribute dicts and its relation index."""
+    seen = set()
+    stack = [g._node, g._succ, g._pred]
+    index = g.graph.get("index")
+    if index is not None:
+        stack.extend([index.forward, index.reverse, index.invoices_by_period])
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+    return total
+
+def memory_report(g: nx.DiGraph) -> Dict[str, float]:
+    """Bytes per invoice (invoice plus its GSTR-1/2B/PR/IRN satellites) for both representations."""
+    invoices = sum(1 for _, t in g.nodes(data="type") if t == "Invoice") or 1
+    before = graph_nbytes(g)
+    after = CompactGraph.from_graph(g).nbytes
+    return {
+        "invoices": invoices,
+        "nodes": g.number_of_nodes(),
+        "edges": g.number_of_edges(),
+        "networkx_bytes": before,
+        "compact_bytes": after,
+        "networkx_bytes_per_invoice": before / invoices,
+        "compact_bytes_per_invoice": after / invoices,
+        "reduction": before / after if after else 0.0,
+    }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Report memory per invoice for the networkx and compact graph representations")
+    parser.add_argument("--invoices", type=int, default=50000)
+    parser.add_argument("--taxpayers", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    import random
+    rng = random.Random(7)
+    gs = GraphService(nx.DiGraph())
+    for i in range(args.invoices):
+        inv, period = f"INV-{i:08d}", f"2024-{rng.randint(1, 12):02d}"
+        sup, buy = f"GSTIN{rng.randrange(args.taxpayers):010d}", f"GSTIN{rng.randrange(args.taxpayers):010d}"
+        tax = round(rng.uniform(100, 100000), 2)
+        gs.add_invoice(inv, sup, buy, period, {"tax_value": tax, "total_value": tax / 0.18, "date": f"{period}-15"})
+        gs.add_gstr1_entry(inv, sup, period, {"tax_value": tax})
+        gs.add_gstr2b_entry(inv, buy, period, {"itc_available": tax})
+        gs.add_purchase_register_entry(inv, buy, period, {"tax_paid": tax})
+        gs.add_einvoice_entry(f"IRN{i:012d}", inv, {"tax_value": tax, "date": f"{period}-15", "supplier_gstin": sup, "buyer_gstin": buy})
+    print(json.dumps(memory_report(gs.g), indent=2))
+
+if __name__ == "__main__":
+    main()
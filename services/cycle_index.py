@@ -0,0 +1,161 @@
+import networkx as nx
+from typing import Dict, Set
+
+class CycleIndex:
+    """
+    Incrementally maintained strongly connected components of the taxpayer trade graph.
+    A taxpayer is "in a loop" when its SCC has more than one member or it trades with itself.
+
+    Edge insertions are handled incrementally: a new edge u -> v only merges components
+    when v already reaches u, and the merged component is exactly the set of nodes that
+    are reachable from v and can reach u. The check searches forward from v and backward
+    from u in turn until one side runs out, so it costs about twice the smaller of the two
+    reachable sets rather than everything v reaches. Edge deletions can split a component, which is
+    not worth tracking incrementally; they mark the index dirty and the next query
+    recomputes it from the trade graph.
+    """
+    def __init__(self, trade_graph: nx.DiGraph):
+        self.trade_graph = trade_graph
+        self.component: Dict[str, int] = {}
+        self.members: Dict[int, Set[str]] = {}
+        self.self_loops: Set[str] = set()
+        self._next_id = 0
+        self._dirty = True
+
+    def rebuild(self):
+        # Built aside and swapped in, so a concurrent reader never sees a half-built index
+        component, members = {}, {}
+        for cid, scc in enumerate(s for s in nx.strongly_connected_components(self.trade_graph) if len(s) > 1):
+            members[cid] = set(scc)
+            for node in scc:
+                component[node] = cid
+        self.self_loops = {u for u, v in nx.selfloop_edges(self.trade_graph)}
+        self.component, self.members, self._next_id = component, members, len(members)
+        self._dirty = False
+
+    def copy(self, trade_graph: nx.DiGraph) -> "CycleIndex":
+        """Same components over a copy of the trade graph (used when the graph is forked)."""
+        index = CycleIndex(trade_graph)
+        index.component = dict(self.component)
+        index.members = {cid: set(m) for cid, m in self.members.items()}
+        index.self_loops = set(self.self_loops)
+        index._next_id = self._next_id
+        index._dirty = self._dirty
+        return index
+
+    def invalidate(self):
+        """Drop incremental state; the next query rebuilds from the trade graph (used for bulk loads)."""
+        self._dirty = True
+
+    def on_edge_added(self, u: str, v: str):
+        if self._dirty:
+            return  # picked up by the pending rebuild
+        if u == v:
+            self.self_loops.add(u)
+            return
+        if u in self.component and self.component.get(v) == self.component[u]:
+            return
+
+        merged = self._closed_loop(u, v)
+        if merged is None:
+            return
+        # Fold everything into the largest component touched, so only the newcomers are relabelled
+        ids = {self.component[node] for node in merged if node in self.component}
+        if not ids:
+            self._new_component(merged)
+            return
+        cid = max(ids, key=lambda c: len(self.members[c]))
+        for other in ids - {cid}:
+            merged |= self.members.pop(other)
+        for node in merged - self.members[cid]:
+            self.component[node] = cid
+        self.members[cid] |= merged
+
+    def _closed_loop(self, u: str, v: str):
+        """
+        Nodes on a path v -> ... -> u (the loop a new edge u -> v closes), or None if there is
+        none. The searches don't go through u's and v's existing components, whose members are
+        already known to reach u (be reached from v); the caller adds them.
+        """
+        g = self.trade_graph
+        cu, cv = self.component.get(u), self.component.get(v)
+        in_u = (lambda node: node == u) if cu is None else (lambda node: self.component.get(node) == cu)
+        in_v = (lambda node: node == v) if cv is None else (lambda node: self.component.get(node) == cv)
+        forward, backward = {v}, {u}
+        forward_stack, backward_stack = [v], [u]
+        # Grow both searches a node at a time until one has everything it can reach
+        while forward_stack and backward_stack:
+            node = forward_stack.pop()
+            if not in_u(node):
+                for succ in g.successors(node):
+                    if succ not in forward:
+                        forward.add(succ)
+                        forward_stack.append(succ)
+            node = backward_stack.pop()
+            if not in_v(node):
+                for pred in g.predecessors(node):
+                    if pred not in backward:
+                        backward.add(pred)
+                        backward_stack.append(pred)
+        if not forward_stack:
+            # Walk back from where v's search reached u's component, staying among the nodes v reaches
+            within, neighbours = forward, g.predecessors
+            merged = {node for node in forward if in_u(node)}
+        else:
+            within, neighbours = backward, g.successors
+            merged = {node for node in backward if in_v(node)}
+        if not merged:
+            return None
+        stack = list(merged)
+        while stack:
+            for nbr in neighbours(stack.pop()):
+                if nbr in within and nbr not in merged:
+                    merged.add(nbr)
+                    stack.append(nbr)
+        return merged
+
+    def on_edge_removed(self, u: str, v: str):
+        if u == v:
+            self.self_loops.discard(u)
+        elif u in self.component and self.component.get(v) == self.component[u]:
+            self._dirty = True
+
+    def in_loop(self, node: str) -> bool:
+        """O(1) membership check: is this taxpayer node on at least one trade cycle?"""
+        if self._dirty:
+            self.rebuild()
+        return node in self.component or node in self.self_loops
+
+    def same_component(self, u: str, v: str) -> bool:
+        """Is there a loop through both taxpayers (or, for u == v, a self-trade)?"""
+        if self._dirty:
+            self.rebuild()
+        if u == v:
+            return u in self.self_loops
+        cid = self.component.get(u)
+        return cid is not None and self.component.get(v) == cid
+
+    def component_members(self, node: str) -> Set[str]:
+        """Members of the node's SCC (just the node itself when it is not in a loop)."""
+        if self._dirty:
+            self.rebuild()
+        cid = self.component.get(node)
+        return set(self.members[cid]) if cid is not None else {node}
+
+    def loop_members(self) -> Set[str]:
+        """Every taxpayer currently on a loop."""
+        if self._dirty:
+            self.rebuild()
+        return set(self.component) | self.self_loops
+
+    def loop_components(self):
+        if self._dirty:
+            self.rebuild()
+        return [set(m) for m in self.members.values()]
+
+    def _new_component(self, nodes: Set[str]):
+        cid = self._next_id
+        self._next_id += 1
+        self.members[cid] = set(nodes)
+        for node in nodes:
+            self.component[node] = cid
@@ -0,0 +1,314 @@
+"""
+Server-push change stream for the dashboard (GET /events, Server-Sent Events).
+
+The broker listens to GraphStore publishes (GraphStore.on_publish), so every ingest batch
+becomes at most one "delta" event. The delta is computed off the write path, on a background
+thread, against the last state the stream pushed:
+
+  mismatches  invoices the batch touched whose set of open mismatches changed (newly
+              detected ones, and ones the batch's filings resolved)
+  cycles      taxpayers that joined or left a circular trading loop
+  risk        vendors whose propagated risk moved by GST_EVENTS_RISK_DELTA points or
+              more since it was last pushed, or changed bucket (Low / Medium / High)
+
+If the background thread falls behind, pending batches are merged and pushed as one delta.
+Clients subscribe by GSTIN, by period and by kind. Loop and risk changes are network-wide,
+so a period filter does not apply to them. Each client has a queue of at most
+GST_EVENTS_QUEUE_SIZE undelivered events. If a slow client overflows it, its queue is
+replaced by a single "resync" event, telling it to re-fetch the pages it shows. A write that
+replaces the whole graph (clear, snapshot load) sends "resync" to every client.
+
+    event: delta
+    id: 4182
+    data: {"graph_version":4182,"mismatches":[...],"cycles":[...],"risk":[...]}
+
+State is only kept while someone is subscribed: the first subscriber sets the baseline
+that later deltas are measured against, and it is dropped when the last one leaves. Besides
+one score per taxpayer, it holds the open mismatch causes of each invoice a batch touched
+since the baseline, so it grows with the invoices that have open mismatches (an invoice is
+dropped once they are resolved), not with the whole graph.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+import config
+from services.graph_service import GraphService
+from services.graph_store import GraphStore, graph_store
+from services.ml_service import risk_bucket
+from services.reconciliation import ReconciliationEngine
+from services.risk_service import RiskService
+
+logger = logging.getLogger(__name__)
+
+# Kinds of change a client can subscribe to
+KINDS = ("mismatch", "cycle", "risk")
+
+def _format(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", "data: " + json.dumps(data, separators=(",", ":"))]
+    return "\n".join(lines) + "\n\n"
+
+class Subscription:
+    """One connected client: its filters and its queue of formatted events."""
+    def __init__(self, broker: "EventBroker", loop: asyncio.AbstractEventLoop, gstins: Optional[Set[str]] = None,
+                 periods: Optional[Set[str]] = None, kinds: Iterable[str] = KINDS):
+        self.broker = broker
+        self.loop = loop
+        self.gstins = gstins
+        self.periods = periods
+        self.kinds = set(kinds)
+        self._queue: deque = deque()
+        # Set (on the event loop) when the queue has something to send
+        self._ready = asyncio.Event()
+
+    def message(self, delta: dict) -> Optional[str]:
+        """The delta cut down to what this client subscribed to, formatted; None if nothing is left."""
+        gstins = self.gstins
+        data = {"graph_version": delta["graph_version"]}
+        if "mismatch" in self.kinds:
+            data["mismatches"] = [e for e in delta["mismatches"]
+                                  if (gstins is None or e["supplier_gstin"] in gstins or e["buyer_gstin"] in gstins)
+                                  and (self.periods is None or e["period"] in self.periods)]
+        if "cycle" in self.kinds:
+            data["cycles"] = [e for e in delta["cycles"] if gstins is None or e["gstin"] in gstins]
+        if "risk" in self.kinds:
+            data["risk"] = [e for e in delta["risk"] if gstins is None or e["gstin"] in gstins]
+        if not any(data.get(key) for key in ("mismatches", "cycles", "risk")):
+            return None
+        return _format("delta", data, delta["graph_version"])
+
+    def offer(self, message: str):
+        """Queues a message from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The client's event loop is gone
+            self.broker.unsubscribe(self)
+
+    def _put(self, message: str):
+        if len(self._queue) >= self.broker.max_queued:
+            # Too far behind for deltas to be useful; have it start over instead
+            self._queue.clear()
+            message = _format("resync", {"reason": "overflow"})
+            self.broker.count("overflows")
+        self._queue.append(message)
+        self._ready.set()
+
+    async def stream(self, heartbeat: float = None):
+        """The client's Server-Sent Events; unsubscribes when the client goes away."""
+        heartbeat = config.EVENTS_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+        try:
+            yield _format("subscribed", {"graph_version": self.broker.store.version, "kinds": sorted(self.kinds),
+                                         "gstins": sorted(self.gstins) if self.gstins else None,
+                                         "periods": sorted(self.periods) if self.periods else None})
+            while True:
+                if not self._queue:
+                    self._ready.clear()
+                    try:
+                        await asyncio.wait_for(self._ready.wait(), heartbeat)
+                    except asyncio.TimeoutError:
+                        # Comment line: keeps proxies from timing the stream out, and finds dead clients
+                        yield ": keep-alive\n\n"
+                        continue
+                yield self._queue.popleft()
+                self.broker.count("delivered")
+        finally:
+            self.broker.unsubscribe(self)
+
+class EventBroker:
+    def __init__(self, store: GraphStore = graph_store, risk_delta: float = None, max_queued: int = None):
+        self.store = store
+        self.risk_delta = config.EVENTS_RISK_DELTA if risk_delta is None else risk_delta
+        self.max_queued = config.EVENTS_QUEUE_SIZE if max_queued is None else max_queued
+        self._subscribers: List[Subscription] = []
+        self._cond = threading.Condition()
+        # Changes published since the worker last ran, merged; None when there are none
+        self._pending: Optional[dict] = None
+        self._thread: Optional[threading.Thread] = None
+        # Last state pushed: invoice id -> root causes of its open mismatches, taxpayers on
+        # loops, taxpayer -> propagated risk (and the scores dict it was last compared with)
+        self._mismatches: Dict[str, frozenset] = {}
+        self._in_loop: Set[str] = set()
+        self._risk: Dict[str, float] = {}
+        self._scores: Optional[dict] = None
+        self.counts = {"batches": 0, "deltas": 0, "delivered": 0, "overflows": 0}
+
+    def subscribe(self, loop: asyncio.AbstractEventLoop, gstins: Optional[Iterable[str]] = None,
+                  periods: Optional[Iterable[str]] = None, kinds: Iterable[str] = KINDS) -> Subscription:
+        subscription = Subscription(self, loop, set(gstins) if gstins else None, set(periods) if periods else None, kinds)
+        with self._cond:
+            if not self._subscribers:
+                # Measure deltas from now on
+                self._pending = _merge(None, baseline=True)
+                self._cond.notify()
+            self._subscribers.append(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="gst-events", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._cond:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+                if not self._subscribers:
+                    # Wake the worker so it drops the state (only it touches it)
+                    self._pending = _merge(None)
+                    self._cond.notify()
+
+    def count(self, name: str, amount: int = 1):
+        with self._cond:
+            self.counts[name] += amount
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"subscribers": len(self._subscribers), **self.counts}
+
+    def on_publish(self, gs: GraphService, previous: int, changes: dict):
+        # Runs inside the write block, so only notes what changed; the worker does the rest
+        with self._cond:
+            if not self._subscribers:
+                return
+            self._pending = _merge(self._pending, gs.version, changes)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                pending, self._pending = self._pending, None
+                subscribers = list(self._subscribers)
+            if not subscribers:
+                self._clear()
+                continue
+            try:
+                if pending["baseline"] or pending["all"]:
+                    self._reset(pending["version"])
+                    if pending["all"]:
+                        for subscription in subscribers:
+                            subscription.offer(_format("resync", {"reason": "reload"}))
+                    continue
+                delta = self._delta(pending)
+            except Exception:
+                logger.exception("Computing change events failed")
+                continue
+            self.count("batches", pending["batches"])
+            if not any(delta[key] for key in ("mismatches", "cycles", "risk")):
+                continue
+            self.count("deltas")
+            for subscription in subscribers:
+                message = subscription.message(delta)
+                if message is not None:
+                    subscription.offer(message)
+
+    @contextmanager
+    def _pinned(self, version: int) -> Iterator[GraphService]:
+        # Listeners run just before the write is published; wait until it is
+        while True:
+            with self.store.read() as gs:
+                if gs.version >= version:
+                    yield gs
+                    return
+            time.sleep(0.005)
+
+    def _reset(self, version: int):
+        with self._pinned(version) as gs:
+            self._mismatches = {}
+            self._in_loop = gs.cycle_index.loop_members()
+            self._scores = RiskService(gs).calculate_risk_propagation()
+            self._risk = dict(self._scores)
+
+    def _clear(self):
+        self._mismatches = {}
+        self._in_loop = set()
+        self._risk = {}
+        self._scores = None
+
+    def _delta(self, pending: dict) -> dict:
+        # One pinned version for every part of the delta
+        with self._pinned(pending["version"]) as gs:
+            delta = {"graph_version": gs.version, "mismatches": self._mismatch_changes(gs, pending["invoices"]),
+                     "cycles": [], "risk": []}
+            # Loops and propagated risk only move when trade or a taxpayer's own score does
+            if pending["taxpayers"] or pending["trade_edges"]:
+                delta["cycles"] = self._cycle_changes(gs)
+                delta["risk"] = self._risk_changes(gs)
+            return delta
+
+    def _mismatch_changes(self, gs: GraphService, invoices: Set[str]) -> List[dict]:
+        engine = ReconciliationEngine(gs)
+        events = []
+        for node in sorted(invoices):
+            invoice_id = node.split(":", 1)[1]
+            before = self._mismatches.get(invoice_id, frozenset())
+            data = gs.get_node(node)
+            if data is None:
+                # Filings for an invoice not ingested yet, or an evicted period
+                continue
+            mismatches = engine.reconcile_invoice(invoice_id)
+            causes = frozenset(m.root_cause for m in mismatches)
+            if causes == before:
+                continue
+            if causes:
+                self._mismatches[invoice_id] = causes
+            else:
+                self._mismatches.pop(invoice_id, None)
+            events.append({
+                "invoice_id": invoice_id,
+                "period": data.get("period"),
+                "supplier_gstin": gs.get_invoice_supplier(invoice_id),
+                "buyer_gstin": gs.get_invoice_buyer(invoice_id),
+                "mismatches": [{"root_cause": m.root_cause, "risk_severity": m.risk_severity,
+                                "financial_exposure": m.financial_exposure} for m in mismatches],
+                "resolved": sorted(before - causes),
+            })
+        return events
+
+    def _cycle_changes(self, gs: GraphService) -> List[dict]:
+        members = gs.cycle_index.loop_members()
+        joined, left = members - self._in_loop, self._in_loop - members
+        self._in_loop = members
+        events = [{"gstin": node.split(":", 1)[1], "in_loop": True,
+                   "loop_size": len(gs.cycle_index.component_members(node))} for node in sorted(joined)]
+        events += [{"gstin": node.split(":", 1)[1], "in_loop": False, "loop_size": 0} for node in sorted(left)]
+        return events
+
+    def _risk_changes(self, gs: GraphService) -> List[dict]:
+        scores = RiskService(gs).calculate_risk_propagation()
+        # Propagation is only recomputed every few trade changes; same dict, nothing moved
+        if scores is self._scores:
+            return []
+        self._scores = scores
+        events = []
+        for node, score in sorted(scores.items()):
+            before = self._risk.get(node, 0.0)
+            if abs(score - before) < self.risk_delta and risk_bucket(score) == risk_bucket(before):
+                continue
+            self._risk[node] = score
+            events.append({"gstin": node.split(":", 1)[1], "propagated_risk_score": round(score, 2),
+                           "previous_score": round(before, 2), "risk_bucket": risk_bucket(score),
+                           "previous_bucket": risk_bucket(before)})
+        return events
+
+def _merge(pending: Optional[dict], version: int = 0, changes: Optional[dict] = None, baseline: bool = False) -> dict:
+    """Folds one publish's changes into the pending ones."""
+    if pending is None:
+        pending = {"version": 0, "batches": 0, "invoices": set(), "taxpayers": set(), "trade_edges": False,
+                   "all": False, "baseline": baseline}
+    if changes is not None:
+        pending["version"] = max(pending["version"], version)
+        pending["batches"] += 1
+        pending["invoices"].update(node for node in changes["nodes"] if node.startswith("Invoice:"))
+        pending["taxpayers"] |= changes["taxpayers"]
+        pending["trade_edges"] = pending["trade_edges"] or bool(changes["trade_edges"])
+        pending["all"] = pending["all"] or changes["all"]
+    return pending
+
+event_broker = EventBroker()
+graph_store.on_publish(event_broker.on_publish)
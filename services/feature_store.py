@@ -0,0 +1,286 @@
+"""
+Materialised per-taxpayer features for vendor risk scoring, keyed by GSTIN.
+
+Filing-derived features are kept in step with the graph: every invoice contributes counts
+and amounts to its supplier's and buyer's rows, and when an invoice or one of its filings
+changes its old contribution is taken out and the new one added. Changed invoices are
+collected as they are written and folded in once per ingest batch (or on the next read),
+so a batch costs O(invoices it touched), not O(graph).
+
+Network features depend on the whole trade graph and are computed for every taxpayer at
+once, cached against the trade projection's version: propagated risk (the risk propagation
+cache) and cycle involvements, the number of trading loops the taxpayer sits on as reported
+by RiskService.detect_circular_trading (up to MAX_CYCLE_LENGTH taxpayers, capped at
+MAX_CYCLES). Loops are counted per taxpayer on first use at each trade version; taxpayers
+outside every loop cost an O(1) check, the rest one bounded search each.
+
+Like the trade projection, rows still include invoices whose period was evicted to cold
+storage. Bulk loads invalidate the store and the next read rebuilds it.
+
+Export for training:
+
+    python -m services.feature_store --data-dir data/ --out features.parquet
+"""
+import argparse
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+# Columns of the exported feature table, in order
+FEATURE_COLUMNS = [
+    "invoices_issued",
+    "periods_active",
+    "mismatch_count",
+    "mismatch_rate",
+    "filing_gaps",
+    "output_tax_invoiced",
+    "output_tax_reported",
+    "unpaid_tax_ratio",
+    "itc_claimed",
+    "itc_to_output_ratio",
+    "cycle_involvements",
+    "propagated_risk_score",
+]
+
+# An invoice's contribution: (supplier, buyer, period, reported, mismatches, tax_invoiced, tax_reported, itc_claimed)
+Contribution = Tuple[Optional[str], Optional[str], str, int, int, float, float, float]
+
+def _new_row() -> dict:
+    return {
+        "invoices": {}, "reported": {}, "mismatches": {},  # per period
+        "tax_invoiced": 0.0, "tax_reported": 0.0, "itc_claimed": 0.0,
+    }
+
+class FeatureStore:
+    def __init__(self):
+        self.rows: Dict[str, dict] = {}
+        self.contributions: Dict[str, Contribution] = {}
+        self.pending: Dict[str, None] = {}
+        self._dirty = True
+        # (trade version, loop counts by GSTIN filled in as they are asked for)
+        self._cycles: Tuple[int, Dict[str, int]] = (-1, {})
+        self._lock = threading.Lock()
+
+    def copy(self) -> "FeatureStore":
+        """Independent copy (used when the graph is forked)."""
+        store = FeatureStore()
+        with self._lock:
+            store.rows = {gstin: {k: dict(v) if isinstance(v, dict) else v for k, v in row.items()} for gstin, row in self.rows.items()}
+            store.contributions = dict(self.contributions)
+            store.pending = dict(self.pending)
+            store._dirty = self._dirty
+            store._cycles = (self._cycles[0], dict(self._cycles[1]))
+        return store
+
+    def invalidate(self):
+        """Drop incremental state; the next read rebuilds from the graph (used for bulk loads)."""
+        self._dirty = True
+
+    def on_invoice_changed(self, invoice_node: str):
+        """Records that an invoice or one of its filings changed; folded in by flush()."""
+        if not self._dirty:
+            self.pending[invoice_node] = None
+
+    def flush(self, gs):
+        """Brings the rows up to date with the graph behind `gs`."""
+        if not self._dirty and not self.pending:
+            return
+        with self._lock:
+            if self._dirty:
+                self._rebuild(gs)
+                return
+            pending, self.pending = self.pending, {}
+            engine = _engine(gs)
+            for invoice_node in pending:
+                # An invoice missing from the graph was evicted with its period; it keeps counting.
+                # So does one with only a bare (untyped) node left by a filing
+                if (gs.get_node(invoice_node) or {}).get("type") == "Invoice":
+                    self._apply(invoice_node, _contribution(gs, engine, invoice_node))
+
+    def _rebuild(self, gs):
+        # Built aside and swapped in, so a concurrent reader never sees a half-built store
+        from services.compact_graph import CompactGraphService
+        from services.period_shards import PeriodShards
+        fresh = FeatureStore()
+        shards = PeriodShards(gs)
+        # Cold shards first: an invoice re-ingested while its period was cold counts as its live copy
+        sources = [CompactGraphService(shards.open_cold(period)) for period in shards.cold_periods()] + [gs]
+        for source in sources:
+            engine = _engine(source)
+            for invoice_node, _ in source.iter_invoices():
+                fresh._apply(invoice_node, _contribution(source, engine, invoice_node))
+        self.rows, self.contributions, self.pending = fresh.rows, fresh.contributions, {}
+        self._dirty = False
+
+    def _apply(self, invoice_node: str, contribution: Contribution):
+        old = self.contributions.get(invoice_node)
+        if old == contribution:
+            return
+        if old is not None:
+            self._add(old, -1)
+        self._add(contribution, +1)
+        self.contributions[invoice_node] = contribution
+
+    def _add(self, contribution: Contribution, sign: int):
+        supplier, buyer, period, reported, mismatches, tax_invoiced, tax_reported, itc_claimed = contribution
+        if supplier is not None:
+            row = self.rows.get(supplier)
+            if row is None:
+                row = self.rows[supplier] = _new_row()
+            _bump(row["invoices"], period, sign)
+            if reported:
+                _bump(row["reported"], period, sign * reported)
+            if mismatches:
+                _bump(row["mismatches"], period, sign * mismatches)
+            row["tax_invoiced"] += sign * tax_invoiced
+            row["tax_reported"] += sign * tax_reported
+        if buyer is not None and itc_claimed:
+            row = self.rows.get(buyer)
+            if row is None:
+                row = self.rows[buyer] = _new_row()
+            row["itc_claimed"] += sign * itc_claimed
+
+    # Reads
+
+    def get(self, gs, gstin: str) -> dict:
+        """One taxpayer's features (FEATURE_COLUMNS plus mismatch_count_by_period)."""
+        self.flush(gs)
+        row = self.rows.get(gstin) or _new_row()
+        features = _filing_features(row)
+        features["mismatch_count_by_period"] = dict(sorted(row["mismatches"].items()))
+        features["cycle_involvements"] = self._cycle_count(gs, gstin)
+        features["propagated_risk_score"] = self._propagated_risk(gs).get(f"Taxpayer:{gstin}", 0.0)
+        return features
+
+    def to_frame(self, gs, by_period: bool = False, all_taxpayers: bool = False, gstins: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """
+        The store as a DataFrame indexed by GSTIN with FEATURE_COLUMNS. Rows exist for
+        taxpayers that supplied an invoice or claimed ITC; `all_taxpayers` adds one with
+        default (empty) filing features for every other Taxpayer node, e.g. buyers that
+        claimed nothing. With `by_period`, one row per (gstin, period) with that period's
+        invoices, reported invoices and mismatches. With `gstins`, only those taxpayers' rows,
+        in that order (default rows for unknown ones), without building the rest.
+        """
+        self.flush(gs)
+        rows = self.rows
+        if gstins is not None:
+            rows = {gstin: rows.get(gstin) or _new_row() for gstin in gstins}
+        elif all_taxpayers:
+            rows = dict(rows)
+            for node in gs.g.nodes():
+                if node.startswith("Taxpayer:") and node[9:] not in rows:
+                    rows[node[9:]] = _new_row()
+        if by_period:
+            records = [(gstin, period, n, row["reported"].get(period, 0), row["mismatches"].get(period, 0))
+                       for gstin, row in rows.items() for period, n in sorted(row["invoices"].items())]
+            return pd.DataFrame.from_records(records, columns=["gstin", "period", "invoices", "reported", "mismatches"])
+        scores = self._propagated_risk(gs)
+        records = []
+        for gstin, row in rows.items():
+            features = _filing_features(row)
+            features["cycle_involvements"] = self._cycle_count(gs, gstin)
+            features["propagated_risk_score"] = scores.get(f"Taxpayer:{gstin}", 0.0)
+            records.append(features)
+        frame = pd.DataFrame.from_records(records, index=pd.Index(list(rows), name="gstin"), columns=FEATURE_COLUMNS)
+        return frame if gstins is not None else frame.sort_index()
+
+    def to_numpy(self, gs) -> Tuple[List[str], np.ndarray]:
+        """(gstins, float64 matrix with FEATURE_COLUMNS as columns), for training."""
+        frame = self.to_frame(gs)
+        return list(frame.index), frame.to_numpy(dtype=np.float64)
+
+    def _propagated_risk(self, gs) -> Dict[str, float]:
+        from services.risk_service import RiskService
+        return RiskService(gs).calculate_risk_propagation()
+
+    def _cycle_count(self, gs, gstin: str) -> int:
+        # Same loops the audit reports; O(1) for taxpayers outside any loop
+        if not gs.is_in_trade_loop(gstin):
+            return 0
+        version, counts = self._cycles
+        if version != gs.trade_version:
+            counts = {}
+            self._cycles = (gs.trade_version, counts)
+        count = counts.get(gstin)
+        if count is None:
+            from services.risk_service import RiskService
+            count = counts[gstin] = len(RiskService(gs).detect_circular_trading(gstin))
+        return count
+
+def _bump(counts: Dict[str, int], period: str, delta: int):
+    value = counts.get(period, 0) + delta
+    if value:
+        counts[period] = value
+    else:
+        del counts[period]
+
+def _engine(gs):
+    from services.reconciliation import ReconciliationEngine
+    return ReconciliationEngine(gs)
+
+def _contribution(gs, engine, invoice_node: str) -> Contribution:
+    attrs = gs.get_node(invoice_node)
+    invoice_id = attrs.get("invoice_id", invoice_node.split(":", 1)[1])
+    gstr1 = gs.get_gstr1_entries(invoice_id)
+    # Same checks as reconciliation, so mismatch counts agree with /reconcile
+    mismatches = engine.count_mismatches(invoice_id, attrs)
+    return (
+        gs.get_invoice_supplier(invoice_id),
+        gs.get_invoice_buyer(invoice_id),
+        attrs.get("period", "unknown"),
+        1 if gstr1 else 0,
+        mismatches,
+        float(attrs.get("tax_value", 0.0) or 0.0),
+        sum(float(gs.get_node(n).get("tax_value", 0.0) or 0.0) for n in gstr1),
+        sum(float(gs.get_node(n).get("tax_paid", 0.0) or 0.0) for n in gs.get_purchase_register_entries(invoice_id)),
+    )
+
+def _filing_features(row: dict) -> dict:
+    invoices = sum(row["invoices"].values())
+    mismatches = sum(row["mismatches"].values())
+    tax_invoiced, tax_reported, itc_claimed = row["tax_invoiced"], row["tax_reported"], row["itc_claimed"]
+    return {
+        "invoices_issued": invoices,
+        "periods_active": len(row["invoices"]),
+        "mismatch_count": mismatches,
+        "mismatch_rate": mismatches / invoices if invoices else 0.0,
+        # Periods with invoices issued but none of them reported in GSTR-1
+        "filing_gaps": sum(1 for period in row["invoices"] if not row["reported"].get(period)),
+        "output_tax_invoiced": tax_invoiced,
+        "output_tax_reported": tax_reported,
+        "unpaid_tax_ratio": max(0.0, 1.0 - tax_reported / tax_invoiced) if tax_invoiced > 0 else 0.0,
+        "itc_claimed": itc_claimed,
+        "itc_to_output_ratio": itc_claimed / max(tax_reported, 1.0),
+    }
+
+def main(argv: Optional[List[str]] = None):
+    from services.compact_graph import CompactGraph, CompactGraphService
+    from services.persistence import current_snapshot
+    parser = argparse.ArgumentParser(description="Export the per-taxpayer feature table from the latest snapshot")
+    parser.add_argument("--data-dir", required=True, help="Data directory holding the snapshot")
+    parser.add_argument("--out", required=True, help="Output file: .parquet, .csv or .npz")
+    parser.add_argument("--by-period", action="store_true", help="One row per (gstin, period) instead of per gstin")
+    args = parser.parse_args(argv)
+
+    snapshot = current_snapshot(args.data_dir)
+    if snapshot is None:
+        parser.error(f"No snapshot in {args.data_dir}")
+    gs = CompactGraphService(CompactGraph.load(snapshot, mmap=True))
+    store = gs.features
+    if args.out.endswith(".npz"):
+        if args.by_period:
+            parser.error("--by-period exports to .parquet or .csv")
+        gstins, matrix = store.to_numpy(gs)
+        np.savez(args.out, gstin=np.array(gstins), features=matrix, columns=np.array(FEATURE_COLUMNS))
+    else:
+        frame = store.to_frame(gs, by_period=args.by_period)
+        if args.out.endswith(".csv"):
+            frame.to_csv(args.out, index=not args.by_period)
+        else:
+            frame.to_parquet(args.out)
+    print(f"Wrote features for {len(store.rows)} taxpayers from {os.path.basename(snapshot)} to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+"""
+Graph data for the frontend's explorer, at two levels of detail:
+
+  overview       taxpayers only, with invoices aggregated into weighted trade edges (the
+                 trade projection, or one period's), optionally cut down to the heaviest edges
+  neighbourhood  every node within `depth` hops of a start node, in breadth-first order, paged
+                 so a hub with tens of thousands of invoices streams in pieces
+
+Both come with 3-D coordinates. Taxpayers are laid out once per trade projection version
+(spectral embedding per connected component, components packed on a spiral) and the layout is
+cached process-wide. New taxpayers are placed next to their trading partners until they
+make up GST_EXPLORER_LAYOUT_REFRESH of the network; then the layout is recomputed. While a
+recomputation is running, other requests get the previous layout. Invoices sit between their
+supplier and buyer, and filings next to their invoice.
+
+Views are column tables and encode either as JSON (one array per column) or as a binary
+columnar format that a browser maps straight onto typed arrays:
+
+    "GSTC" | uint32 format version | uint32 header length | header JSON | column buffers
+
+The header is padded with spaces so the column buffers start on an 8-byte boundary. It
+holds "meta" and, per table, its "length" and per column {"dtype", "offset", "length"}.
+Offsets are in bytes from the start of the buffers. String columns (node ids) are a
+"uint32" offsets buffer of length + 1 entries into a UTF-8 "data" buffer. All numbers are
+little-endian.
+"""
+import json
+import math
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import networkx as nx
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse.linalg import eigsh
+import config
+from services.compact_graph import NODE_TYPES, RELATIONS, StringPool
+from services.graph_service import GraphService
+
+COLUMNAR_MAGIC = b"GSTC"
+COLUMNAR_VERSION = 1
+# Codes used by the type and relation columns; anything else is the last entry
+TYPE_NAMES = list(NODE_TYPES) + ["unknown"]
+RELATION_NAMES = list(RELATIONS) + ["unknown"]
+_TYPE_CODE = {name: i for i, name in enumerate(TYPE_NAMES)}
+_RELATION_CODE = {name: i for i, name in enumerate(RELATION_NAMES)}
+
+# Layout coordinates fit (mostly) within this radius
+LAYOUT_RADIUS = 100.0
+# Breadth-first walks kept for paging, most recently used last
+MAX_CACHED_WALKS = 32
+
+View = Dict[str, dict]
+
+def _jitter(key: str) -> np.ndarray:
+    """Deterministic offset in [-0.5, 0.5)^3 for a node id."""
+    h = zlib.crc32(key.encode("utf-8"))
+    return np.array([(h & 0x3FF), (h >> 10) & 0x3FF, (h >> 20) & 0x3FF], dtype=np.float64) / 1024.0 - 0.5
+
+def _sphere_points(n: int) -> np.ndarray:
+    """n points spread evenly over the unit sphere (Fibonacci lattice)."""
+    i = np.arange(n) + 0.5
+    polar = np.arccos(1 - 2 * i / n)
+    azimuth = math.pi * (1 + 5 ** 0.5) * i
+    return np.column_stack([np.cos(azimuth) * np.sin(polar), np.sin(azimuth) * np.sin(polar), np.cos(polar)])
+
+class Layout:
+    """3-D coordinates for the taxpayers of one trade projection version."""
+    def __init__(self, trade_version: int, keys: List[str], coords: np.ndarray, placed_since_full: int = 0):
+        self.trade_version = trade_version
+        self.keys = keys
+        self.coords = coords
+        self.index = {key: i for i, key in enumerate(keys)}
+        # Taxpayers placed incrementally since the last full layout
+        self.placed_since_full = placed_since_full
+
+    def position(self, key: str) -> np.ndarray:
+        i = self.index.get(key)
+        if i is not None:
+            return self.coords[i]
+        # Not in the trade projection (or newer than the layout): somewhere on the outer shell
+        direction = _jitter(key)
+        return direction / (np.linalg.norm(direction) or 1.0) * LAYOUT_RADIUS * 1.1
+
+def compute_layout(trade_graph: nx.DiGraph, trade_version: int = 0) -> Layout:
+    """Full layout: a spectral embedding of each connected component, packed on a spiral."""
+    keys = sorted(trade_graph.nodes)
+    n = len(keys)
+    coords = np.zeros((n, 3))
+    if n == 0:
+        return Layout(trade_version, keys, coords.astype(np.float32))
+    index = {key: i for i, key in enumerate(keys)}
+    rows, cols, weights = [], [], []
+    for u, v, count in trade_graph.edges(data="invoice_count", default=1):
+        if u != v:
+            rows.append(index[u])
+            cols.append(index[v])
+            weights.append(math.log1p(count or 1))
+    adjacency = sparse.coo_matrix((weights, (rows, cols)), shape=(n, n)).tocsr()
+    adjacency = (adjacency + adjacency.T).tocsr()
+
+    n_components, labels = csgraph.connected_components(adjacency, directed=False)
+    sizes = np.bincount(labels, minlength=n_components)
+    by_label = np.argsort(labels, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    golden = math.pi * (3 - 5 ** 0.5)
+    area = 0.0
+    for rank, component in enumerate(np.argsort(-sizes, kind="stable")):
+        members = by_label[starts[component]:starts[component] + sizes[component]]
+        m = len(members)
+        local = _embed(adjacency[members][:, members]) if m > 3 else _sphere_points(m) * 0.5
+        radius = 2.0 * m ** (1 / 3)
+        if rank == 0:
+            centre = np.zeros(3)
+        else:
+            distance = math.sqrt(area / math.pi) + radius
+            centre = np.array([distance * math.cos(rank * golden), 0.0, distance * math.sin(rank * golden)])
+        area += math.pi * radius ** 2
+        coords[members] = centre + local * radius
+    coords += np.array([_jitter(key) for key in keys]) * 0.5
+    # Scale so nearly every taxpayer falls within LAYOUT_RADIUS
+    spread = np.percentile(np.linalg.norm(coords - coords.mean(axis=0), axis=1), 99)
+    coords = (coords - coords.mean(axis=0)) * (LAYOUT_RADIUS / spread if spread > 0 else 1.0)
+    return Layout(trade_version, keys, coords.astype(np.float32))
+
+def _embed(adjacency: sparse.csr_matrix) -> np.ndarray:
+    """Spectral coordinates of one connected component: the 2nd-4th eigenvectors of its random walk."""
+    m = adjacency.shape[0]
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    scale = 1.0 / np.sqrt(np.maximum(degree, 1e-12))
+    normalised = sparse.diags(scale) @ adjacency @ sparse.diags(scale)
+    if m <= 500:
+        values, vectors = np.linalg.eigh(normalised.toarray())
+    else:
+        v0 = np.random.default_rng(0).standard_normal(m)
+        values, vectors = eigsh(normalised, k=4, which="LA", v0=v0, tol=1e-4, maxiter=m * 10)
+    vectors = vectors[:, np.argsort(-values)[1:4]] * scale[:, None]
+    vectors -= vectors.mean(axis=0)
+    std = vectors.std(axis=0)
+    vectors /= np.where(std > 0, std, 1.0)
+    # Low-degree nodes land far out on the eigenvectors; keep each node's direction and radial
+    # order, but spread the radii so the component fills a unit ball evenly
+    radius = np.linalg.norm(vectors, axis=1)
+    spread = ((np.argsort(np.argsort(radius, kind="stable")) + 0.5) / m) ** (1 / 3)
+    return vectors * (spread / np.where(radius > 0, radius, 1.0))[:, None]
+
+def extend_layout(layout: Layout, trade_graph: nx.DiGraph, trade_version: int) -> Layout:
+    """The layout with taxpayers that left the projection dropped and new ones placed next to their partners."""
+    keys = sorted(trade_graph.nodes)
+    coords = np.empty((len(keys), 3), dtype=np.float32)
+    placed: Dict[str, np.ndarray] = {}
+    pending = []
+    for i, key in enumerate(keys):
+        j = layout.index.get(key)
+        if j is not None:
+            placed[key] = coords[i] = layout.coords[j]
+        else:
+            pending.append(i)
+    new = len(pending)
+    # New taxpayers trading only with other new ones are placed once a partner has been;
+    # whoever is still unplaced after a few rounds goes on the outer shell
+    for _ in range(3):
+        deferred = []
+        for i in pending:
+            key = keys[i]
+            partners = [placed[p] for p in nx.all_neighbors(trade_graph, key) if p in placed]
+            if partners:
+                placed[key] = coords[i] = np.mean(partners, axis=0) + _jitter(key) * 4.0
+            else:
+                deferred.append(i)
+        pending = deferred
+    for i in pending:
+        coords[i] = layout.position(keys[i])
+    return Layout(trade_version, keys, coords, layout.placed_since_full + new)
+
+class LayoutCache:
+    """The most recent taxpayer layout in this process, shared by every request."""
+    def __init__(self, refresh: float = None):
+        self.refresh = config.EXPLORER_LAYOUT_REFRESH if refresh is None else refresh
+        self._layout: Optional[Layout] = None
+        self._lock = threading.Lock()
+
+    def get(self, gs: GraphService) -> Layout:
+        layout = self._layout
+        # A layout newer than the caller's pinned version is just as good for it
+        if layout is not None and layout.trade_version >= gs.trade_version:
+            return layout
+        # Someone else is already bringing it up to date; serve the previous one meanwhile
+        if not self._lock.acquire(blocking=layout is None):
+            return layout
+        try:
+            layout = self._layout
+            if layout is None or layout.trade_version < gs.trade_version:
+                layout = self._update(layout, gs.trade_graph, gs.trade_version)
+                self._layout = layout
+            return layout
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        with self._lock:
+            self._layout = None
+
+    def _update(self, layout: Optional[Layout], trade_graph: nx.DiGraph, trade_version: int) -> Layout:
+        if layout is not None:
+            new = sum(1 for key in trade_graph if key not in layout.index)
+            if layout.placed_since_full + new <= self.refresh * trade_graph.number_of_nodes():
+                return extend_layout(layout, trade_graph, trade_version)
+        return compute_layout(trade_graph, trade_version)
+
+layout_cache = LayoutCache()
+
+class GraphExplorer:
+    def __init__(self, graph_service: GraphService):
+        self.gs = graph_service
+
+    def overview(self, period: Optional[str] = None, min_invoices: int = 1, limit: Optional[int] = None) -> View:
+        """
+        Taxpayer-level view: trade edges with at least `min_invoices` invoices, the `limit`
+        heaviest by tax value, and the taxpayers they connect.
+        """
+        gs = self.gs
+        trade = gs.period_trade_graph(period) if period is not None else gs.trade_graph
+        edges = [(u, v, d) for u, v, d in trade.edges(data=True) if d["invoice_count"] >= min_invoices]
+        if limit is not None and len(edges) > limit:
+            edges.sort(key=lambda e: (-e[2]["tax_value"], e[0], e[1]))
+            edges = edges[:limit]
+        if limit is not None or min_invoices > 1:
+            nodes = sorted({u for u, _, _ in edges} | {v for _, v, _ in edges})
+        else:
+            nodes = sorted(trade.nodes)
+        row = {node: i for i, node in enumerate(nodes)}
+
+        invoices = np.zeros(len(nodes), dtype=np.uint32)
+        tax_value = np.zeros(len(nodes))
+        for u, _, d in edges:
+            invoices[row[u]] += d["invoice_count"]
+            tax_value[row[u]] += d["tax_value"]
+        from services.risk_service import RiskService
+        scores = RiskService(gs).calculate_risk_propagation()
+        layout = layout_cache.get(gs)
+        xyz = np.array([layout.position(node) for node in nodes], dtype=np.float32).reshape(-1, 3)
+        return {
+            "meta": {
+                "level": "taxpayer",
+                "period": period,
+                "graph_version": gs.version,
+                "trade_version": gs.trade_version,
+                "layout_version": layout.trade_version,
+            },
+            "tables": {
+                "nodes": {
+                    "id": nodes,
+                    "x": xyz[:, 0], "y": xyz[:, 1], "z": xyz[:, 2],
+                    "invoices": invoices,
+                    "tax_value": tax_value.astype(np.float32),
+                    "risk": np.array([scores.get(node, 0.0) for node in nodes], dtype=np.float32),
+                    "in_loop": np.array([gs.cycle_index.in_loop(node) for node in nodes], dtype=np.uint8),
+                },
+                "edges": {
+                    "source": np.array([row[u] for u, _, _ in edges], dtype=np.uint32),
+                    "target": np.array([row[v] for _, v, _ in edges], dtype=np.uint32),
+                    "invoice_count": np.array([d["invoice_count"] for _, _, d in edges], dtype=np.uint32),
+                    "taxable_value": np.array([d["taxable_value"] for _, _, d in edges], dtype=np.float32),
+                    "tax_value": np.array([d["tax_value"] for _, _, d in edges], dtype=np.float32),
+                },
+            },
+        }
+
+    def neighbourhood(self, start: str, depth: int = 1, cursor: int = 0, limit: int = 1000,
+                      relations: Optional[List[str]] = None, node_types: Optional[List[str]] = None) -> Optional[View]:
+        """
+        One page of the nodes within `depth` hops of `start` (None if it doesn't exist), in
+        breadth-first order from `cursor`. Nodes are identified across pages by their rank in
+        that order. Each edge comes with the page holding its later-ranked end, so a client
+        that keeps every page has every edge exactly once.
+        """
+        gs = self.gs
+        walk = self._walk(start, depth, relations, node_types)
+        if walk is None:
+            return None
+        order, rank, truncated = walk
+        page = order[cursor:cursor + limit]
+        relation_filter = set(relations) if relations is not None else None
+
+        sources, targets, edge_relations = [], [], []
+        for node, _ in page:
+            r = rank[node]
+            for direction in ("out", "in"):
+                for other, relation in gs._adjacent(node, direction):
+                    other_rank = rank.get(other)
+                    if other_rank is None or other_rank > r or (other_rank == r and direction == "in"):
+                        continue
+                    if relation_filter is not None and relation not in relation_filter:
+                        continue
+                    u, v = (r, other_rank) if direction == "out" else (other_rank, r)
+                    sources.append(u)
+                    targets.append(v)
+                    edge_relations.append(_RELATION_CODE.get(relation, len(RELATIONS)))
+
+        ids = [node for node, _ in page]
+        types = [(gs.get_node(node) or {}).get("type") for node in ids]
+        xyz = self._positions(ids, types).reshape(-1, 3)
+        next_cursor = cursor + len(page) if cursor + len(page) < len(order) else None
+        return {
+            "meta": {
+                "level": "detail",
+                "start": start,
+                "depth": depth,
+                "cursor": cursor,
+                "next_cursor": next_cursor,
+                "total": len(order),
+                "truncated": truncated,
+                "graph_version": gs.version,
+                "types": TYPE_NAMES,
+                "relations": RELATION_NAMES,
+            },
+            "tables": {
+                "nodes": {
+                    "id": ids,
+                    "rank": np.arange(cursor, cursor + len(page), dtype=np.uint32),
+                    "type": np.array([_TYPE_CODE.get(t, len(NODE_TYPES)) for t in types], dtype=np.uint8),
+                    "depth": np.array([d for _, d in page], dtype=np.uint8),
+                    "x": xyz[:, 0], "y": xyz[:, 1], "z": xyz[:, 2],
+                },
+                "edges": {
+                    "source": np.array(sources, dtype=np.uint32),
+                    "target": np.array(targets, dtype=np.uint32),
+                    "relation": np.array(edge_relations, dtype=np.uint8),
+                },
+            },
+        }
+
+    def _walk(self, start, depth, relations, node_types):
+        # Pages of one expansion share a walk, cached against the graph version
+        key = (self.gs.version, start, depth, tuple(relations or ()), tuple(node_types or ()))
+        with _walks_lock:
+            walk = _walks.get(key)
+            if walk is not None:
+                _walks.move_to_end(key)
+                return walk
+        if self.gs.get_node(start) is None:
+            return None
+        order = [(node, d) for node, d, _ in self.gs.traverse(start, max_depth=depth, relations=relations,
+                                                               node_types=node_types, max_nodes=config.EXPLORER_MAX_NODES + 1)]
+        truncated = len(order) > config.EXPLORER_MAX_NODES
+        order = order[:config.EXPLORER_MAX_NODES]
+        walk = (order, {node: i for i, (node, _) in enumerate(order)}, truncated)
+        with _walks_lock:
+            _walks[key] = walk
+            while len(_walks) > MAX_CACHED_WALKS:
+                _walks.popitem(last=False)
+        return walk
+
+    def _positions(self, ids: List[str], types: List[Optional[str]]) -> np.ndarray:
+        layout = layout_cache.get(self.gs)
+        index = self.gs.index
+        invoices: Dict[str, np.ndarray] = {}
+
+        def invoice_position(invoice: str) -> np.ndarray:
+            if invoice not in invoices:
+                parties = index.sources("SUPPLIED_BY", invoice)[:1] + index.targets("PURCHASED_BY", invoice)[:1]
+                centre = np.mean([layout.position(p) for p in parties], axis=0) if parties else layout.position(invoice)
+                invoices[invoice] = centre + _jitter(invoice) * 2.0
+            return invoices[invoice]
+
+        xyz = np.empty((len(ids), 3), dtype=np.float32)
+        for i, (node, node_type) in enumerate(zip(ids, types)):
+            if node_type == "Taxpayer":
+                xyz[i] = layout.position(node)
+            elif node_type == "Invoice":
+                xyz[i] = invoice_position(node)
+            else:
+                # Filings hang off the invoice they file
+                invoice = next((u for u, _ in self.gs._adjacent(node, "in") if u.startswith("Invoice:")), None)
+                xyz[i] = (invoice_position(invoice) if invoice else layout.position(node)) + _jitter(node)
+        return xyz
+
+_walks: "OrderedDict[tuple, tuple]" = OrderedDict()
+_walks_lock = threading.Lock()
+
+# Encodings
+
+def encode_json(view: View) -> bytes:
+    """The view with one array per column; coordinates and amounts rounded to 3 decimals."""
+    tables = {}
+    for name, columns in view["tables"].items():
+        table = {}
+        for column, values in columns.items():
+            if isinstance(values, np.ndarray) and values.dtype.kind == "f":
+                table[column] = np.round(values.astype(np.float64), 3).tolist()
+            elif isinstance(values, np.ndarray):
+                table[column] = values.tolist()
+            else:
+                table[column] = list(values)
+        tables[name] = table
+    return json.dumps({"meta": view["meta"], "tables": tables}, separators=(",", ":")).encode("utf-8")
+
+def encode_columnar(view: View) -> bytes:
+    """The binary columnar encoding described in the module docstring."""
+    buffers: List[bytes] = []
+    offset = 0
+
+    def add(array: np.ndarray) -> dict:
+        nonlocal offset
+        data = np.ascontiguousarray(array).astype(array.dtype.newbyteorder("<"), copy=False).tobytes()
+        entry = {"dtype": array.dtype.name, "offset": offset, "length": int(len(array))}
+        padding = -len(data) % 8
+        buffers.append(data + b"\0" * padding)
+        offset += len(data) + padding
+        return entry
+
+    tables = {}
+    for name, columns in view["tables"].items():
+        length = None
+        described = {}
+        for column, values in columns.items():
+            if isinstance(values, np.ndarray):
+                described[column] = add(values)
+                length = len(values)
+            else:
+                pool = StringPool.from_strings(list(values))
+                described[column] = {"dtype": "string", "offsets": add(pool.offsets.astype(np.uint32)),
+                                     "data": add(pool.blob.astype(np.uint8))}
+                length = len(values)
+        tables[name] = {"length": length or 0, "columns": described}
+
+    header = json.dumps({"meta": view["meta"], "tables": tables}, separators=(",", ":")).encode("utf-8")
+    header += b" " * (-(12 + len(header)) % 8)
+    prefix = COLUMNAR_MAGIC + np.array([COLUMNAR_VERSION, len(header)], dtype="<u4").tobytes()
+    return b"".join([prefix, header] + buffers)
+
+def decode_columnar(data: bytes) -> View:
+    """Inverse of encode_columnar (for tests and Python clients); numeric columns are zero-copy views."""
+    if data[:4] != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar graph view")
+    version, header_length = np.frombuffer(data, dtype="<u4", count=2, offset=4).tolist()
+    if version != COLUMNAR_VERSION:
+        raise ValueError(f"Unsupported columnar format version {version}")
+    header = json.loads(data[12:12 + header_length])
+    base = 12 + header_length
+
+    def read(entry: dict) -> np.ndarray:
+        return np.frombuffer(data, dtype=np.dtype(entry["dtype"]).newbyteorder("<"), count=entry["length"],
+                             offset=base + entry["offset"])
+
+    tables = {}
+    for name, table in header["tables"].items():
+        columns = {}
+        for column, entry in table["columns"].items():
+            if entry["dtype"] == "string":
+                columns[column] = StringPool(read(entry["data"]), read(entry["offsets"]).astype(np.int64)).to_list()
+            else:
+                columns[column] = read(entry)
+        tables[name] = columns
+    return {"meta": header["meta"], "tables": tables}
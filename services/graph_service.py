@@ -1,5 +1,11 @@
 import networkx as nx
 import logging
+import os
+import shutil
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from services.cycle_index import CycleIndex
+from services.feature_store import FeatureStore
 
 logger = logging.getLogger(__name__)
 
@@ -8,19 +14,187 @@ logger = logging.getLogger(__name__)
 # For this hackathon/demo, we use an in-memory NetworkX DiGraph.
 gst_graph = nx.DiGraph()
 
+class GraphIndex:
+    """
+    Per-relation forward (source -> targets) and reverse (target -> sources) adjacency,
+    plus Invoice membership per period. Kept in step with the graph by GraphService's
+    add_* methods so that hop lookups never scan the edge list.
+    Inner dicts are used as insertion-ordered sets.
+    """
+    def __init__(self):
+        self.forward: Dict[str, Dict[str, Dict[str, None]]] = {}
+        self.reverse: Dict[str, Dict[str, Dict[str, None]]] = {}
+        self.invoices_by_period: Dict[str, Dict[str, None]] = {}
+
+    @classmethod
+    def from_graph(cls, graph: nx.DiGraph) -> "GraphIndex":
+        index = cls()
+        for u, v, attrs in graph.edges(data=True):
+            if attrs.get("relation"):
+                index.add_edge(u, v, attrs["relation"])
+        for node_id, attrs in graph.nodes(data=True):
+            if attrs.get("type") == "Invoice":
+                index.set_period(node_id, attrs.get("period"))
+        return index
+
+    def add_edge(self, u: str, v: str, relation: str):
+        self.forward.setdefault(relation, {}).setdefault(u, {})[v] = None
+        self.reverse.setdefault(relation, {}).setdefault(v, {})[u] = None
+
+    def remove_edge(self, u: str, v: str, relation: str):
+        self.forward.get(relation, {}).get(u, {}).pop(v, None)
+        self.reverse.get(relation, {}).get(v, {}).pop(u, None)
+
+    def targets(self, relation: str, u: str) -> List[str]:
+        return list(self.forward.get(relation, {}).get(u, ()))
+
+    def sources(self, relation: str, v: str) -> List[str]:
+        return list(self.reverse.get(relation, {}).get(v, ()))
+
+    def copy(self) -> "GraphIndex":
+        index = GraphIndex()
+        index.forward = {r: {u: dict(vs) for u, vs in adj.items()} for r, adj in self.forward.items()}
+        index.reverse = {r: {v: dict(us) for v, us in adj.items()} for r, adj in self.reverse.items()}
+        index.invoices_by_period = {p: dict(invoices) for p, invoices in self.invoices_by_period.items()}
+        return index
+
+    def set_period(self, invoice_node: str, period: Optional[str], previous: Optional[str] = None):
+        if previous is not None and previous != period:
+            self.invoices_by_period.get(previous, {}).pop(invoice_node, None)
+        if period is not None:
+            self.invoices_by_period.setdefault(period, {})[invoice_node] = None
+
 class GraphService:
-    def __init__(self, graph: nx.DiGraph = gst_graph):
+    # Read views (see services/graph_store.py) are pinned by other requests and must not change
+    read_only = False
+
+    def __init__(self, graph: nx.DiGraph = gst_graph, read_only: bool = False):
         self.g = graph
+        self.read_only = read_only
+        # The index lives in the graph's own attribute dict so every GraphService
+        # wrapping the same graph (one is built per request) shares it.
+        if "index" not in self.g.graph:
+            self.g.graph["index"] = GraphIndex.from_graph(self.g)
+        self.index: GraphIndex = self.g.graph["index"]
+        if "trade_graph" not in self.g.graph:
+            self.cycle_index = None
+            self.g.graph["trade_graph"] = self._build_trade_graph()
+        self.trade_graph: nx.DiGraph = self.g.graph["trade_graph"]
+        if "cycle_index" not in self.g.graph:
+            self.g.graph["cycle_index"] = CycleIndex(self.trade_graph)
+        self.cycle_index: CycleIndex = self.g.graph["cycle_index"]
+        if "features" not in self.g.graph:
+            self.g.graph["features"] = FeatureStore()
+        self.features: FeatureStore = self.g.graph["features"]
+
+    @property
+    def version(self) -> int:
+        """Mutation counter for the whole graph; bumped by every add_* call."""
+        return self.g.graph.get("version", 0)
+
+    @property
+    def trade_version(self) -> int:
+        """Mutation counter for the trade projection and taxpayer risk scores."""
+        return self.trade_graph.graph.get("version", 0)
+
+    def _touch(self, trade: bool = False):
+        if self.read_only:
+            raise RuntimeError("Cannot modify a read-only graph view")
+        self.g.graph["version"] = self.g.graph.get("version", 0) + 1
+        if trade:
+            self.trade_graph.graph["version"] = self.trade_graph.graph.get("version", 0) + 1
+
+    def _changed(self, invoice_node: Optional[str] = None, nodes: Iterable[str] = (), taxpayers: Iterable[str] = (),
+                 trade_edge: Optional[Tuple[str, str]] = None):
+        """
+        Records what the current write touched, for GraphStore's publish listeners: nodes
+        written, taxpayers whose features they affect and trade edges added (a removed edge
+        only records its taxpayers). An invoice brings its supplier and buyer along.
+        Outside a GraphStore write block nothing is recorded.
+        """
+        changes = self.g.graph.get("changes")
+        if changes is None:
+            return
+        taxpayers = set(taxpayers)
+        if invoice_node is not None:
+            changes["nodes"].add(invoice_node)
+            taxpayers.update(self.index.sources("SUPPLIED_BY", invoice_node))
+            taxpayers.update(self.index.targets("PURCHASED_BY", invoice_node))
+        changes["nodes"].update(nodes)
+        changes["taxpayers"].update(taxpayers)
+        if trade_edge is not None:
+            changes["trade_edges"].add(trade_edge)
+
+    def _changed_everything(self):
+        changes = self.g.graph.get("changes")
+        if changes is not None:
+            changes["all"] = True
 
     def clear_graph(self):
         """Clear the entire graph (useful for testing)"""
+        version, trade_version = self.version, self.trade_version
+        self._changed_everything()
+        changes = self.g.graph.get("changes")
         self.g.clear()
+        if changes is not None:
+            # Kept for the enclosing GraphStore write block
+            self.g.graph["changes"] = changes
+        # Counters keep increasing across a clear so version-keyed caches never see a reused number
+        self.g.graph["version"] = version + 1
+        self.g.graph["index"] = self.index = GraphIndex()
+        self.g.graph["trade_graph"] = self.trade_graph = nx.DiGraph(version=trade_version + 1)
+        self.g.graph["cycle_index"] = self.cycle_index = CycleIndex(self.trade_graph)
+        self.g.graph["features"] = self.features = FeatureStore()
+
+    def fork(self) -> nx.DiGraph:
+        """
+        Independent copy of the graph with its own index, trade projection and cycle index, for
+        copy-on-write. Version-keyed caches are carried over so the copy keeps their warm start.
+        """
+        g = self.g
+        copy = g.__class__()
+        # Copy the adjacency dicts directly (each edge's attribute dict is shared by succ and pred);
+        # this is about twice as fast as nx's copy(), which re-adds every edge
+        copy._node = {n: attrs.copy() for n, attrs in g._node.items()}
+        copy._succ = copy._adj = {u: {v: attrs.copy() for v, attrs in nbrs.items()} for u, nbrs in g._succ.items()}
+        pred = {v: {} for v in g._pred}
+        for u, nbrs in copy._succ.items():
+            for v, attrs in nbrs.items():
+                pred[v][u] = attrs
+        copy._pred = pred
+        copy.graph.update(g.graph)
+        trade_graph = self.trade_graph.copy()
+        copy.graph["index"] = self.index.copy()
+        copy.graph["trade_graph"] = trade_graph
+        copy.graph["cycle_index"] = self.cycle_index.copy(trade_graph)
+        copy.graph["features"] = self.features.copy()
+        for cache in ("propagation_cache", "period_trade_graphs", "ledger_frames"):
+            if cache in g.graph:
+                copy.graph[cache] = dict(g.graph[cache])
+        return copy
+
+    def _link(self, u: str, v: str, relation: str):
+        """Add a typed edge and record it in the relation index."""
+        previous = self.g.edges[u, v].get("relation") if self.g.has_edge(u, v) else None
+        if previous is not None and previous != relation:
+            self.index.remove_edge(u, v, previous)
+        self.g.add_edge(u, v, relation=relation)
+        self.index.add_edge(u, v, relation)
+
+    def _unlink(self, u: str, v: str, relation: str):
+        if self.g.has_edge(u, v):
+            self.g.remove_edge(u, v)
+        self.index.remove_edge(u, v, relation)
 
     def add_taxpayer(self, gstin: str, attributes: dict = None):
         if attributes is None:
             attributes = {}
         attributes.update({"type": "Taxpayer", "gstin": gstin})
+        # Risk scores seed propagation, so changing one invalidates the trade projection's version
+        self._touch(trade="risk_score" in attributes)
         self.g.add_node(f"Taxpayer:{gstin}", **attributes)
+        if "risk_score" in attributes:
+            self._changed(taxpayers=[f"Taxpayer:{gstin}"])
 
     def add_invoice(self, invoice_id: str, supplier_gstin: str, buyer_gstin: str, period: str, attributes: dict = None):
         if attributes is None:
@@ -32,55 +206,218 @@ class GraphService:
             "financial_value": attributes.get("tax_value", 0.0)
         })
         node_id = f"Invoice:{invoice_id}"
+        self._touch(trade=True)
+        previous_period = self.g.nodes[node_id].get("period") if self.g.has_node(node_id) else None
+        # Take the invoice's old contribution out of the trade projection before overwriting it
+        self._changed(node_id)
+        self._trade_apply(node_id, -1)
         self.g.add_node(node_id, **attributes)
+        self.index.set_period(node_id, period, previous=previous_period)
         
         # Ensure taxpayers exist
         self.add_taxpayer(supplier_gstin)
         self.add_taxpayer(buyer_gstin)
         
+        # Re-ingesting an invoice with corrected parties replaces the old links
+        supplier_node, buyer_node = f"Taxpayer:{supplier_gstin}", f"Taxpayer:{buyer_gstin}"
+        for old in self.index.sources("SUPPLIED_BY", node_id):
+            if old != supplier_node:
+                self._unlink(old, node_id, "SUPPLIED_BY")
+        for old in self.index.targets("PURCHASED_BY", node_id):
+            if old != buyer_node:
+                self._unlink(node_id, old, "PURCHASED_BY")
+
         # Create relationships
-        self.g.add_edge(f"Taxpayer:{supplier_gstin}", node_id, relation="SUPPLIED_BY")
-        self.g.add_edge(node_id, f"Taxpayer:{buyer_gstin}", relation="PURCHASED_BY")
+        self._link(supplier_node, node_id, "SUPPLIED_BY")
+        self._link(node_id, buyer_node, "PURCHASED_BY")
+        self._trade_apply(node_id, +1)
+        self._changed(node_id)
+        self.features.on_invoice_changed(node_id)
+
+    # Taxpayer -> Taxpayer trade projection. One edge per (supplier, buyer) pair carrying
+    # invoice_count, taxable_value (sum of invoice total_value) and tax_value; risk
+    # algorithms read this instead of re-deriving it from the invoice layer.
+
+    def _build_trade_graph(self) -> nx.DiGraph:
+        self.trade_graph = nx.DiGraph()
+        for node_id, attrs in self.g.nodes(data=True):
+            if attrs.get("type") == "Invoice":
+                self._trade_apply(node_id, +1)
+        return self.trade_graph
+
+    def _trade_apply(self, invoice_node: str, sign: int):
+        """Add (sign=+1) or remove (sign=-1) one invoice's contribution to the trade projection."""
+        suppliers = self.index.sources("SUPPLIED_BY", invoice_node)
+        buyers = self.index.targets("PURCHASED_BY", invoice_node)
+        if not suppliers or not buyers:
+            return
+        attrs = self.g.nodes[invoice_node]
+        supplier, buyer = suppliers[0], buyers[0]
+        if sign > 0 and not self.trade_graph.has_edge(supplier, buyer):
+            self.trade_graph.add_edge(supplier, buyer, invoice_count=0, taxable_value=0.0, tax_value=0.0)
+            self._changed(taxpayers=[supplier, buyer], trade_edge=(supplier, buyer))
+            if self.cycle_index is not None:
+                self.cycle_index.on_edge_added(supplier, buyer)
+        elif sign < 0 and not self.trade_graph.has_edge(supplier, buyer):
+            return
+
+        edge = self.trade_graph.edges[supplier, buyer]
+        edge["invoice_count"] += sign
+        edge["taxable_value"] += sign * float(attrs.get("total_value", 0.0) or 0.0)
+        edge["tax_value"] += sign * float(attrs.get("tax_value", 0.0) or 0.0)
+        if edge["invoice_count"] <= 0:
+            self.trade_graph.remove_edge(supplier, buyer)
+            self._changed(taxpayers=[supplier, buyer])
+            if self.cycle_index is not None:
+                self.cycle_index.on_edge_removed(supplier, buyer)
+            for taxpayer in (supplier, buyer):
+                if self.trade_graph.has_node(taxpayer) and self.trade_graph.degree(taxpayer) == 0:
+                    self.trade_graph.remove_node(taxpayer)
+
+    def period_trade_graph(self, period: str) -> nx.DiGraph:
+        """
+        The trade projection restricted to one period's invoices, built from the period index.
+        Cached per period against the trade projection's version; treat it as read-only.
+        """
+        cache = self.g.graph.setdefault("period_trade_graphs", {})
+        cached = cache.get(period)
+        if cached is not None and cached.graph["version"] == self.trade_version:
+            return cached
+        period_graph = nx.DiGraph(version=self.trade_version)
+        for invoice_node in list(self.index.invoices_by_period.get(period, ())):
+            suppliers = self.index.sources("SUPPLIED_BY", invoice_node)
+            buyers = self.index.targets("PURCHASED_BY", invoice_node)
+            if not suppliers or not buyers:
+                continue
+            attrs = self.g.nodes[invoice_node]
+            u, v = suppliers[0], buyers[0]
+            if not period_graph.has_edge(u, v):
+                period_graph.add_edge(u, v, invoice_count=0, taxable_value=0.0, tax_value=0.0)
+            edge = period_graph.edges[u, v]
+            edge["invoice_count"] += 1
+            edge["taxable_value"] += float(attrs.get("total_value", 0.0) or 0.0)
+            edge["tax_value"] += float(attrs.get("tax_value", 0.0) or 0.0)
+        cache[period] = period_graph
+        return period_graph
+
+    def get_trade_edge(self, supplier_gstin: str, buyer_gstin: str) -> Optional[dict]:
+        """Aggregated trade between two taxpayers: invoice_count, taxable_value, tax_value."""
+        u, v = f"Taxpayer:{supplier_gstin}", f"Taxpayer:{buyer_gstin}"
+        if self.trade_graph.has_edge(u, v):
+            return self.trade_graph.edges[u, v]
+        return None
+
+    def is_in_trade_loop(self, gstin: str) -> bool:
+        """O(1) check whether the taxpayer sits on any circular trading loop."""
+        return self.cycle_index.in_loop(f"Taxpayer:{gstin}")
 
     def add_gstr1_entry(self, invoice_id: str, supplier_gstin: str, period: str, attributes: dict = None):
         if attributes is None:
             attributes = {}
         node_id = f"GSTR1:{supplier_gstin}:{period}:{invoice_id}"
+        self._touch()
         attributes.update({"type": "GSTR1", "period": period})
         self.g.add_node(node_id, **attributes)
         
         # Edge from Invoice to GSTR1
-        self.g.add_edge(f"Invoice:{invoice_id}", node_id, relation="REPORTED_IN")
-        self.g.add_edge(f"Taxpayer:{supplier_gstin}", node_id, relation="FILED_BY")
+        self._link(f"Invoice:{invoice_id}", node_id, "REPORTED_IN")
+        self._link(f"Taxpayer:{supplier_gstin}", node_id, "FILED_BY")
+        self._changed(f"Invoice:{invoice_id}", nodes=[node_id])
+        self.features.on_invoice_changed(f"Invoice:{invoice_id}")
 
     def add_gstr2b_entry(self, invoice_id: str, buyer_gstin: str, period: str, attributes: dict = None):
         if attributes is None:
             attributes = {}
         node_id = f"GSTR2B:{buyer_gstin}:{period}:{invoice_id}"
+        self._touch()
         attributes.update({"type": "GSTR2B", "period": period})
         self.g.add_node(node_id, **attributes)
         
         # Edge from Invoice to GSTR2B
-        self.g.add_edge(f"Invoice:{invoice_id}", node_id, relation="REFLECTED_IN")
-        self.g.add_edge(node_id, f"Taxpayer:{buyer_gstin}", relation="CLAIMED_IN")
+        self._link(f"Invoice:{invoice_id}", node_id, "REFLECTED_IN")
+        self._link(node_id, f"Taxpayer:{buyer_gstin}", "CLAIMED_IN")
+        self._changed(f"Invoice:{invoice_id}", nodes=[node_id])
+        self.features.on_invoice_changed(f"Invoice:{invoice_id}")
 
     def add_purchase_register_entry(self, invoice_id: str, buyer_gstin: str, period: str, attributes: dict = None):
         if attributes is None:
             attributes = {}
         node_id = f"PR:{buyer_gstin}:{period}:{invoice_id}"
+        self._touch()
         attributes.update({"type": "PurchaseRegister", "period": period})
         self.g.add_node(node_id, **attributes)
         
-        self.g.add_edge(f"Invoice:{invoice_id}", node_id, relation="RECORDED_IN_PR")
+        self._link(f"Invoice:{invoice_id}", node_id, "RECORDED_IN_PR")
+        self._changed(f"Invoice:{invoice_id}", nodes=[node_id])
+        self.features.on_invoice_changed(f"Invoice:{invoice_id}")
 
     def add_einvoice_entry(self, irn: str, invoice_id: str, attributes: dict = None):
         if attributes is None:
             attributes = {}
         node_id = f"EInvoice:{irn}"
+        self._touch()
         attributes.update({"type": "EInvoice", "irn": irn})
         self.g.add_node(node_id, **attributes)
         
-        self.g.add_edge(f"Invoice:{invoice_id}", node_id, relation="GENERATED_IRN")
+        self._link(f"Invoice:{invoice_id}", node_id, "GENERATED_IRN")
+        self._changed(f"Invoice:{invoice_id}", nodes=[node_id])
+        self.features.on_invoice_changed(f"Invoice:{invoice_id}")
+
+    def add_bulk(self, nodes: Iterable[Tuple[str, dict]], edges: Iterable[Tuple[str, str, str]]):
+        """
+        Bulk insert used by the offline loader. `nodes` are (node_id, attributes) pairs with the
+        same attributes the add_* methods would set, `edges` are (source, target, relation).
+        Goes through add_nodes_from/add_edges_from and folds new invoices into the indexes and
+        trade projection in one pass. Invoices that already exist must go through add_invoice,
+        which knows how to replace their old links.
+        """
+        nodes = list(nodes)
+        edges = list(edges)
+        self._touch(trade=True)
+        self._changed_everything()
+        self.g.add_nodes_from(nodes)
+        self.g.add_edges_from((u, v, {"relation": relation}) for u, v, relation in edges)
+        for u, v, relation in edges:
+            self.index.add_edge(u, v, relation)
+
+        # One SCC (and feature) rebuild on the next query is cheaper than incremental updates per edge
+        self.cycle_index.invalidate()
+        self.features.invalidate()
+        for node_id, attrs in nodes:
+            if attrs.get("type") == "Invoice":
+                self.index.set_period(node_id, attrs.get("period"))
+                self._trade_apply(node_id, +1)
+
+    def save_snapshot(self, path: str):
+        """
+        Write the graph to directory `path` in the compact columnar format
+        (see services/compact_graph.py). The directory is swapped in atomically.
+        """
+        from services.compact_graph import CompactGraph
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        CompactGraph.from_graph(self.g).save(tmp_path)
+        old_path = f"{path}.old"
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def load_snapshot(self, path: str):
+        """Replace the graph's contents with a snapshot written by save_snapshot (arrays are memory-mapped)."""
+        from services.compact_graph import CompactGraph
+        version = self.version
+        self._changed_everything()
+        changes = self.g.graph.get("changes")
+        CompactGraph.load(path, mmap=True).to_graph(self.g)
+        if changes is not None:
+            self.g.graph["changes"] = changes
+        self.g.graph["version"] = max(version, self.g.graph.get("version", 0)) + 1
+        self.index = self.g.graph["index"]
+        self.trade_graph = self.g.graph["trade_graph"]
+        self.cycle_index = self.g.graph["cycle_index"]
+        self.features = self.g.graph["features"]
+        logger.info("Loaded graph snapshot %s: %d nodes, %d edges", path, self.g.number_of_nodes(), self.g.number_of_edges())
 
     def get_subgraph_for_invoice(self, invoice_id: str, depth: int = 3) -> nx.DiGraph:
         """Extract a local centered subgraph around the invoice for targeted analysis."""
@@ -88,11 +425,157 @@ class GraphService:
         if not self.g.has_node(node_id):
             return nx.DiGraph() # return empty
         
-        # Compute ego graph undirected to capture incoming and outgoing relationships
-        ego = nx.ego_graph(self.g.to_undirected(), node_id, radius=depth)
-        # Return the directed subgraph representing these nodes
-        return self.g.subgraph(ego.nodes())
-        
+        # Walk incoming and outgoing relationships directly; the result is a read-only view
+        return self.neighbourhood(node_id, max_depth=depth)
+
+    def traverse(
+        self,
+        start: str,
+        max_depth: int = 2,
+        relations: Optional[Iterable[str]] = None,
+        node_types: Optional[Iterable[str]] = None,
+        direction: str = "both",
+        max_nodes: Optional[int] = None,
+    ) -> Iterator[Tuple[str, int, Tuple[str, ...]]]:
+        """
+        Breadth-first walk from `start` over predecessors and/or successors without copying the graph.
+        Yields (node_id, depth, path) where path is the chain of node ids from `start`.
+        - relations: only follow edges whose relation is in this set
+        - node_types: only visit (and expand through) nodes of these types; `start` is always visited
+        - direction: "out", "in" or "both"
+        - max_nodes: stop after this many nodes have been yielded
+        """
+        if not self.g.has_node(start):
+            return
+        if direction not in ("out", "in", "both"):
+            raise ValueError(f"Unknown traversal direction: {direction}")
+        relations = set(relations) if relations is not None else None
+        node_types = set(node_types) if node_types is not None else None
+
+        seen = {start}
+        frontier = deque([(start, 0, (start,))])
+        yielded = 0
+        while frontier:
+            node, depth, path = frontier.popleft()
+            yield node, depth, path
+            yielded += 1
+            if max_nodes is not None and yielded >= max_nodes:
+                return
+            if depth >= max_depth:
+                continue
+            for neighbour, relation in self._adjacent(node, direction):
+                if neighbour in seen:
+                    continue
+                if relations is not None and relation not in relations:
+                    continue
+                if node_types is not None and self.g.nodes[neighbour].get("type") not in node_types:
+                    continue
+                seen.add(neighbour)
+                frontier.append((neighbour, depth + 1, path + (neighbour,)))
+
+    def neighbourhood(self, start: str, max_depth: int = 2, **filters) -> nx.DiGraph:
+        """Read-only subgraph view over the nodes reached by `traverse` (accepts the same filters)."""
+        return self.g.subgraph(node for node, _, _ in self.traverse(start, max_depth=max_depth, **filters))
+
+    def _adjacent(self, node_id: str, direction: str) -> Iterator[Tuple[str, Optional[str]]]:
+        """(neighbour, relation) pairs for one node, read straight from the adjacency dicts."""
+        if direction in ("out", "both"):
+            for v, attrs in self.g.succ[node_id].items():
+                yield v, attrs.get("relation")
+        if direction in ("in", "both"):
+            for u, attrs in self.g.pred[node_id].items():
+                yield u, attrs.get("relation")
+
+    def successors_by_relation(self, node_id: str, relation: str) -> List[str]:
+        """Direct out-neighbours of `node_id` over edges of the given relation (index lookup)."""
+        return self.index.targets(relation, node_id)
+
+    def predecessors_by_relation(self, node_id: str, relation: str) -> List[str]:
+        """Direct in-neighbours of `node_id` over edges of the given relation (index lookup)."""
+        return self.index.sources(relation, node_id)
+
+    # Typed hop lookups. Invoice/taxpayer arguments are raw ids (no "Invoice:" prefix);
+    # filing lookups return node ids.
+
+    def get_invoice_supplier(self, invoice_id: str) -> Optional[str]:
+        """GSTIN of the invoice's supplier, or None if unknown."""
+        suppliers = self.index.sources("SUPPLIED_BY", f"Invoice:{invoice_id}")
+        return suppliers[0].split(":", 1)[1] if suppliers else None
+
+    def get_invoice_buyer(self, invoice_id: str) -> Optional[str]:
+        """GSTIN of the invoice's buyer, or None if unknown."""
+        buyers = self.index.targets("PURCHASED_BY", f"Invoice:{invoice_id}")
+        return buyers[0].split(":", 1)[1] if buyers else None
+
+    def get_gstr1_entries(self, invoice_id: str) -> List[str]:
+        return self.index.targets("REPORTED_IN", f"Invoice:{invoice_id}")
+
+    def get_gstr2b_entries(self, invoice_id: str) -> List[str]:
+        return self.index.targets("REFLECTED_IN", f"Invoice:{invoice_id}")
+
+    def get_purchase_register_entries(self, invoice_id: str) -> List[str]:
+        return self.index.targets("RECORDED_IN_PR", f"Invoice:{invoice_id}")
+
+    def get_einvoice_entries(self, invoice_id: str) -> List[str]:
+        return self.index.targets("GENERATED_IRN", f"Invoice:{invoice_id}")
+
+    def get_invoices_supplied_by(self, gstin: str) -> List[str]:
+        """Invoice ids where `gstin` is the supplier."""
+        return [n.split(":", 1)[1] for n in self.index.targets("SUPPLIED_BY", f"Taxpayer:{gstin}")]
+
+    def get_invoices_purchased_by(self, gstin: str) -> List[str]:
+        """Invoice ids where `gstin` is the buyer."""
+        return [n.split(":", 1)[1] for n in self.index.sources("PURCHASED_BY", f"Taxpayer:{gstin}")]
+
+    def get_invoices_for_period(self, period: str) -> List[str]:
+        """Invoice ids filed under `period`."""
+        return [n.split(":", 1)[1] for n in self.index.invoices_by_period.get(period, ())]
+
+    def iter_invoices(self, period: Optional[str] = None, gstin: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Yields (node_id, attributes) for every Invoice node, optionally restricted to a
+        period and to invoices where `gstin` is the supplier or the buyer.
+        Candidates come from the indexes, so only matching invoices are visited.
+        """
+        if gstin is not None:
+            taxpayer = f"Taxpayer:{gstin}"
+            candidates = dict.fromkeys(self.index.targets("SUPPLIED_BY", taxpayer))
+            candidates.update(dict.fromkeys(self.index.sources("PURCHASED_BY", taxpayer)))
+        elif period is not None:
+            candidates = self.index.invoices_by_period.get(period, {})
+        else:
+            candidates = (n for n, attrs in self.g.nodes(data=True) if attrs.get("type") == "Invoice")
+
+        for node_id in list(candidates):
+            attrs = self.g.nodes[node_id] if self.g.has_node(node_id) else None
+            if not attrs or attrs.get("type") != "Invoice":
+                continue
+            if period is not None and attrs.get("period") != period:
+                continue
+            yield node_id, attrs
+
+    def graph_counts(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """(nodes by type, edges by relation), cached against the graph version."""
+        cached = self.g.graph.get("graph_counts")
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        nodes: Dict[str, int] = {}
+        for _, node_type in self.g.nodes(data="type"):
+            nodes[node_type or "unknown"] = nodes.get(node_type or "unknown", 0) + 1
+        # Typed edges are all in the relation index, so only untyped ones need the edge count
+        edges = {relation: sum(len(targets) for targets in adjacency.values())
+                 for relation, adjacency in self.index.forward.items()}
+        edges = {relation: count for relation, count in edges.items() if count}
+        untyped = self.g.number_of_edges() - sum(edges.values())
+        if untyped > 0:
+            edges["unknown"] = untyped
+        self.g.graph["graph_counts"] = (self.version, (nodes, edges))
+        return nodes, edges
+
+    def get_vendor_features(self, gstin: str) -> dict:
+        """Materialised vendor-risk features for a taxpayer (see services/feature_store.py)."""
+        return self.features.get(self, gstin)
+
     def get_node(self, node_id: str) -> dict:
         if self.g.has_node(node_id):
             return self.g.nodes[node_id]
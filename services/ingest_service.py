@@ -0,0 +1,114 @@
+import time
+from typing import Dict, Iterable, List, Type
+import pandas as pd
+from pydantic import BaseModel
+from models.schemas import GSTR1Record, GSTR2BRecord, PurchaseRegisterEntry, EInvoiceRecord, Invoice
+from services.graph_service import GraphService
+from services.graph_store import GraphStore, graph_store
+from services.invoice_matching import AMOUNT_FIELDS, resolve_filings
+from services.metrics import record_ingest
+from services.persistence import GraphPersistence, graph_persistence
+from services.period_shards import PeriodShards
+
+# Record type accepted by each ingest route, keyed by the route's name
+RECORD_MODELS: Dict[str, Type[BaseModel]] = {
+    "invoice": Invoice,
+    "gstr1": GSTR1Record,
+    "gstr2b": GSTR2BRecord,
+    "purchase_register": PurchaseRegisterEntry,
+    "einvoice": EInvoiceRecord,
+}
+
+class IngestService:
+    """Applies validated ingest records to the graph. Shared by the JSON and streaming routes."""
+    def __init__(self, store: GraphStore = graph_store, persistence: GraphPersistence = graph_persistence):
+        self.store = store
+        self.persistence = persistence
+        self.gs: GraphService = None
+        # Match attributes (filed_invoice_id, match_confidence) of the record being applied
+        self.match: dict = {}
+
+    def apply(self, kind: str, records: Iterable[BaseModel], log: bool = True) -> int:
+        """
+        Applies a batch of records of one kind; returns the number applied.
+        With `log` the batch is first appended to the write-ahead log (when persistence
+        is configured); WAL replay passes log=False. Evicted periods the batch writes to
+        are loaded back first, as are cold shards holding the batch's invoices. Filings
+        whose invoice number matches no invoice exactly are attached to the invoice they
+        fuzzy-match (services/invoice_matching.py); the WAL keeps them as filed. The batch is one write transaction: readers see all of it or none.
+        """
+        apply_one = getattr(self, f"_apply_{kind}")
+        records = list(records)
+        started = time.perf_counter()
+        with self.persistence.lock, self.store.write() as gs:
+            self.gs = gs
+            shards = PeriodShards(gs, self.persistence)
+            shards.ensure_resident({getattr(rec, "period", None) for rec in records})
+            # Filings are often filed in a later period than their invoice's, which may be cold
+            shards.ensure_invoices(rec.invoice_id for rec in records)
+            if log:
+                self.persistence.append(kind, records)
+            for rec, match in zip(*self._resolve(kind, records)):
+                self.match = match
+                apply_one(rec)
+            self.match = {}
+            # Fold the batch into the feature store before it is published
+            gs.features.flush(gs)
+        record_ingest(kind, len(records), time.perf_counter() - started)
+        return len(records)
+
+    def _resolve(self, kind: str, records: List[BaseModel]):
+        """(records with matched invoice ids, match attributes per record)."""
+        matches = [{}] * len(records)
+        if kind not in AMOUNT_FIELDS or all(
+                (self.gs.get_node(f"Invoice:{rec.invoice_id}") or {}).get("type") == "Invoice" for rec in records):
+            return records, matches
+        frame = resolve_filings(self.gs, kind, pd.DataFrame([rec.model_dump() for rec in records]))
+        if "match_confidence" not in frame.columns:
+            return records, matches
+        records = list(records)
+        for i, invoice_id, filed, confidence in zip(frame.index, frame["invoice_id"], frame["filed_invoice_id"], frame["match_confidence"]):
+            if pd.notna(confidence):
+                records[i] = records[i].model_copy(update={"invoice_id": invoice_id})
+                matches[i] = {"filed_invoice_id": filed, "match_confidence": float(confidence)}
+        return records, matches
+
+    def _apply_invoice(self, inv: Invoice):
+        self.gs.add_invoice(
+            invoice_id=inv.invoice_id,
+            supplier_gstin=inv.supplier_gstin,
+            buyer_gstin=inv.buyer_gstin,
+            period=inv.period,
+            attributes={"tax_value": inv.tax_value, "total_value": inv.total_value, "date": inv.date}
+        )
+
+    def _apply_gstr1(self, rec: GSTR1Record):
+        self.gs.add_gstr1_entry(
+            invoice_id=rec.invoice_id,
+            supplier_gstin=rec.supplier_gstin,
+            period=rec.period,
+            attributes={"tax_value": rec.tax_value, **self.match}
+        )
+
+    def _apply_gstr2b(self, rec: GSTR2BRecord):
+        self.gs.add_gstr2b_entry(
+            invoice_id=rec.invoice_id,
+            buyer_gstin=rec.buyer_gstin,
+            period=rec.period,
+            attributes={"itc_available": rec.itc_available, **self.match}
+        )
+
+    def _apply_purchase_register(self, rec: PurchaseRegisterEntry):
+        self.gs.add_purchase_register_entry(
+            invoice_id=rec.invoice_id,
+            buyer_gstin=rec.buyer_gstin,
+            period=rec.period,
+            attributes={"tax_paid": rec.tax_paid, **self.match}
+        )
+
+    def _apply_einvoice(self, rec: EInvoiceRecord):
+        self.gs.add_einvoice_entry(
+            irn=rec.irn,
+            invoice_id=rec.invoice_id,
+            attributes={"tax_value": rec.tax_value, "date": rec.date, "supplier_gstin": rec.supplier_gstin, "buyer_gstin": rec.buyer_gstin}
+        )
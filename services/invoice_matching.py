@@ -0,0 +1,210 @@
+"""
+Fuzzy invoice matching for filings whose invoice number drifts from the supplier's invoice:
+prefixes ("INV/"), leading zeros, separators and fiscal-year tags ("/2024-25").
+
+Records are only compared within a block of the same (supplier GSTIN, buyer GSTIN, period).
+Inside a block, normalised invoice numbers are joined exactly first, then the numeric cores of
+what is left (a supplier's series prefix is often dropped: "SYN-0042" filed as "INV/42").
+Only records left over after both joins are compared pairwise, by string similarity, and only
+within their own block.
+Blocks are small, so a whole period costs close to a hash join rather than n x m comparisons.
+Every candidate pair gets a confidence from invoice-number and amount agreement. Pairs are
+assigned one-to-one, best first.
+
+Ingest and the bulk loader use resolve_filings() to attach GSTR-1, GSTR-2B and Purchase
+Register rows to the invoice they match. The CLI matches a Purchase Register export against
+GSTR-2B directly:
+
+    python -m services.invoice_matching --purchase-register pr.csv --gstr2b gstr2b.csv --out matches.csv
+"""
+import argparse
+import logging
+import re
+import time
+from difflib import SequenceMatcher
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+import config
+
+logger = logging.getLogger(__name__)
+
+BLOCK_COLUMNS = ["supplier_gstin", "buyer_gstin", "period"]
+
+# Amount column of each filing kind that carries an invoice number and both parties
+AMOUNT_FIELDS = {"gstr1": "tax_value", "gstr2b": "itc_available", "purchase_register": "tax_paid"}
+
+# Leading tokens that label a number rather than being part of it
+_PREFIXES = {"INV", "INVOICE", "BILL", "NO", "TAX", "TI", "SI", "GST"}
+_TOKEN = re.compile(r"[A-Z]+|\d+")
+_FISCAL_YEAR = re.compile(r"(?<!\d)(?:FY)?(?:20)?(\d{2})[-/](?:20)?(\d{2})(?!\d)")
+
+def normalize_invoice_number(raw) -> str:
+    """Canonical form of an invoice number: "INV/00042/2024-25" and "42" both give "42"."""
+    text = str(raw).upper()
+    # Only consecutive years count as a fiscal-year tag, so "12-34" is kept
+    stripped = _FISCAL_YEAR.sub(lambda m: "" if (int(m.group(2)) - int(m.group(1))) % 100 == 1 else m.group(0), text)
+    tokens = _TOKEN.findall(stripped if re.search(r"\d", stripped) else text)
+    while len(tokens) > 1 and tokens[0] in _PREFIXES:
+        tokens.pop(0)
+    return "".join((t.lstrip("0") or "0") if t.isdigit() else t for t in tokens)
+
+class InvoiceMatcher:
+    def __init__(self, threshold: float = None, tolerance: float = None, max_block_pairs: int = 2500):
+        self.threshold = config.MATCH_THRESHOLD if threshold is None else threshold
+        self.tolerance = config.MATCH_AMOUNT_TOLERANCE if tolerance is None else tolerance
+        # Blocks with more pairs left after the joins than this skip the pairwise comparison
+        self.max_block_pairs = max_block_pairs
+
+    def amount_score(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """1 within tolerance, falling linearly to 0 at ten times the tolerance."""
+        a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+        allowed = np.maximum(self.tolerance * np.maximum(np.abs(a), np.abs(b)), 1.0)
+        return np.clip(1.0 - (np.abs(a - b) - allowed) / (9.0 * allowed), 0.0, 1.0)
+
+    def match(self, left: pd.DataFrame, right: pd.DataFrame, left_amount: str, right_amount: str) -> pd.DataFrame:
+        """
+        Matches rows of `left` to rows of `right` (both with invoice_id and BLOCK_COLUMNS).
+        Returns one row per match: left and right index labels, confidence and method
+        ("exact", "normalised", "numeric" or "fuzzy"). Each row is used at most once.
+        """
+        columns = ["left", "right", "confidence", "method"]
+        if left.empty or right.empty:
+            return pd.DataFrame(columns=columns)
+        a = self._prepare(left, left_amount)
+        b = self._prepare(right, right_amount)
+
+        # Exact join on the normalised number within each block
+        pairs = a.merge(b, on=BLOCK_COLUMNS + ["key"], suffixes=("_l", "_r"))
+        exact = (pairs["invoice_id_l"] == pairs["invoice_id_r"]).to_numpy()
+        amount = self.amount_score(pairs["amount_l"], pairs["amount_r"])
+        candidates = [pd.DataFrame({
+            "left": pairs["row_l"], "right": pairs["row_r"],
+            "confidence": np.where(exact, 0.85 + 0.15 * amount, 0.8 + 0.15 * amount),
+            "method": np.where(exact, "exact", "normalised"),
+        })]
+        rest_a = a[~a["row"].isin(pairs["row_l"])]
+        rest_b = b[~b["row"].isin(pairs["row_r"])]
+
+        # Then on the numeric core; amounts break ties between series sharing a number
+        pairs = rest_a[rest_a["digits"] != ""].merge(rest_b, on=BLOCK_COLUMNS + ["digits"], suffixes=("_l", "_r"))
+        candidates.append(pd.DataFrame({
+            "left": pairs["row_l"], "right": pairs["row_r"],
+            "confidence": 0.75 + 0.15 * self.amount_score(pairs["amount_l"], pairs["amount_r"]), "method": "numeric",
+        }))
+        rest_a = rest_a[~rest_a["row"].isin(pairs["row_l"])]
+        rest_b = rest_b[~rest_b["row"].isin(pairs["row_r"])]
+
+        # Pairwise similarity for what the joins left over, block by block
+        if not rest_a.empty and not rest_b.empty:
+            sizes = rest_a.groupby(BLOCK_COLUMNS).size().rename("n_l").reset_index().merge(
+                rest_b.groupby(BLOCK_COLUMNS).size().rename("n_r").reset_index(), on=BLOCK_COLUMNS)
+            blocks = sizes[sizes["n_l"] * sizes["n_r"] <= self.max_block_pairs][BLOCK_COLUMNS]
+            if len(blocks) < len(sizes):
+                logger.info("%d blocks too large for pairwise matching; exact normalised matches only", len(sizes) - len(blocks))
+            fuzzy = rest_a.merge(blocks, on=BLOCK_COLUMNS).merge(rest_b, on=BLOCK_COLUMNS, suffixes=("_l", "_r"))
+            if not fuzzy.empty:
+                similarity = np.fromiter((SequenceMatcher(None, x, y).ratio() for x, y in zip(fuzzy["key_l"], fuzzy["key_r"])),
+                                         dtype=np.float64, count=len(fuzzy))
+                amount = self.amount_score(fuzzy["amount_l"], fuzzy["amount_r"])
+                candidates.append(pd.DataFrame({
+                    "left": fuzzy["row_l"], "right": fuzzy["row_r"],
+                    "confidence": similarity * (0.5 + 0.4 * amount), "method": "fuzzy",
+                }))
+
+        candidates = pd.concat(candidates, ignore_index=True)
+        candidates = candidates[candidates["confidence"] >= self.threshold].sort_values(
+            ["confidence", "left", "right"], ascending=[False, True, True], kind="stable")
+        # Greedy one-to-one assignment, best confidence first
+        used_left, used_right, keep = set(), set(), []
+        for i, l, r in zip(candidates.index, candidates["left"], candidates["right"]):
+            if l in used_left or r in used_right:
+                continue
+            used_left.add(l)
+            used_right.add(r)
+            keep.append(i)
+        result = candidates.loc[keep].reset_index(drop=True)
+        result["left"] = left.index[result["left"].to_numpy(dtype=np.int64)]
+        result["right"] = right.index[result["right"].to_numpy(dtype=np.int64)]
+        result["confidence"] = result["confidence"].round(4)
+        return result[columns]
+
+    def _prepare(self, frame: pd.DataFrame, amount: str) -> pd.DataFrame:
+        # Positional row numbers, so duplicate index labels in the input don't matter
+        keys = frame["invoice_id"].map(normalize_invoice_number)
+        return pd.DataFrame({
+            "row": np.arange(len(frame)),
+            "invoice_id": frame["invoice_id"].astype(str).to_numpy(),
+            "key": keys.to_numpy(),
+            "digits": keys.str.replace(r"\D", "", regex=True).str.replace(r"^0+(?=\d)", "", regex=True).to_numpy(),
+            **{col: frame[col].astype(str).to_numpy() for col in BLOCK_COLUMNS},
+            "amount": pd.to_numeric(frame[amount], errors="coerce").fillna(0.0).to_numpy(),
+        })
+
+def block_invoices(gs, blocks: pd.DataFrame) -> pd.DataFrame:
+    """The graph's invoices in the given (supplier, buyer, period) blocks, via the supplier index."""
+    wanted = set(zip(blocks["supplier_gstin"], blocks["buyer_gstin"], blocks["period"]))
+    rows = []
+    for supplier in sorted({block[0] for block in wanted}):
+        for invoice_id in gs.get_invoices_supplied_by(supplier):
+            attrs = gs.get_node(f"Invoice:{invoice_id}")
+            if not attrs or attrs.get("type") != "Invoice":
+                continue
+            buyer = gs.get_invoice_buyer(invoice_id)
+            if (supplier, buyer, attrs.get("period")) in wanted:
+                rows.append((attrs.get("invoice_id", invoice_id), supplier, buyer, attrs.get("period"),
+                             float(attrs.get("tax_value", 0.0) or 0.0)))
+    return pd.DataFrame.from_records(rows, columns=["invoice_id"] + BLOCK_COLUMNS + ["tax_value"])
+
+def resolve_filings(gs, kind: str, frame: pd.DataFrame, matcher: Optional[InvoiceMatcher] = None) -> pd.DataFrame:
+    """
+    Points filing rows whose invoice_id is not a known invoice at the invoice they match.
+    Matched rows get the invoice's id, with the number as filed in filed_invoice_id and the
+    match_confidence. Other rows are returned unchanged.
+    """
+    known = frame["invoice_id"].map(lambda i: (gs.get_node(f"Invoice:{i}") or {}).get("type") == "Invoice")
+    if known.all():
+        return frame
+    orphans = frame[~known.to_numpy()]
+    invoices = block_invoices(gs, orphans[BLOCK_COLUMNS].drop_duplicates())
+    matches = (matcher or InvoiceMatcher()).match(orphans.reset_index(drop=True), invoices, AMOUNT_FIELDS[kind], "tax_value")
+    if matches.empty:
+        return frame
+    rows = np.flatnonzero(~known.to_numpy())[matches["left"].to_numpy(dtype=np.int64)]
+    frame = frame.reset_index(drop=True)
+    frame["filed_invoice_id"] = None
+    frame["match_confidence"] = np.nan
+    frame.loc[rows, "filed_invoice_id"] = frame.loc[rows, "invoice_id"].to_numpy()
+    frame.loc[rows, "invoice_id"] = invoices["invoice_id"].to_numpy()[matches["right"].to_numpy(dtype=np.int64)]
+    frame.loc[rows, "match_confidence"] = matches["confidence"].to_numpy()
+    return frame
+
+def main(argv: Optional[List[str]] = None):
+    from services.bulk_loader import read_table
+    parser = argparse.ArgumentParser(description="Match Purchase Register entries against GSTR-2B by normalised invoice number and amount")
+    parser.add_argument("--purchase-register", nargs="+", required=True, help="Purchase Register files")
+    parser.add_argument("--gstr2b", nargs="+", required=True, help="GSTR-2B files (CSV/Parquet or portal JSON)")
+    parser.add_argument("--out", required=True, help="Output CSV: one row per Purchase Register entry")
+    parser.add_argument("--threshold", type=float, default=config.MATCH_THRESHOLD, help="Minimum match confidence")
+    parser.add_argument("--tolerance", type=float, default=config.MATCH_AMOUNT_TOLERANCE, help="Relative amount tolerance")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    started = time.perf_counter()
+    pr = pd.concat([read_table(path, "purchase_register") for path in args.purchase_register], ignore_index=True)
+    gstr2b = pd.concat([read_table(path, "gstr2b") for path in args.gstr2b], ignore_index=True)
+    matches = InvoiceMatcher(args.threshold, args.tolerance).match(pr, gstr2b, "tax_paid", "itc_available")
+
+    # Every PR entry appears once; unmatched ones have no GSTR-2B columns (ITC not reflected)
+    out = pr[["invoice_id"] + BLOCK_COLUMNS + ["tax_paid"]].join(matches.set_index("left")[["right", "confidence", "method"]])
+    matched = out["right"].notna()
+    out.loc[matched, "gstr2b_invoice_id"] = gstr2b["invoice_id"].to_numpy()[out.loc[matched, "right"].astype(np.int64)]
+    out.loc[matched, "itc_available"] = gstr2b["itc_available"].to_numpy()[out.loc[matched, "right"].astype(np.int64)]
+    out = out.drop(columns="right").rename(columns={"invoice_id": "pr_invoice_id"})
+    out.to_csv(args.out, index=False)
+    logger.info("Matched %d of %d Purchase Register entries against %d GSTR-2B rows (%s) in %.2fs; wrote %s",
+                int(matched.sum()), len(pr), len(gstr2b), out["method"].value_counts().to_dict(),
+                time.perf_counter() - started, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+Background jobs for heavy analytics (risk propagation, cycle scans, period reconciliation).
+
+Requests submit a job and poll for it instead of running PageRank or cycle enumeration in
+the request thread. Jobs run in a pool of worker processes, each of which memory-maps a
+compact snapshot of the graph (services/compact_graph.py) and keeps it open across jobs:
+
+- with GST_DATA_DIR, the latest persistence snapshot; in a reader, the published snapshot it serves
+- without it, a compact export of the graph in a temporary directory
+
+Like a reader, a job runs on the newest snapshot there is, which may lag the graph it was
+submitted against by up to GST_JOB_MAX_LAG_SECONDS. A job submitted when the snapshot is older
+than that (or that loaded an evicted period back) waits for a newer one: the dispatcher never
+takes snapshots itself, it asks main.py's periodic_snapshots to take the next one early, or
+without GST_DATA_DIR an export thread to write one.
+
+Waiting jobs are dispatched highest priority first. At most GST_JOB_QUEUE_SIZE may wait
+(further submissions are refused), and submitting the same kind and parameters while the same
+snapshot is current returns the existing job instead of running it again.
+
+The job kinds themselves (what each one computes) are defined in agent/jobs.py.
+"""
+import heapq
+import inspect
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import config
+from models.schemas import JobStatus
+from services.compact_graph import CompactGraph, CompactGraphService
+from services.graph_store import GraphStore, graph_store
+from services.ml_service import load_vendor_risk_model
+from services.persistence import GraphPersistence, graph_persistence
+from services.serving import load_cold_invoice, load_cold_periods, published_graph
+
+logger = logging.getLogger(__name__)
+
+# Worker side: the snapshot this worker process has mapped, kept across jobs so its derived
+# state (trade projection, propagation scores) is only built once per snapshot
+_worker_graph: Optional[Tuple[str, CompactGraph]] = None
+
+def _run_job(snapshot: str, fn: Callable[..., Any], params: dict):
+    global _worker_graph
+    if _worker_graph is None or _worker_graph[0] != snapshot:
+        _worker_graph = (snapshot, CompactGraph.load(snapshot, mmap=True))
+    return fn(CompactGraphService(_worker_graph[1]), **params)
+
+class JobQueueFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, kind: str, params: dict, priority: int, graph_version: int):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        # Oldest graph version the job may run on until it starts, then the one it runs on
+        self.graph_version = graph_version
+        self.key = (kind, json.dumps(params, sort_keys=True), graph_version)
+        self.state = "pending"
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.future: Optional[Future] = None
+        self.snapshot: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+    def status(self, reused: bool = False) -> JobStatus:
+        return JobStatus(
+            job_id=self.job_id, kind=self.kind, params=self.params, priority=self.priority,
+            status=self.state, graph_version=self.graph_version, reused=reused,
+            submitted_at=self.submitted_at, started_at=self.started_at,
+            finished_at=self.finished_at, error=self.error
+        )
+
+class JobManager:
+    def __init__(self, kinds: Dict[str, Callable[..., Any]], store: GraphStore = graph_store,
+                 persistence: GraphPersistence = graph_persistence):
+        # kind -> fn(gs, **params), run in a worker against a read-only service over the snapshot;
+        # must be a module-level function (it is pickled by name) returning something JSON-serialisable
+        self.kinds = kinds
+        self.store = store
+        self.persistence = persistence
+        self.workers = max(1, config.JOB_WORKERS)
+        self._jobs: Dict[str, Job] = {}  # in submission order
+        self._by_key: Dict[tuple, Job] = {}
+        self._queue: List[tuple] = []  # heap of (-priority, seq, job)
+        self._seq = itertools.count()
+        self._running = 0
+        self._cond = threading.Condition()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._closed = False
+        # Set while a waiting job needs a newer snapshot than the latest; periodic_snapshots
+        # (or the export thread) takes one early and calls snapshot_taken()
+        self.snapshot_requested = threading.Event()
+        # In-memory graphs are exported here for the workers: (version, path, monotonic time), newest last
+        self._export_dir: Optional[str] = None
+        self._exports: List[Tuple[int, str, float]] = []
+        self._exporter: Optional[threading.Thread] = None
+        self._held: Dict[str, int] = {}  # exports running jobs use
+
+    def submit(self, kind: str, params: dict, priority: int = 0) -> Tuple[Job, bool]:
+        """Queues a job, or returns the matching one already submitted. Returns (job, reused)."""
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown job kind '{kind}'; expected one of {', '.join(self.kinds)}")
+        try:
+            inspect.signature(self.kinds[kind]).bind(None, **params)
+        except TypeError as e:
+            raise ValueError(f"Invalid parameters for '{kind}': {e}")
+
+        # Evicted periods are loaded back here; a job that needed one waits for a snapshot including it
+        before = self.store.version
+        if params.get("period") is not None:
+            load_cold_periods([params["period"]])
+        if kind == "analyze-invoice":
+            load_cold_invoice(params["invoice_id"], params.get("period"))
+        elif kind == "analyze-invoices":
+            for invoice_id in params["invoice_ids"]:
+                load_cold_invoice(invoice_id, params.get("period"))
+        version = self._required_version(loaded=self.store.version != before)
+
+        key = (kind, json.dumps(params, sort_keys=True), version)
+        with self._cond:
+            existing = self._by_key.get(key)
+            if existing is not None and existing.state not in ("failed", "cancelled"):
+                return existing, True
+            if len(self._queue) >= config.JOB_QUEUE_SIZE:
+                raise JobQueueFull(f"{len(self._queue)} jobs are already waiting; retry later")
+            if self._closed:
+                raise RuntimeError("Job manager is shut down")
+            job = Job(kind, params, priority, version)
+            self._jobs[job.job_id] = job
+            self._by_key[key] = job
+            heapq.heappush(self._queue, (-priority, next(self._seq), job))
+            self._start()
+            self._cond.notify_all()
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancels a job. A waiting job is dropped from the queue; a running one can't be
+        interrupted, so its worker finishes it and the result is discarded.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            if job.state == "pending":
+                self._queue = [entry for entry in self._queue if entry[2] is not job]
+                heapq.heapify(self._queue)
+            elif job.future is not None:
+                job.future.cancel()  # only succeeds if no worker has picked it up yet
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            self._cond.notify_all()
+        return job
+
+    def snapshot_taken(self):
+        """Wakes the dispatcher after a new snapshot, for jobs waiting on one."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.snapshot_requested.set()  # lets the export thread exit
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        if self._export_dir is not None:
+            shutil.rmtree(self._export_dir, ignore_errors=True)
+
+    def _latest(self) -> Optional[Tuple[int, Optional[float]]]:
+        """(version, monotonic time taken) of the newest snapshot jobs can run on, if any."""
+        if config.ROLE == "reader":
+            return published_graph.compact.graph.get("version", 0), None
+        if self.persistence.enabled:
+            if self.persistence.last_snapshot_version is None or self.persistence.current_snapshot() is None:
+                return None
+            return self.persistence.last_snapshot_version, self.persistence.last_snapshot_at
+        if not self._exports:
+            return None
+        return self._exports[-1][0], self._exports[-1][2]
+
+    def _required_version(self, loaded: bool) -> int:
+        latest = self._latest()
+        if config.ROLE == "reader":
+            return latest[0]  # readers never load cold periods; the writer publishes at its own pace
+        version = self.store.version
+        if latest is None or loaded:
+            return version
+        fresh = latest[1] is not None and time.monotonic() - latest[1] < config.JOB_MAX_LAG_SECONDS
+        return latest[0] if latest[0] >= version or fresh else version
+
+    def _start(self):
+        if self._dispatcher is None:
+            self._pool = self._new_pool()
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+            self._dispatcher.start()
+            if config.ROLE != "reader" and not self.persistence.enabled:
+                self._exporter = threading.Thread(target=self._export_loop, name="job-exporter", daemon=True)
+                self._exporter.start()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked: the server process has threads (and possibly locks held).
+        # Spawned workers don't run the lifespan, so each loads the vendor-risk model itself.
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=load_vendor_risk_model, initargs=(config.MODEL_DIR,))
+
+    def _next_job(self) -> Optional[Job]:
+        # Highest priority job the latest snapshot is new enough for; asks for a newer one if some wait
+        latest = self._latest()
+        ready = [entry for entry in self._queue if latest is not None and entry[2].graph_version <= latest[0]]
+        if len(ready) < len(self._queue):
+            self.snapshot_requested.set()
+        if not ready:
+            return None
+        entry = min(ready)
+        self._queue.remove(entry)
+        heapq.heapify(self._queue)
+        return entry[2]
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    job = self._next_job() if self._running < self.workers else None
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                job.state = "running"
+                job.started_at = time.time()
+                self._running += 1
+            try:
+                job.snapshot, job.graph_version = self._hold_snapshot()
+                try:
+                    future = self._pool.submit(_run_job, job.snapshot, self.kinds[job.kind], job.params)
+                except BrokenProcessPool:
+                    # A worker died (e.g. out of memory); its jobs failed, start a fresh pool
+                    self._pool = self._new_pool()
+                    future = self._pool.submit(_run_job, job.snapshot, self.kinds[job.kind], job.params)
+            except Exception as e:
+                logger.exception("Could not start job %s", job.job_id)
+                self._finish(job, error=str(e))
+                continue
+            job.future = future
+            future.add_done_callback(lambda f, job=job: self._finish(job, future=f))
+
+    def _finish(self, job: Job, future: Optional[Future] = None, error: Optional[str] = None):
+        if future is not None and not future.cancelled():
+            exc = future.exception()
+            if exc is not None:
+                error = f"{type(exc).__name__}: {exc}"
+        if job.snapshot is not None:
+            self._release_snapshot(job.snapshot)
+        with self._cond:
+            self._running -= 1
+            if job.state == "running":  # not cancelled meanwhile
+                if future is not None and future.cancelled():
+                    job.state = "cancelled"
+                elif error is not None:
+                    job.state, job.error = "failed", error
+                else:
+                    job.state, job.result = "done", future.result()
+                job.finished_at = time.time()
+            self._trim()
+            self._cond.notify_all()
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond GST_JOB_RETAIN
+        excess = len(self._jobs) - config.JOB_RETAIN
+        for job in [j for j in self._jobs.values() if j.finished][:max(excess, 0)]:
+            del self._jobs[job.job_id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+    # Snapshots the workers map. Each running job holds its snapshot, so it isn't deleted before
+    # the worker has mapped it (once mapped, deleting the files doesn't affect the mapping).
+
+    def _hold_snapshot(self) -> Tuple[str, int]:
+        """(path, version) of the latest snapshot, held until _release_snapshot(path)."""
+        if config.ROLE == "reader":
+            # The writer prunes these; it keeps GST_SNAPSHOT_RETAIN, so the one being served
+            # outlives at least one more publish interval
+            if published_graph.snapshot is None:
+                raise RuntimeError("The writer has not published a snapshot yet")
+            return published_graph.snapshot, published_graph.compact.graph.get("version", 0)
+        if self.persistence.enabled:
+            held = self.persistence.hold_snapshot()
+            if held is None:
+                raise RuntimeError("No snapshot has been taken yet")
+            return held
+        with self._cond:
+            version, path, _ = self._exports[-1]
+            self._held[path] = self._held.get(path, 0) + 1
+            return path, version
+
+    def _release_snapshot(self, path: str):
+        if config.ROLE == "reader":
+            return
+        if self.persistence.enabled:
+            self.persistence.release_snapshot(path)
+            return
+        with self._cond:
+            self._held[path] -= 1
+            if not self._held[path]:
+                del self._held[path]
+            self._prune_exports()
+
+    def _prune_exports(self):
+        # Keeps the newest export and any a running job uses
+        keep = [e for e in self._exports[:-1] if e[1] in self._held] + self._exports[-1:]
+        for _, path, _ in self._exports:
+            if all(path != e[1] for e in keep):
+                shutil.rmtree(path, ignore_errors=True)
+        self._exports = keep
+
+    def _export_loop(self):
+        # Without persistence there are no periodic snapshots; export the graph when a job asks
+        while True:
+            self.snapshot_requested.wait()
+            self.snapshot_requested.clear()
+            if self._closed:
+                return
+            try:
+                self._export()
+            except Exception:
+                logger.exception("Could not export the graph for jobs")
+                time.sleep(1)  # don't spin on a persistent failure; the next request retries
+            self.snapshot_taken()
+
+    def _export(self):
+        if self._export_dir is None:
+            self._export_dir = tempfile.mkdtemp(prefix="gst-jobs-")
+        with self.store.read() as gs:
+            current = gs.version
+            if self._exports and self._exports[-1][0] == current:
+                return
+            compact = CompactGraph.from_graph(gs.g)
+        path = os.path.join(self._export_dir, f"graph-{current:012d}")
+        compact.save(f"{path}.tmp")
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(f"{path}.tmp", path)
+        with self._cond:
+            self._exports.append((current, path, time.monotonic()))
+            self._prune_exports()
@@ -0,0 +1,183 @@
+"""
+Ledger-level reconciliation: tax totals per supplier, buyer and period, compared across the
+supplier's invoices, GSTR-1, the buyer's GSTR-2B, the Purchase Register and e-invoices.
+
+A period's invoices are pulled out of the graph once into a columnar frame with one row per
+invoice. On a compact snapshot (read replicas, job workers) the frame comes straight from the
+CSR and attribute arrays. The frame is cached against the graph version, like the period
+trade projection.
+Summaries are pandas groupbys over that frame, so a full period answers in one vectorised
+pass instead of an invoice-by-invoice reconcile.
+
+Per invoice:
+  exposure      output tax invoiced but not reported in GSTR-1 (max(invoice - GSTR-1, 0))
+  itc_at_risk   ITC booked in the Purchase Register but not backed by GSTR-2B (max(PR - 2B, 0))
+  mismatched    any pair of the five amounts differs beyond GST_MATCH_AMOUNT_TOLERANCE
+"""
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import config
+from services.compact_graph import CompactGraph
+from services.graph_service import GraphService
+
+AMOUNT_COLUMNS = ["invoice_tax", "gstr1_tax", "gstr2b_itc", "pr_tax_paid", "einvoice_tax"]
+
+# Summary row groupings: group_by value -> grouping columns (always within one period)
+GROUPINGS = {
+    "supplier": ["supplier_gstin"],
+    "buyer": ["buyer_gstin"],
+    "pair": ["supplier_gstin", "buyer_gstin"],
+}
+
+class LedgerReconciliation:
+    def __init__(self, graph_service: GraphService):
+        self.gs = graph_service
+
+    def frame(self, period: str) -> pd.DataFrame:
+        """One row per invoice of the period with its amounts per dataset. Treat it as read-only."""
+        cache = self.gs.g.graph.setdefault("ledger_frames", {})
+        cached = cache.get(period)
+        if cached is not None and cached[0] == self.gs.version:
+            return cached[1]
+        if isinstance(self.gs.g, CompactGraph):
+            frame = self._build_compact(period)
+        else:
+            frame = self._build(period)
+        cache[period] = (self.gs.version, frame)
+        return frame
+
+    def summary(self, period: str, group_by: str = "supplier", gstin: Optional[str] = None,
+                limit: Optional[int] = None) -> Dict:
+        """
+        Grouped totals for a period, riskiest groups (exposure + ITC at risk) first. With `gstin`
+        only invoices where it is the supplier or the buyer count.
+        Returns {"totals": {...}, "rows": [{...}, ...]}.
+        """
+        keys = GROUPINGS[group_by]
+        frame = self.frame(period)
+        if gstin is not None:
+            frame = frame[(frame["supplier_gstin"] == gstin) | (frame["buyer_gstin"] == gstin)]
+
+        aggregations = {column: "sum" for column in AMOUNT_COLUMNS + ["exposure", "itc_at_risk"]}
+        aggregations.update({"invoice_id": "size", "not_in_gstr1": "sum", "not_in_gstr2b": "sum",
+                             "not_in_pr": "sum", "missing_irn": "sum", "mismatched": "sum"})
+        grouped = frame.groupby(keys, sort=False).agg(aggregations).reset_index()
+        grouped["risk"] = grouped["exposure"] + grouped["itc_at_risk"]
+        grouped = grouped.sort_values(["risk"] + keys, ascending=[False] + [True] * len(keys), kind="stable")
+        if limit is not None:
+            grouped = grouped.head(limit)
+        totals = frame.agg(aggregations)
+        return {
+            "totals": _row(totals.to_dict(), len(frame)),
+            "rows": [_row(r, r["invoice_id"]) for r in grouped.drop(columns="risk").to_dict("records")],
+        }
+
+    def _build(self, period: str) -> pd.DataFrame:
+        gs, index = self.gs, self.gs.index
+        ids: List[str] = []
+        suppliers: List[Optional[str]] = []
+        buyers: List[Optional[str]] = []
+        amounts: List[tuple] = []
+        counts: List[tuple] = []
+        for invoice_node in list(index.invoices_by_period.get(period, ())):
+            attrs = gs.get_node(invoice_node)
+            if not attrs or attrs.get("type") != "Invoice" or attrs.get("period") != period:
+                continue
+            sup = index.sources("SUPPLIED_BY", invoice_node)
+            buy = index.targets("PURCHASED_BY", invoice_node)
+            gstr1 = index.targets("REPORTED_IN", invoice_node)
+            gstr2b = index.targets("REFLECTED_IN", invoice_node)
+            pr = index.targets("RECORDED_IN_PR", invoice_node)
+            irn = index.targets("GENERATED_IRN", invoice_node)
+            ids.append(attrs.get("invoice_id", invoice_node.split(":", 1)[1]))
+            suppliers.append(sup[0].split(":", 1)[1] if sup else None)
+            buyers.append(buy[0].split(":", 1)[1] if buy else None)
+            amounts.append((
+                float(attrs.get("tax_value", 0.0) or 0.0),
+                self._total(gstr1, "tax_value"),
+                self._total(gstr2b, "itc_available"),
+                self._total(pr, "tax_paid"),
+                self._total(irn, "tax_value"),
+            ))
+            counts.append((len(gstr1), len(gstr2b), len(pr), len(irn)))
+
+        return _frame(ids, suppliers, buyers, np.array(amounts, dtype=np.float64).reshape(-1, len(AMOUNT_COLUMNS)),
+                      np.array(counts, dtype=np.int64).reshape(-1, 4))
+
+    def _build_compact(self, period: str) -> pd.DataFrame:
+        cg: CompactGraph = self.gs.g
+        invoices = cg.period_invoice_ids(period)
+        row = np.full(len(cg), -1, dtype=np.int64)
+        row[invoices] = np.arange(len(invoices))
+        n = len(invoices)
+
+        def parties(relation: str, invoice_is_source: bool) -> List[Optional[str]]:
+            src, dst = cg.relation_edges(relation)
+            invoice, party = (src, dst) if invoice_is_source else (dst, src)
+            hit = row[invoice] >= 0
+            out = np.full(n, -1, dtype=np.int64)
+            # Reversed so the first edge wins, as in the index lookups
+            out[row[invoice[hit]][::-1]] = party[hit][::-1]
+            names = {int(i): cg.keys[int(i)].split(":", 1)[1] for i in np.unique(out[out >= 0])}
+            return [names.get(i) for i in out.tolist()]
+
+        def totals(relation: str, field: str) -> Tuple[np.ndarray, np.ndarray]:
+            src, dst = cg.relation_edges(relation)
+            hit = row[src] >= 0
+            values = np.nan_to_num(np.asarray(cg.numeric[field])[dst[hit]])
+            return (np.bincount(row[src[hit]], weights=values, minlength=n),
+                    np.bincount(row[src[hit]], minlength=n))
+
+        amounts = np.empty((n, len(AMOUNT_COLUMNS)))
+        counts = np.empty((n, 4), dtype=np.int64)
+        amounts[:, 0] = np.nan_to_num(np.asarray(cg.numeric["tax_value"])[invoices])
+        for j, (relation, field) in enumerate((("REPORTED_IN", "tax_value"), ("REFLECTED_IN", "itc_available"),
+                                               ("RECORDED_IN_PR", "tax_paid"), ("GENERATED_IRN", "tax_value"))):
+            amounts[:, j + 1], counts[:, j] = totals(relation, field)
+        ids = [cg.keys[int(i)].split(":", 1)[1] for i in invoices]
+        return _frame(ids, parties("SUPPLIED_BY", False), parties("PURCHASED_BY", True), amounts, counts)
+
+    def _total(self, nodes: List[str], field: str) -> float:
+        total = 0.0
+        for node in nodes:
+            attrs = self.gs.get_node(node)
+            if attrs:
+                total += float(attrs.get(field, 0.0) or 0.0)
+        return total
+
+def _frame(ids: List[str], suppliers: List[Optional[str]], buyers: List[Optional[str]],
+           amounts: np.ndarray, counts: np.ndarray) -> pd.DataFrame:
+    frame = pd.DataFrame(amounts, columns=AMOUNT_COLUMNS)
+    frame.insert(0, "invoice_id", ids)
+    frame.insert(1, "supplier_gstin", pd.Series(suppliers, dtype=object))
+    frame.insert(2, "buyer_gstin", pd.Series(buyers, dtype=object))
+    frame["not_in_gstr1"] = counts[:, 0] == 0
+    frame["not_in_gstr2b"] = counts[:, 1] == 0
+    frame["not_in_pr"] = counts[:, 2] == 0
+    frame["missing_irn"] = counts[:, 3] == 0
+
+    invoice, gstr1, gstr2b, pr, einvoice = amounts.T
+    frame["exposure"] = np.maximum(invoice - gstr1, 0.0)
+    frame["itc_at_risk"] = np.maximum(pr - gstr2b, 0.0)
+    # Every pair of the amounts present is compared: tolerances don't chain (two small drifts can
+    # add up to a large one), and a missing dataset must not hide a difference across it. Datasets
+    # that are missing for an invoice are already counted by the not_in_* flags.
+    present = np.column_stack([np.ones(len(amounts), dtype=bool), counts > 0])
+    mismatched = np.zeros(len(amounts), dtype=bool)
+    for i in range(len(AMOUNT_COLUMNS)):
+        for j in range(i + 1, len(AMOUNT_COLUMNS)):
+            mismatched |= _differs(amounts[:, i], amounts[:, j]) & present[:, i] & present[:, j]
+    frame["mismatched"] = mismatched
+    return frame
+
+def _differs(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    allowed = np.maximum(config.MATCH_AMOUNT_TOLERANCE * np.maximum(np.abs(a), np.abs(b)), 1.0)
+    return np.abs(a - b) > allowed
+
+def _row(values: dict, invoices) -> dict:
+    row = {key: values[key] for key in ("supplier_gstin", "buyer_gstin") if key in values}
+    row["invoices"] = int(invoices)
+    row.update({column: round(float(values[column]), 2) for column in AMOUNT_COLUMNS + ["exposure", "itc_at_risk"]})
+    row.update({column: int(values[column]) for column in ("not_in_gstr1", "not_in_gstr2b", "not_in_pr", "missing_irn", "mismatched")})
+    return row
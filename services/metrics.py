@@ -0,0 +1,210 @@
+"""
+In-process metrics, served in the Prometheus text format at GET /metrics (api/metrics.py).
+
+  gst_stage_seconds             histogram of pipeline stage latency (pipeline, stage)
+  gst_http_requests_total       requests served (method, route, status)
+  gst_http_request_seconds      request latency histogram (method, route)
+  gst_ingest_rows_total         rows applied by IngestService (kind)
+  gst_ingest_seconds_total      time spent applying them (kind)
+  gst_ingest_rows_per_second    throughput of the last batch (kind)
+  gst_graph_nodes / _edges      graph size by node type / edge relation, read at scrape time
+  gst_audit_cache_*             analyze-invoice result cache (services/audit_cache.py)
+  gst_event_subscribers, gst_events_total
+                                change stream clients and activity (services/event_stream.py)
+
+Pipelines time their steps with `stage(pipeline, name)`. When a request asks for it with the
+X-GST-Timing header, MetricsMiddleware also collects the request's stages and returns them
+in a Server-Timing response header (durations in milliseconds):
+
+    Server-Timing: reconciliation;dur=0.412, graph_intelligence;dur=1.870, total;dur=2.904
+
+Streamed responses (/analyze-invoices) send the header before their body is produced, so
+their stages only reach the histograms.
+
+Routes are labelled by their path template (/vendor-risk/{gstin}), so label values stay
+bounded whatever the request paths are.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds in seconds, from cache hits to batch-sized work
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Request header that opts in to the per-stage breakdown
+TIMING_HEADER = "x-gst-timing"
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set(self, *labels: str, value: float):
+        """Sets the value outright (gauges, and totals counted elsewhere such as a cache's hits)."""
+        with self._lock:
+            self._values[labels] = value
+
+    def replace(self, values: Dict[Tuple[str, ...], float]):
+        """Sets every label combination at once, dropping ones no longer present."""
+        with self._lock:
+            self._values = dict(values)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels(self.labels, labels), value
+
+class Gauge(Counter):
+    kind = "gauge"
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, the last one for +Inf, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *labels: str, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][i] += 1
+            entry[1][0] += value
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            values = {labels: (list(counts), total[0]) for labels, (counts, total) in self._values.items()}
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _labels(self.labels, labels, f'le="{_number(bound)}"'), cumulative
+            yield f"{self.name}_sum", _labels(self.labels, labels), total
+            yield f"{self.name}_count", _labels(self.labels, labels), cumulative
+
+class Registry:
+    def __init__(self):
+        self.metrics: List = []
+        # Called before rendering, to refresh gauges read from elsewhere (graph size, caches)
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram("gst_stage_seconds", "Latency of pipeline stages", ("pipeline", "stage")))
+HTTP_REQUESTS = registry.register(Counter("gst_http_requests_total", "HTTP requests served", ("method", "route", "status")))
+HTTP_SECONDS = registry.register(Histogram("gst_http_request_seconds", "HTTP request latency", ("method", "route")))
+INGEST_ROWS = registry.register(Counter("gst_ingest_rows_total", "Rows applied by ingest", ("kind",)))
+INGEST_SECONDS = registry.register(Counter("gst_ingest_seconds_total", "Time spent applying ingest batches", ("kind",)))
+INGEST_RATE = registry.register(Gauge("gst_ingest_rows_per_second", "Rows per second of the last ingest batch", ("kind",)))
+GRAPH_NODES = registry.register(Gauge("gst_graph_nodes", "Nodes in the served graph", ("type",)))
+GRAPH_EDGES = registry.register(Gauge("gst_graph_edges", "Edges in the served graph", ("relation",)))
+GRAPH_VERSION = registry.register(Gauge("gst_graph_version", "Version of the served graph"))
+
+# Stages recorded by the current request: [(stage, seconds)], when it asked for them
+_request_stages: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("gst_request_stages", default=None)
+
+@contextmanager
+def stage(pipeline: str, name: str):
+    """Times the block as one stage of `pipeline`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(pipeline, name, value=elapsed)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+
+def record_ingest(kind: str, rows: int, seconds: float):
+    INGEST_ROWS.inc(kind, amount=rows)
+    INGEST_SECONDS.inc(kind, amount=seconds)
+    if seconds > 0:
+        INGEST_RATE.set(kind, value=rows / seconds)
+
+def server_timing(stages: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing header value; a stage run more than once (batches) is summed."""
+    summed: Dict[str, float] = {}
+    for name, seconds in stages:
+        summed[name] = summed.get(name, 0.0) + seconds
+    summed["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1e3:.3f}" for name, seconds in summed.items())
+
+class MetricsMiddleware:
+    """ASGI middleware counting and timing every HTTP request, and adding Server-Timing on request."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        wants_timing = any(name.decode("latin-1").lower() == TIMING_HEADER for name, _ in scope.get("headers", ()))
+        stages: Optional[List[Tuple[str, float]]] = [] if wants_timing else None
+        token = _request_stages.set(stages)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if stages is not None:
+                    headers = list(message.get("headers", ()))
+                    headers.append((b"server-timing", server_timing(stages, time.perf_counter() - started).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _request_stages.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            elapsed = time.perf_counter() - started
+            HTTP_REQUESTS.inc(scope["method"], path, str(status[0]))
+            HTTP_SECONDS.observe(scope["method"], path, value=elapsed)
@@ -1,52 +1,111 @@
-import random
-from typing import Dict, Any
+import logging
+from typing import Dict, Any, Optional
+import numpy as np
+import pandas as pd
+from services.risk_model import VendorRiskModel, load_latest
+
+logger = logging.getLogger(__name__)
+
+# Trained model shared by every MLService, loaded once by main.py's lifespan.
+# None = no artifact, vendors are scored with the heuristic below.
+vendor_risk_model: Optional[VendorRiskModel] = None
+
+def load_vendor_risk_model(model_dir: str) -> Optional[VendorRiskModel]:
+    global vendor_risk_model
+    vendor_risk_model = load_latest(model_dir)
+    return vendor_risk_model
+
+def risk_bucket(risk_score: float) -> str:
+    if risk_score > 75:
+        return "High"
+    if risk_score > 40:
+        return "Medium"
+    return "Low"
+
+# Heuristic score when no model is loaded: 10 points base plus weighted evidence, each
+# term bounded so no single feature saturates the score. Mismatch rate is per invoice issued
+# (an invoice can carry several mismatches, so 2 counts as the worst case) and loops use a log
+# scale up to MAX_CYCLES, because most taxpayers in a dense trade network sit on a few.
+HEURISTIC_WEIGHTS = {
+    "mismatch_rate": 35.0,
+    "filing_gaps": 15.0,
+    "cycle_involvements": 15.0,
+    "propagated_risk_score": 15.0,
+    "unpaid_tax_ratio": 10.0,
+}
+
+def heuristic_risk(features):
+    """Heuristic risk (0-100) from one feature row (a dict) or a whole feature table (a DataFrame)."""
+    from services.risk_service import MAX_CYCLES
+    w = HEURISTIC_WEIGHTS
+    return (10.0
+            + w["mismatch_rate"] * np.minimum(features["mismatch_rate"] / 2.0, 1.0)
+            + w["filing_gaps"] * np.minimum(features["filing_gaps"] / np.maximum(features["periods_active"], 1), 1.0)
+            + w["cycle_involvements"] * np.log1p(np.minimum(features["cycle_involvements"], MAX_CYCLES)) / np.log1p(MAX_CYCLES)
+            + w["propagated_risk_score"] * np.clip(features["propagated_risk_score"], 0.0, 100.0) / 100.0
+            + w["unpaid_tax_ratio"] * np.clip(features["unpaid_tax_ratio"], 0.0, 1.0))
 
 class MLService:
-    def __init__(self):
-        # In a real scenario, we load a pre-trained XGBoost or Scikit-Learn model here
-        # e.g., self.model = joblib.load('vendor_risk_model.pkl')
-        pass
+    def __init__(self, model: Optional[VendorRiskModel] = None):
+        self.model = model if model is not None else vendor_risk_model
+
+    def predict_vendor_compliance(self, gstin: str, graph_features: Dict[str, Any], risk_score: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Compliance risk score (0-100, higher is riskier) for one vendor from its feature store
+        row (services/feature_store.py). Uses the trained model's single-row path when one is
+        loaded, the heuristic otherwise, unless `risk_score` was already computed by score_vendors.
+        """
+        if self.model is None:
+            return self._heuristic_compliance(gstin, graph_features, risk_score)
+        if risk_score is None:
+            risk_score = self.model.predict_one(graph_features) * 100.0
+        risk_score = round(risk_score, 2)
+        return {
+            "compliance_risk_score": risk_score,
+            "risk_bucket": risk_bucket(risk_score),
+            "feature_importance": self.model.grouped_importance(),
+            "graph_features_used": graph_features,
+            "model_version": self.model.version,
+        }
+
+    def score_vendors(self, features: pd.DataFrame) -> np.ndarray:
+        """
+        Vectorised scoring: risk scores (0-100) for every row of a feature table (as returned
+        by FeatureStore.to_frame), in one call.
+        """
+        if self.model is None:
+            return heuristic_risk(features).to_numpy(dtype=np.float64)
+        return self.model.predict_proba(features[self.model.feature_columns].to_numpy(dtype=np.float64)) * 100.0
+
+    def predict_vendors_compliance(self, features: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+        """predict_vendor_compliance for every row of a feature table, scored in one score_vendors call."""
+        scores = self.score_vendors(features)
+        return {gstin: self.predict_vendor_compliance(gstin, row, risk_score=float(score))
+                for (gstin, row), score in zip(features.to_dict("index").items(), scores)}
 
-    def predict_vendor_compliance(self, gstin: str, graph_features: Dict[str, Any]) -> Dict[str, Any]:
+    def _heuristic_compliance(self, gstin: str, graph_features: Dict[str, Any], risk_score: Optional[float] = None) -> Dict[str, Any]:
         """
-        Uses graph features to predict a compliance score.
-        For Hackathon demo, we will use a deterministic mock that acts like an ML model.
-        Features passed from graph:
-        - propagated_risk_score
-        - cycle_involvements (int)
-        - mismatch_count
-        - unpaid_tax_ratio
+        Heuristic compliance risk from the vendor's feature store row, for when no trained
+        model is loaded (see heuristic_risk).
         """
-        pr_score = graph_features.get("propagated_risk_score", 0.0)
-        cycles = graph_features.get("cycle_involvements", 0)
-        mismatches = graph_features.get("mismatch_count", 0)
-        
-        # Calculate a mock probability using a sigmoid-like logic or decision tree logic
-        # High score = High Compliance. Wait, usually Risk Score -> High is bad.
-        # Let's output "Risk Score" (0-100) where 100 is max risk.
-        base_risk = 10.0
-        base_risk += (pr_score * 0.4)
-        base_risk += (cycles * 30.0)
-        base_risk += (mismatches * 5.0)
-        
-        risk_score = min(100.0, base_risk)
-        
-        if risk_score > 75:
-            bucket = "High"
-        elif risk_score > 40:
-            bucket = "Medium"
-        else:
-            bucket = "Low"
+        features = {column: graph_features.get(column, 0.0) for column in
+                    ("mismatch_rate", "filing_gaps", "periods_active", "cycle_involvements",
+                     "propagated_risk_score", "unpaid_tax_ratio")}
+        if risk_score is None:
+            risk_score = float(heuristic_risk(features))
+        total = sum(HEURISTIC_WEIGHTS.values())
+        w = HEURISTIC_WEIGHTS
 
         feature_importance = {
-            "circular_trading_involvement": 0.45,
-            "network_risk_propagation": 0.35,
-            "historical_mismatches": 0.20
+            "circular_trading_involvement": round(w["cycle_involvements"] / total, 2),
+            "network_risk_propagation": round(w["propagated_risk_score"] / total, 2),
+            "historical_mismatches": round((w["mismatch_rate"] + w["filing_gaps"]) / total, 2),
+            "unpaid_tax": round(w["unpaid_tax_ratio"] / total, 2),
         }
 
         return {
             "compliance_risk_score": round(risk_score, 2),
-            "risk_bucket": bucket,
+            "risk_bucket": risk_bucket(risk_score),
             "feature_importance": feature_importance,
             "graph_features_used": graph_features
         }
@@ -0,0 +1,245 @@
+"""
+Tax-period partitioning of the graph, with a retention policy that moves old periods to disk.
+
+A period's shard is its Invoice nodes plus the filings hanging off them (GSTR-1, GSTR-2B,
+Purchase Register and e-invoice nodes). Taxpayer nodes are shared by every period and stay
+resident, as does the Taxpayer -> Taxpayer trade projection: it keeps the aggregate of every
+period, resident or not, so global risk propagation and cycle membership do not change when
+a period is evicted. The only cross-period links are the Invoice/filing -> Taxpayer edges,
+and those are stored with the shard.
+
+Evicted shards are written in the compact columnar format to <data dir>/cold/<period>/ and
+loaded back (merged into the live graph) the first time a period-scoped operation or an
+ingest batch needs them.
+"""
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import quote, unquote
+import networkx as nx
+import config
+from services.compact_graph import CompactGraph
+from services.graph_service import GraphService
+from services.persistence import GraphPersistence, graph_persistence
+
+logger = logging.getLogger(__name__)
+
+# Invoice -> filing relations whose targets belong to the invoice's period shard
+SHARD_RELATIONS = ("REPORTED_IN", "REFLECTED_IN", "RECORDED_IN_PR", "GENERATED_IRN")
+
+class PeriodShards:
+    """
+    Per-request view of the graph's period shards (like GraphService, one is built per use).
+    Which periods are cold and when each was last used is kept in the graph's attribute
+    dict, and is rebuilt from the cold directory after the graph is cleared or reloaded.
+    Over a read-only graph (a pinned read view or a published snapshot) periods are only
+    marked as used; loading them back is up to a writer.
+    """
+    def __init__(self, graph_service: GraphService, persistence: Optional[GraphPersistence] = None):
+        self.gs = graph_service
+        state = self.gs.g.graph.get("period_shards")
+        # Without an explicit persistence, use the one the graph's shards were set up with
+        if persistence is None:
+            persistence = state["persistence"] if state is not None else graph_persistence
+        self.persistence = persistence
+        self.cold_dir = persistence.cold_dir if persistence.enabled else None
+        if state is None or state["persistence"] is not persistence or state["cold_dir"] != self.cold_dir:
+            if self.gs.read_only:
+                # Nothing to share yet; the writer sets the state up
+                state = {"persistence": persistence, "cold_dir": self.cold_dir, "cold": set(), "last_access": {}}
+            else:
+                state = {"persistence": persistence, "cold_dir": self.cold_dir, "cold": self._scan_cold(), "last_access": {}}
+                self.gs.g.graph["period_shards"] = state
+        self.cold: Set[str] = state["cold"]
+        self.last_access: Dict[str, float] = state["last_access"]
+
+    def _scan_cold(self) -> Set[str]:
+        if self.cold_dir is None or not os.path.isdir(self.cold_dir):
+            return set()
+        # A cold copy is stale when its period is resident (it was loaded back and the
+        # snapshot taken since includes it); it is overwritten on the next eviction.
+        resident = self.resident_periods()
+        return {unquote(name) for name in os.listdir(self.cold_dir)
+                if not name.endswith(".tmp") and unquote(name) not in resident}
+
+    def _path(self, period: str) -> str:
+        return os.path.join(self.cold_dir, quote(period, safe=""))
+
+    def resident_periods(self) -> List[str]:
+        return sorted(p for p, invoices in self.gs.index.invoices_by_period.items() if invoices)
+
+    def cold_periods(self) -> List[str]:
+        return sorted(self.cold)
+
+    def shard_nodes(self, period: str) -> List[str]:
+        """Node ids making up a resident period's shard (invoices first, then their filings)."""
+        invoices = list(self.gs.index.invoices_by_period.get(period, ()))
+        nodes = dict.fromkeys(invoices)
+        for invoice in invoices:
+            for relation in SHARD_RELATIONS:
+                nodes.update(dict.fromkeys(self.gs.index.targets(relation, invoice)))
+        return list(nodes)
+
+    # Loading on demand
+
+    def ensure_resident(self, periods: Iterable[Optional[str]]):
+        """Loads any of `periods` that are cold back into the graph and marks them as used."""
+        now = time.monotonic()
+        for period in periods:
+            if period is None:
+                continue
+            self.last_access[period] = now
+            if period in self.cold and not self.gs.read_only:
+                self.load(period)
+
+    def ensure_invoice(self, invoice_id: str, period: Optional[str] = None) -> bool:
+        """
+        Makes an invoice resident if it lives in a cold shard (`period` is loaded first when
+        given); returns whether it is now in the graph.
+        """
+        node_id = f"Invoice:{invoice_id}"
+        if period is not None:
+            self.ensure_resident([period])
+        if not self.gs.g.has_node(node_id) and not self.gs.read_only:
+            cold_period = self.locate_cold_invoice(invoice_id)
+            if cold_period is not None:
+                self.ensure_resident([cold_period])
+        return self.gs.g.has_node(node_id)
+
+    def ensure_invoices(self, invoice_ids: Iterable[str]):
+        """
+        Loads the cold shards holding any of these invoices, so filings and re-ingested invoices
+        written for them land on the stored invoice: a filing from a later period must not create
+        a bare invoice node, and an invoice re-ingested under another period must replace its old
+        trade projection contribution rather than add a second one. Each cold shard is opened
+        once for the whole batch.
+        """
+        if not self.cold or self.gs.read_only:
+            return
+        missing = [f"Invoice:{invoice_id}" for invoice_id in dict.fromkeys(invoice_ids)
+                   if (self.gs.get_node(f"Invoice:{invoice_id}") or {}).get("type") != "Invoice"]
+        for period in self.cold_periods():
+            if not missing:
+                break
+            compact = self.open_cold(period)
+            if any(compact.has_node(node) for node in missing):
+                self.ensure_resident([period])
+                missing = [node for node in missing if (self.gs.get_node(node) or {}).get("type") != "Invoice"]
+
+    def open_cold(self, period: str) -> CompactGraph:
+        """A cold period's shard, memory-mapped read-only."""
+        return CompactGraph.load(self._path(period), mmap=True)
+
+    def locate_cold_invoice(self, invoice_id: str, period: Optional[str] = None) -> Optional[str]:
+        """
+        The cold period whose shard holds the invoice (trying `period` first), or None. Probes
+        by binary search over each shard's memory-mapped keys without loading it.
+        """
+        node_id = f"Invoice:{invoice_id}"
+        candidates = self.cold_periods()
+        if period in self.cold:
+            candidates.remove(period)
+            candidates.insert(0, period)
+        for cold_period in candidates:
+            if self.open_cold(cold_period).has_node(node_id):
+                return cold_period
+        return None
+
+    def load(self, period: str):
+        """
+        Merges a cold shard back into the live graph. Nodes already present and typed in the live
+        graph (shared taxpayers, invoices re-filed since) win over the stored copy; the trade
+        projection already includes the shard, so it is left untouched.
+        """
+        with self.persistence.lock:
+            if period not in self.cold:
+                return
+            started = time.perf_counter()
+            compact = self.open_cold(period)
+            keys = compact.keys.to_list()
+            g, index = self.gs.g, self.gs.index
+            skipped = set()
+            nodes = []
+            for key, attrs in zip(keys, compact.iter_node_attrs(keys)):
+                if g.nodes[key].get("type") if g.has_node(key) else None:
+                    skipped.add(key)
+                else:
+                    nodes.append((key, attrs))
+            g.add_nodes_from(nodes)
+            for u, v, relation in compact.iter_edges(keys):
+                # An invoice re-ingested while its period was cold keeps its current parties
+                if relation == "SUPPLIED_BY" and v in skipped or relation == "PURCHASED_BY" and u in skipped:
+                    continue
+                g.add_edge(u, v, relation=relation)
+                if relation:
+                    index.add_edge(u, v, relation)
+            for key, attrs in nodes:
+                if attrs.get("type") == "Invoice":
+                    index.set_period(key, attrs.get("period"))
+            # The shard's invoices (and live invoices it adds filings to) are already counted in
+            # the feature store; refreshing them reconciles any change made while they were cold
+            for key in keys:
+                if key.startswith("Invoice:"):
+                    self.gs.features.on_invoice_changed(key)
+            self.cold.discard(period)
+            self.gs._touch()
+            logger.info("Loaded cold period %s: %d nodes in %.2fs", period, len(nodes), time.perf_counter() - started)
+
+    # Eviction
+
+    def evict(self, period: str) -> int:
+        """
+        Writes a resident period's shard to cold storage and removes it from the graph.
+        Returns the number of nodes evicted (0 when cold storage is not configured).
+        """
+        if self.cold_dir is None:
+            return 0
+        with self.persistence.lock:
+            nodes = self.shard_nodes(period)
+            if not nodes:
+                return 0
+            g, index = self.gs.g, self.gs.index
+            shard = nx.DiGraph()
+            shard.add_nodes_from((n, g.nodes[n]) for n in nodes)
+            edges = list(dict.fromkeys(list(g.in_edges(nodes, data="relation")) + list(g.out_edges(nodes, data="relation"))))
+            for u, v, relation in edges:
+                for endpoint in (u, v):
+                    if not shard.has_node(endpoint):
+                        shard.add_node(endpoint, **g.nodes[endpoint])
+                shard.add_edge(u, v, relation=relation)
+
+            # Durable on disk before anything leaves memory
+            path = self._path(period)
+            tmp_path = f"{path}.tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            CompactGraph.from_graph(shard).save(tmp_path)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+
+            for u, v, relation in edges:
+                if relation:
+                    index.remove_edge(u, v, relation)
+            g.remove_nodes_from(nodes)
+            index.invoices_by_period.pop(period, None)
+            self.cold.add(period)
+            self.last_access.pop(period, None)
+            self.gs._touch()
+            logger.info("Evicted period %s to cold storage: %d nodes", period, len(nodes))
+            return len(nodes)
+
+    def retention_candidates(self) -> List[str]:
+        """
+        Periods GST_RETAIN_PERIODS would evict: every resident period older than the N most
+        recent, unless it was used within the last GST_COLD_IDLE_SECONDS.
+        """
+        if config.RETAIN_PERIODS <= 0 or self.cold_dir is None:
+            return []
+        now = time.monotonic()
+        return [period for period in self.resident_periods()[:-config.RETAIN_PERIODS]
+                if now - self.last_access.get(period, float("-inf")) >= config.COLD_IDLE_SECONDS]
+
+    def enforce_retention(self) -> List[str]:
+        """Applies GST_RETAIN_PERIODS (see retention_candidates). Returns the evicted periods."""
+        return [period for period in self.retention_candidates() if self.evict(period)]
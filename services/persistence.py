@@ -0,0 +1,224 @@
+"""
+Durable state for the in-memory graph: periodic compact snapshots plus a write-ahead log.
+
+Layout of the data directory:
+
+    snapshots/snap-<version>/   compact graph arrays (memory-mappable) + meta.json
+    CURRENT                     name of the latest complete snapshot
+    wal/<segment>.ndjson        accepted /ingest/* batches, one JSON line per batch
+    cold/<period>/              evicted tax periods (see services/period_shards.py)
+
+Every ingest batch is appended (and fsynced) to the open WAL segment before it is applied.
+Taking a snapshot seals the open segment, so the snapshot covers exactly the sealed
+segments; they are deleted once the snapshot is durable. Recovery loads the CURRENT
+snapshot and replays the remaining segments in order.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import ExitStack
+from typing import Dict, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+import config
+from services.compact_graph import CompactGraph
+from services.graph_store import GraphStore
+
+logger = logging.getLogger(__name__)
+
+class GraphPersistence:
+    def __init__(self):
+        self.data_dir: Optional[str] = None
+        # Held while a batch is logged and applied, and while a snapshot cuts the log,
+        # so every snapshot corresponds to a whole number of WAL batches.
+        self.lock = threading.RLock()
+        self._segment = 0
+        self._wal = None
+        self.last_snapshot_version: Optional[int] = None
+        # time.monotonic() when it was taken; None if it was found on disk at recovery
+        self.last_snapshot_at: Optional[float] = None
+        # Snapshots background jobs are running on, by name; pruning leaves them alone
+        self._held: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.data_dir is not None
+
+    def open(self, data_dir: str):
+        self.data_dir = data_dir
+        os.makedirs(self._wal_dir, exist_ok=True)
+        os.makedirs(self._snapshot_dir, exist_ok=True)
+        os.makedirs(self.cold_dir, exist_ok=True)
+
+    def close(self):
+        with self.lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+        self.data_dir = None
+
+    @property
+    def _wal_dir(self) -> str:
+        return os.path.join(self.data_dir, "wal")
+
+    @property
+    def _snapshot_dir(self) -> str:
+        return os.path.join(self.data_dir, "snapshots")
+
+    @property
+    def cold_dir(self) -> str:
+        return os.path.join(self.data_dir, "cold")
+
+    def _segments(self) -> List[int]:
+        return sorted(int(f.split(".")[0]) for f in os.listdir(self._wal_dir) if f.endswith(".ndjson"))
+
+    def has_wal(self) -> bool:
+        return bool(self._segments())
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self._wal_dir, f"{segment:08d}.ndjson")
+
+    # Write-ahead log
+
+    def append(self, kind: str, records: Iterable[BaseModel]):
+        """Durably records one ingest batch. No-op when persistence is not configured."""
+        if not self.enabled:
+            return
+        line = json.dumps({"kind": kind, "records": [r.model_dump() for r in records]})
+        with self.lock:
+            if self._wal is None:
+                self._wal = open(self._segment_path(self._segment), "a", encoding="utf-8")
+            self._wal.write(line + "\n")
+            self._wal.flush()
+            if config.WAL_FSYNC:
+                os.fsync(self._wal.fileno())
+
+    # Snapshots
+
+    def snapshot(self, store: GraphStore) -> Optional[str]:
+        """Writes a snapshot of the graph and drops the WAL segments it covers."""
+        if not self.enabled:
+            return None
+        with ExitStack() as pin:
+            with self.lock:
+                # Pin the version that holds exactly the batches logged so far (publishing any
+                # still held in a fork); ingestion carries on (on a copy) while it is encoded
+                store.flush()
+                gs = pin.enter_context(store.read())
+                version = gs.version
+                # Seal the open segment; later batches go to a new one
+                covered = self._segment
+                if self._wal is not None:
+                    self._wal.close()
+                    self._wal = None
+                self._segment += 1
+            compact = CompactGraph.from_graph(gs.g)
+
+        name = f"snap-{version:012d}"
+        path = os.path.join(self._snapshot_dir, name)
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        compact.save(tmp_path)
+        with open(os.path.join(tmp_path, "wal.json"), "w", encoding="utf-8") as fh:
+            json.dump({"covers_segment": covered}, fh)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+        tmp = os.path.join(self.data_dir, "CURRENT.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(name)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, os.path.join(self.data_dir, "CURRENT"))
+
+        for segment in self._segments():
+            if segment <= covered:
+                os.remove(self._segment_path(segment))
+        with self.lock:
+            self._prune_snapshots(keep=name)
+            self.last_snapshot_version = version
+            self.last_snapshot_at = time.monotonic()
+        logger.info("Wrote snapshot %s (graph version %d)", name, version)
+        return path
+
+    def current_snapshot(self) -> Optional[str]:
+        return current_snapshot(self.data_dir)
+
+    def hold_snapshot(self) -> Optional[Tuple[str, int]]:
+        """(path, version) of the latest snapshot, kept on disk until release_snapshot(path)."""
+        with self.lock:
+            path = self.current_snapshot() if self.enabled else None
+            if path is None or self.last_snapshot_version is None:
+                return None
+            name = os.path.basename(path)
+            self._held[name] = self._held.get(name, 0) + 1
+            return path, self.last_snapshot_version
+
+    def release_snapshot(self, path: str):
+        with self.lock:
+            name = os.path.basename(path)
+            self._held[name] -= 1
+            if not self._held[name]:
+                del self._held[name]
+
+    def _prune_snapshots(self, keep: str):
+        names = sorted(n for n in os.listdir(self._snapshot_dir) if n.startswith("snap-") and not n.endswith((".tmp", ".old")))
+        # At least the newest is kept (GST_SNAPSHOT_RETAIN=0 would slice to nothing and keep them
+        # all). Held snapshots are skipped and go with the first snapshot taken after their release.
+        for name in names[:-max(1, config.SNAPSHOT_RETAIN)]:
+            if name != keep and name not in self._held:
+                shutil.rmtree(os.path.join(self._snapshot_dir, name), ignore_errors=True)
+
+    # Recovery
+
+    def recover(self, store: GraphStore) -> dict:
+        """Loads the latest snapshot into the store's graph and replays the WAL written after it."""
+        from services.ingest_service import IngestService, RECORD_MODELS
+        from services.period_shards import PeriodShards
+        covered = -1
+        snapshot = self.current_snapshot()
+        if snapshot is not None:
+            with store.write() as gs:
+                gs.load_snapshot(snapshot)
+            with open(os.path.join(snapshot, "wal.json"), encoding="utf-8") as fh:
+                covered = json.load(fh)["covers_segment"]
+            self.last_snapshot_version = store.version
+
+        ingest = IngestService(store, self)
+        batches = rows = 0
+        segments = [s for s in self._segments() if s > covered]
+        for segment in segments:
+            with open(self._segment_path(segment), encoding="utf-8") as fh:
+                for line in fh:
+                    if not line.strip():
+                        continue
+                    try:
+                        batch = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final write from a crash; everything before it was applied
+                        logger.warning("Ignoring truncated WAL record in segment %d", segment)
+                        break
+                    model = RECORD_MODELS[batch["kind"]]
+                    rows += ingest.apply(batch["kind"], [model.model_validate(r) for r in batch["records"]], log=False)
+                    batches += 1
+        # Keep appending after the newest segment seen
+        self._segment = max([covered + 1] + [s + 1 for s in segments])
+        # Find the evicted periods and build the feature store now, so read views (which can't
+        # set these up) see them
+        with store.write() as gs:
+            PeriodShards(gs, self)
+            gs.features.flush(gs)
+        return {"snapshot": snapshot, "wal_batches": batches, "wal_rows": rows}
+
+def current_snapshot(data_dir: str) -> Optional[str]:
+    """Path of the latest complete snapshot in `data_dir` (readers use this without opening the WAL)."""
+    marker = os.path.join(data_dir, "CURRENT")
+    if not os.path.exists(marker):
+        return None
+    with open(marker, encoding="utf-8") as fh:
+        return os.path.join(data_dir, "snapshots", fh.read().strip())
+
+# Process-wide instance, configured by main.py's lifespan when GST_DATA_DIR is set
+graph_persistence = GraphPersistence()
@@ -0,0 +1,215 @@
+"""
+Trained vendor-risk model: a gradient-boosted classifier over the feature store's columns
+(services/feature_store.py), trained offline on synthetic labelled filings.
+
+    python -m services.risk_model --out-dir artifacts/ --taxpayers 3000 --seed 7
+
+Training uses scikit-learn's HistGradientBoostingClassifier. The fitted trees are then
+compiled into flat node arrays, so serving only needs NumPy. scikit-learn has no public
+export of those trees, so compiling reads the estimator's fitted predictors; requirements.txt
+pins the minor release this was verified against, and train() refuses to save a compiled
+model that disagrees with the estimator's own predictions. Prediction walks every tree
+one level at a time for all rows at once, which costs microseconds per vendor for a whole
+network and stays cheap for a single row. scikit-learn's own predict has milliseconds of
+per-call overhead.
+
+Each training run writes a new versioned artifact directory, artifacts/vendor_risk-NNNN/
+(model.npz plus meta.json with the feature columns, metrics and feature importance).
+load_latest() picks the highest version.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from services.feature_store import FEATURE_COLUMNS
+
+ARTIFACT_PREFIX = "vendor_risk-"
+
+# How per-feature importance is summarised in API responses (the keys MLService has always returned)
+FEATURE_GROUPS = {
+    "circular_trading_involvement": ["cycle_involvements"],
+    "network_risk_propagation": ["propagated_risk_score"],
+    "historical_mismatches": [c for c in FEATURE_COLUMNS if c not in ("cycle_involvements", "propagated_risk_score")],
+}
+
+class VendorRiskModel:
+    """A compiled binary gradient-boosted ensemble: P(fraudulent) from a feature vector."""
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: dict):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.missing_left = arrays["missing_left"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.meta = meta
+        self.version: int = meta["version"]
+        self.feature_columns: List[str] = meta["feature_columns"]
+        self.baseline: float = meta["baseline"]
+        self.depth: int = meta["max_depth"]
+
+    @classmethod
+    def from_estimator(cls, clf, feature_columns: Sequence[str], meta: dict) -> "VendorRiskModel":
+        """
+        Flattens a fitted HistGradientBoostingClassifier (binary, numeric features). Reads the
+        private _predictors and _baseline_prediction, hence the scikit-learn pin.
+        """
+        feature, threshold, missing_left, left, right, value, roots = [], [], [], [], [], [], []
+        offset, depth = 0, 0
+        for (predictor,) in clf._predictors:
+            nodes = predictor.nodes
+            roots.append(offset)
+            leaf = nodes["is_leaf"].astype(bool)
+            # Leaves point at themselves, so extra levels of the walk leave them in place
+            own = np.arange(offset, offset + len(nodes))
+            feature.append(np.where(leaf, 0, nodes["feature_idx"]))
+            threshold.append(np.where(leaf, np.inf, nodes["num_threshold"]))
+            missing_left.append(np.where(leaf, True, nodes["missing_go_to_left"].astype(bool)))
+            left.append(np.where(leaf, own, nodes["left"].astype(np.int64) + offset))
+            right.append(np.where(leaf, own, nodes["right"].astype(np.int64) + offset))
+            value.append(np.where(leaf, nodes["value"], 0.0))
+            depth = max(depth, int(nodes["depth"].max()))
+            offset += len(nodes)
+        arrays = {
+            "feature": np.concatenate(feature).astype(np.int32),
+            "threshold": np.concatenate(threshold).astype(np.float64),
+            "missing_left": np.concatenate(missing_left),
+            "left": np.concatenate(left).astype(np.int64),
+            "right": np.concatenate(right).astype(np.int64),
+            "value": np.concatenate(value).astype(np.float64),
+            "roots": np.array(roots, dtype=np.int64),
+        }
+        meta = dict(meta, feature_columns=list(feature_columns), baseline=float(np.ravel(clf._baseline_prediction)[0]),
+                    max_depth=depth, n_trees=len(roots))
+        return cls(arrays, meta)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """P(fraudulent) for each row of X (columns in `feature_columns` order)."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.depth):
+            x = X[rows, self.feature[node]]
+            go_left = np.where(np.isnan(x), self.missing_left[node], x <= self.threshold[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        raw = self.baseline + self.value[node].sum(axis=1)
+        return 1.0 / (1.0 + np.exp(-raw))
+
+    def predict_one(self, features: Dict[str, float]) -> float:
+        """Single-row fast path for a features dict (missing features count as 0)."""
+        x = np.array([float(features.get(c, 0.0) or 0.0) for c in self.feature_columns])
+        node = self.roots
+        for _ in range(self.depth):
+            xs = x[self.feature[node]]
+            node = np.where(np.where(np.isnan(xs), self.missing_left[node], xs <= self.threshold[node]), self.left[node], self.right[node])
+        raw = self.baseline + self.value[node].sum()
+        return float(1.0 / (1.0 + np.exp(-raw)))
+
+    def grouped_importance(self) -> Dict[str, float]:
+        importance = self.meta.get("feature_importance", {})
+        return {group: round(sum(importance.get(c, 0.0) for c in columns), 4) for group, columns in FEATURE_GROUPS.items()}
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, "model.npz"), feature=self.feature, threshold=self.threshold,
+                 missing_left=self.missing_left, left=self.left, right=self.right, value=self.value, roots=self.roots)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(self.meta, fh, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "VendorRiskModel":
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        with np.load(os.path.join(path, "model.npz")) as data:
+            arrays = {name: data[name] for name in data.files}
+        return cls(arrays, meta)
+
+def artifact_versions(model_dir: str) -> List[int]:
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(int(name[len(ARTIFACT_PREFIX):]) for name in os.listdir(model_dir)
+                  if name.startswith(ARTIFACT_PREFIX) and name[len(ARTIFACT_PREFIX):].isdigit())
+
+def load_latest(model_dir: str) -> Optional[VendorRiskModel]:
+    """The highest-versioned artifact in `model_dir`, or None if there is none."""
+    versions = artifact_versions(model_dir)
+    if not versions:
+        return None
+    return VendorRiskModel.load(os.path.join(model_dir, f"{ARTIFACT_PREFIX}{versions[-1]:04d}"))
+
+# Training
+
+def build_training_set(n_taxpayers: int, n_invoices: int, seed: int):
+    """Synthetic network -> graph -> feature table, joined with the generator's labels."""
+    import networkx as nx
+    from services.graph_store import GraphStore
+    from services.ingest_service import IngestService
+    from services.persistence import GraphPersistence
+    from services.synthetic_data import generate_network
+
+    records, labels = generate_network(n_taxpayers=n_taxpayers, n_invoices=n_invoices, seed=seed)
+    store = GraphStore(nx.DiGraph())
+    ingest = IngestService(store, GraphPersistence())
+    for kind, recs in records.items():
+        for start in range(0, len(recs), 5000):
+            ingest.apply(kind, recs[start:start + 5000], log=False)
+    with store.read() as gs:
+        frame = gs.features.to_frame(gs)
+    y = np.array([labels.get(gstin, 0) for gstin in frame.index])
+    return frame[FEATURE_COLUMNS].to_numpy(dtype=np.float64), y
+
+def train(X: np.ndarray, y: np.ndarray, seed: int = 0, version: int = 1) -> VendorRiskModel:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.inspection import permutation_importance
+    from sklearn.metrics import average_precision_score, roc_auc_score
+    from sklearn.model_selection import train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, stratify=y, random_state=seed)
+    params = {"max_iter": 150, "learning_rate": 0.1, "max_depth": 4, "min_samples_leaf": 20, "random_state": seed}
+    clf = HistGradientBoostingClassifier(**params).fit(X_train, y_train)
+
+    proba = clf.predict_proba(X_test)[:, 1]
+    importance = permutation_importance(clf, X_test, y_test, scoring="roc_auc", n_repeats=5, random_state=seed).importances_mean
+    importance = np.clip(importance, 0.0, None)
+    importance = importance / importance.sum() if importance.sum() > 0 else importance
+    meta = {
+        "version": version,
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "estimator": "sklearn.ensemble.HistGradientBoostingClassifier",
+        "params": params,
+        "training_rows": int(len(X_train)),
+        "metrics": {"roc_auc": float(roc_auc_score(y_test, proba)), "average_precision": float(average_precision_score(y_test, proba))},
+        "feature_importance": {c: round(float(v), 4) for c, v in zip(FEATURE_COLUMNS, importance)},
+    }
+    model = VendorRiskModel.from_estimator(clf, FEATURE_COLUMNS, meta)
+    # The compiled ensemble must agree with the estimator it came from
+    if not np.allclose(model.predict_proba(X_test), proba, atol=1e-6):
+        raise RuntimeError("Compiled model disagrees with the trained estimator")
+    return model
+
+def main(argv: Optional[List[str]] = None):
+    import config
+    parser = argparse.ArgumentParser(description="Train the vendor-risk model on synthetic labelled filings")
+    parser.add_argument("--out-dir", default=config.MODEL_DIR, help="Artifact directory (default: GST_MODEL_DIR)")
+    parser.add_argument("--taxpayers", type=int, default=3000)
+    parser.add_argument("--invoices", type=int, default=60000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    X, y = build_training_set(args.taxpayers, args.invoices, args.seed)
+    versions = artifact_versions(args.out_dir)
+    model = train(X, y, seed=args.seed, version=(versions[-1] + 1) if versions else 1)
+    path = os.path.join(args.out_dir, f"{ARTIFACT_PREFIX}{model.version:04d}")
+    model.save(path)
+    metrics = model.meta["metrics"]
+    print(f"Trained on {len(X)} taxpayers ({int(y.sum())} labelled fraudulent) in {time.perf_counter() - started:.1f}s: "
+          f"ROC AUC {metrics['roc_auc']:.3f}, average precision {metrics['average_precision']:.3f}")
+    print(f"Wrote {path}")
+
+if __name__ == "__main__":
+    main()
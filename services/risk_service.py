@@ -1,63 +1,151 @@
 from services.graph_service import GraphService
 import networkx as nx
-from typing import List, Dict, Any
+import config
+from services.propagation import pagerank_sparse
+from services.period_shards import PeriodShards
+from typing import List, Dict, Any, Optional
+
+# Trade-edge attributes that can be used to weight risk propagation
+TRADE_WEIGHTS = ("invoice_count", "taxable_value", "tax_value")
+
+# Bounds for cycle enumeration; longer loops are rare and their number explodes
+MAX_CYCLE_LENGTH = 6
+MAX_CYCLES = 100
 
 class RiskService:
     def __init__(self, graph_service: GraphService):
         self.gs = graph_service
 
-    def detect_circular_trading(self, gstin: str) -> List[List[str]]:
+    def detect_circular_trading(self, gstin: str, max_length: int = MAX_CYCLE_LENGTH, limit: int = MAX_CYCLES) -> List[List[str]]:
         """
         Detects if the given GSTIN is involved in any circular trading loops.
-        We create a projected graph of Taxpayer -> Taxpayer where an edge exists
+        Uses the projected graph of Taxpayer -> Taxpayer where an edge exists
         if Taxpayer 1 supplied to Taxpayer 2.
-        Then we look for cycles involving `gstin`.
+        Only the strongly connected component containing `gstin` can hold such a
+        loop, so taxpayers outside any loop are answered from the SCC index; the
+        search itself is bounded by `max_length` hops and `limit` results.
+        Each cycle is returned starting at the target taxpayer.
         """
-        # Create a taxpayer-only directed graph
-        taxpayer_graph = nx.DiGraph()
-        for u, v, attrs in self.gs.g.edges(data=True):
-            if attrs.get("relation") == "SUPPLIED_BY":
-                # u is Taxpayer, v is Invoice
-                supplier = u
-                # Find who purchased this invoice
-                purchasers = [p for inv, p, p_attrs in self.gs.g.edges(v, data=True) if p_attrs.get("relation") == "PURCHASED_BY"]
-                for p in purchasers:
-                    taxpayer_graph.add_edge(supplier, p)
-
         target_node = f"Taxpayer:{gstin}"
-        if target_node not in taxpayer_graph.nodes:
+        # O(1) answer from the incrementally maintained SCC index
+        if not self.gs.cycle_index.in_loop(target_node):
             return []
 
-        # Find cycles
-        try:
-            cycles = list(nx.simple_cycles(taxpayer_graph))
-            # Filter cycles that include our target GSTIN
-            relevant_cycles = [cycle for cycle in cycles if target_node in cycle]
-            return relevant_cycles
-        except nx.NetworkXNoCycle:
-            return []
+        taxpayer_graph = self.gs.trade_graph
+        cycles = []
+        if taxpayer_graph.has_edge(target_node, target_node):
+            cycles.append([target_node])
+
+        # Hops needed to get back to the target, for pruning. In a small-world trade network
+        # nearly the whole SCC is within max_length hops, so the walk back only goes half way:
+        # a node it didn't reach is at least back_depth + 1 hops from the target, which is
+        # enough to prune the deep end of the search (and keeps it inside the SCC there).
+        back_depth = max_length // 2
+        back_distance = {target_node: 0}
+        frontier = [target_node]
+        for depth in range(1, back_depth + 1):
+            next_frontier = []
+            for node in frontier:
+                for pred in taxpayer_graph.predecessors(node):
+                    if pred not in back_distance:
+                        back_distance[pred] = depth
+                        next_frontier.append(pred)
+            frontier = next_frontier
+        farther = back_depth + 1
 
-    def calculate_risk_propagation(self) -> Dict[str, float]:
+        path = [target_node]
+        on_path = {target_node}
+        stack = [iter(taxpayer_graph.successors(target_node))]
+        while stack and len(cycles) < limit:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                on_path.discard(path.pop())
+                continue
+            if node == target_node:
+                if len(path) > 1:
+                    cycles.append(list(path))
+                continue
+            if node in on_path:
+                continue
+            # Prune branches that cannot close the loop within max_length
+            if len(path) + back_distance.get(node, farther) > max_length:
+                continue
+            path.append(node)
+            on_path.add(node)
+            stack.append(iter(taxpayer_graph.successors(node)))
+
+        return cycles[:limit]
+
+    def find_period_cycles(self, period: str, max_length: int = MAX_CYCLE_LENGTH, limit: int = MAX_CYCLES) -> List[Dict[str, Any]]:
+        """
+        Lists trading loops formed by the invoices of one period, with the value flowing
+        through each. Only that period's shard is read: its trade projection is built from
+        the period index and cycles are only enumerated inside its non-trivial SCCs.
+        """
+        PeriodShards(self.gs).ensure_resident([period])
+        period_graph = self.gs.period_trade_graph(period)
+
+        loops = []
+        for scc in nx.strongly_connected_components(period_graph):
+            if len(scc) == 1 and not period_graph.has_edge(next(iter(scc)), next(iter(scc))):
+                continue
+            sub = period_graph.subgraph(scc)
+            for cycle in nx.simple_cycles(sub, length_bound=max_length):
+                edges = []
+                for i, u in enumerate(cycle):
+                    v = cycle[(i + 1) % len(cycle)]
+                    e = period_graph.edges[u, v]
+                    edges.append({
+                        "supplier_gstin": u.split(":", 1)[1],
+                        "buyer_gstin": v.split(":", 1)[1],
+                        "invoice_count": e["invoice_count"],
+                        "taxable_value": e["taxable_value"],
+                        "tax_value": e["tax_value"],
+                    })
+                loops.append({
+                    "gstins": [n.split(":", 1)[1] for n in cycle],
+                    "length": len(cycle),
+                    "edges": edges,
+                    # The most value that can have gone all the way round the loop
+                    "circulating_value": min(e["taxable_value"] for e in edges),
+                    "circulating_tax": min(e["tax_value"] for e in edges),
+                    "total_taxable_value": sum(e["taxable_value"] for e in edges),
+                })
+                if len(loops) >= limit:
+                    return loops
+        return loops
+
+    def calculate_risk_propagation(self, weight: Optional[str] = None, period: Optional[str] = None) -> Dict[str, float]:
         """
         Uses PageRank-like algorithm to propagate risk through the supply chain.
         Returns a dictionary mapping Taxpayer ID to their propagated risk score.
+        `weight` may name a trade-edge attribute ("invoice_count", "taxable_value",
+        "tax_value") to propagate risk in proportion to trade volume.
+        With `period`, risk is propagated over that period's trade only.
+
+        Scores are cached against the trade projection's version and returned as-is
+        (treat the dict as read-only) until more than PROPAGATION_STALENESS_THRESHOLD
+        changes have accumulated; recomputation warm-starts from the previous vector.
         """
-        taxpayer_graph = nx.DiGraph()
-        
-        # Build the graph of risk flow. Risk flows from Supplier -> Buyer.
-        # But for PageRank, "importance" flows along edges. So if A supplies B,
-        # B's risk increases if A is risky. 
-        # Edge: B -> A (so A's risk flows to B in standard PageRank formulation, wait actually PR flows A->B if edge is A->B).
-        # We want risk to flow from Supplier to Buyer.
-        for u, v, attrs in self.gs.g.edges(data=True):
-            if attrs.get("relation") == "SUPPLIED_BY":
-                supplier = u
-                purchasers = [p for inv, p, p_attrs in self.gs.g.edges(v, data=True) if p_attrs.get("relation") == "PURCHASED_BY"]
-                for buyer in purchasers:
-                    # Risk flows from supplier to buyer
-                    taxpayer_graph.add_edge(supplier, buyer)
+        cache = self.gs.g.graph.setdefault("propagation_cache", {})
+        cache_key = weight if period is None else (weight, period)
+        entry = cache.get(cache_key)
+        current_version = self.gs.trade_version
+        if entry is not None and current_version - entry["version"] <= config.PROPAGATION_STALENESS_THRESHOLD:
+            return entry["scores"]
+
+        # Risk flows from Supplier -> Buyer: if A supplies B, B's risk increases
+        # if A is risky. PageRank flows mass along edge direction, so the
+        # supplier -> buyer trade projection is used as-is.
+        if period is None:
+            taxpayer_graph = self.gs.trade_graph
+        else:
+            PeriodShards(self.gs).ensure_resident([period])
+            taxpayer_graph = self.gs.period_trade_graph(period)
 
         if len(taxpayer_graph.nodes) == 0:
+            cache[cache_key] = {"version": current_version, "scores": {}, "raw": {}, "ranking": []}
             return {}
 
         # Initialize base risk (personalization vector for PageRank)
@@ -73,15 +161,31 @@ class RiskService:
         else:
             personalization = None
 
-        pr_scores = nx.pagerank(taxpayer_graph, alpha=0.85, personalization=personalization, weight=None)
+        # Warm start from the previous vector; a few new invoices barely move it
+        nstart = None
+        if entry is not None and entry["raw"]:
+            nstart = {k: entry["raw"].get(k, 0.0) for k in taxpayer_graph.nodes}
+            if sum(nstart.values()) <= 0:
+                nstart = None
+
+        if config.RISK_PROPAGATION_BACKEND == "sparse":
+            pr_scores = pagerank_sparse(taxpayer_graph, alpha=0.85, personalization=personalization, nstart=nstart, weight=weight)
+        else:
+            pr_scores = nx.pagerank(taxpayer_graph, alpha=0.85, personalization=personalization, nstart=nstart, weight=weight)
         
         # Scale back up
         max_pr = max(pr_scores.values()) if pr_scores else 1.0
         scaled_scores = {k: (v / max_pr) * 100 for k, v in pr_scores.items()}
+        cache[cache_key] = {"version": current_version, "scores": scaled_scores, "raw": pr_scores, "ranking": None}
         return scaled_scores
 
-    def get_top_risky_vendors(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Returns the top N vendors by risk score."""
-        scores = self.calculate_risk_propagation()
-        sorted_vendors = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    def get_top_risky_vendors(self, limit: int = 10, weight: Optional[str] = None, period: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Returns the top N vendors by risk score (optionally within one period's trade)."""
+        scores = self.calculate_risk_propagation(weight=weight, period=period)
+        entry = self.gs.g.graph["propagation_cache"][weight if period is None else (weight, period)]
+        # The sorted ranking is cached alongside the scores it was derived from
+        sorted_vendors = entry["ranking"]
+        if sorted_vendors is None or entry["scores"] is not scores:
+            sorted_vendors = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+            entry["ranking"] = sorted_vendors
         return [{"gstin": k.split(":")[1], "propagated_risk_score": v} for k, v in sorted_vendors[:limit]]
@@ -0,0 +1,145 @@
+"""
+Single-writer / multi-reader deployment.
+
+The graph is a module-level global, so separate uvicorn workers would each hold their own
+(empty) copy. Instead one writer process owns ingestion and the data directory and
+republishes the graph as a compact snapshot every GST_PUBLISH_INTERVAL_SECONDS (the usual
+snapshot + CURRENT pointer, see services/persistence.py). Reader processes serve the
+analysis and reconciliation endpoints from the latest published snapshot: its arrays are
+memory-mapped read-only, so every reader shares the same page-cache copy of the graph
+instead of holding its own.
+
+    python -m services.serving --data-dir data/ --readers 4
+    # writer (ingest + everything else) on :8001, readers (analysis) on :8000
+
+Readers see each batch once the writer has republished, so analysis results lag ingestion
+by up to the publish interval. Evicted (cold) periods are only loaded back by the writer.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional
+import networkx as nx
+import config
+from services.compact_graph import CompactGraph, CompactGraphService
+from services.graph_service import GraphService
+from services.graph_store import graph_store
+from services.period_shards import PeriodShards
+from services.persistence import current_snapshot, graph_persistence
+
+logger = logging.getLogger(__name__)
+
+class PublishedGraph:
+    """Reader-side handle on the writer's latest published snapshot."""
+    def __init__(self):
+        self.snapshot: Optional[str] = None
+        self.compact = CompactGraph.from_graph(nx.DiGraph())
+        self._lock = threading.Lock()
+
+    def refresh(self, data_dir: str) -> bool:
+        """Switches to the snapshot CURRENT points at, if it changed. Returns whether it did."""
+        path = current_snapshot(data_dir)
+        if path is None or path == self.snapshot:
+            return False
+        with self._lock:
+            if path == self.snapshot:
+                return False
+            compact = CompactGraph.load(path, mmap=True)
+            # Build the shared derived state (trade projection, features) before requests see it
+            gs = CompactGraphService(compact)
+            gs.features.flush(gs)
+            # Requests already running keep the graph they started with; the old mapping is
+            # released when the last of them finishes
+            self.compact, self.snapshot = compact, path
+        logger.info("Serving snapshot %s (%d nodes)", path, compact.number_of_nodes())
+        return True
+
+    def service(self) -> CompactGraphService:
+        return CompactGraphService(self.compact)
+
+# Process-wide instance, refreshed by main.py's lifespan when GST_ROLE=reader
+published_graph = PublishedGraph()
+
+@contextmanager
+def pinned_graph_service() -> Iterator[GraphService]:
+    """
+    Consistent read-only graph for one request: a pinned version of the live graph
+    (see services/graph_store.py), or in a reader the published snapshot.
+    """
+    if config.ROLE == "reader":
+        yield published_graph.service()
+        return
+    with graph_store.read() as gs:
+        yield gs
+
+def get_graph_service() -> Iterator[GraphService]:
+    """FastAPI dependency: the request's graph stays pinned until the response has been sent."""
+    with pinned_graph_service() as gs:
+        yield gs
+
+def get_period_graph_service(period: Optional[str] = None) -> Iterator[GraphService]:
+    """Like get_graph_service, for period-scoped routes: an evicted period is loaded back before pinning."""
+    load_cold_periods([period])
+    with pinned_graph_service() as gs:
+        yield gs
+
+def load_cold_periods(periods: Iterable[Optional[str]]):
+    """Loads evicted periods back into the live graph (in one write) so a view pinned afterwards has them."""
+    if config.ROLE == "reader":
+        return
+    periods = [p for p in periods if p is not None]
+    with graph_store.read() as gs:
+        shards = PeriodShards(gs)
+        shards.ensure_resident(periods)  # marks them as used
+        cold = [p for p in periods if p in shards.cold]
+    if cold:
+        with graph_persistence.lock, graph_store.write() as gs:
+            PeriodShards(gs).ensure_resident(cold)
+        # The caller pins next and must see them
+        graph_store.flush()
+
+def load_cold_invoice(invoice_id: str, period: Optional[str] = None):
+    """Loads the evicted period holding `invoice_id`, if any (see PeriodShards.ensure_invoice)."""
+    if config.ROLE == "reader":
+        return
+    with graph_store.read() as gs:
+        if gs.get_node(f"Invoice:{invoice_id}") is not None:
+            return
+        cold_period = PeriodShards(gs).locate_cold_invoice(invoice_id, period)
+    if cold_period is not None:
+        load_cold_periods([cold_period])
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run one writer and a pool of reader workers")
+    parser.add_argument("--data-dir", default=config.DATA_DIR or None, help="Shared data directory (default: GST_DATA_DIR)")
+    parser.add_argument("--readers", type=int, default=os.cpu_count() or 1, help="Reader worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000, help="Port the readers listen on")
+    parser.add_argument("--writer-port", type=int, default=8001, help="Port the writer listens on")
+    args = parser.parse_args(argv)
+    if not args.data_dir:
+        parser.error("--data-dir or GST_DATA_DIR is required")
+
+    def uvicorn(role: str, port: int, workers: int) -> subprocess.Popen:
+        env = dict(os.environ, GST_ROLE=role, GST_DATA_DIR=args.data_dir)
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", args.host, "--port", str(port), "--workers", str(workers)]
+        return subprocess.Popen(cmd, env=env)
+
+    processes = [uvicorn("writer", args.writer_port, 1), uvicorn("reader", args.port, args.readers)]
+    try:
+        for proc in processes:
+            proc.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in processes:
+            proc.terminate()
+        for proc in processes:
+            proc.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Seeded synthetic GST filings with known bad actors, for training the vendor-risk model and
+for benchmarking (services/benchmark.py).
+
+Honest taxpayers file almost everything correctly. Fraudulent ones (a `fraud_rate` share of
+the network) behave like the patterns the graph looks for: they skip GSTR-1 filings and
+whole periods, understate reported tax, inflate the ITC they claim, rarely generate IRNs,
+and trade in small rings that form circular trading loops. Labels are slightly noisy so the
+model can't simply memorise the generator.
+
+The same seed and parameters always give the same network. Records are generated in
+batches, so networks with millions of invoices can be streamed into ingest without holding
+them all in memory.
+"""
+import itertools
+import random
+from typing import Dict, Iterator, List, Set, Tuple
+from pydantic import BaseModel
+from models.schemas import EInvoiceRecord, GSTR1Record, GSTR2BRecord, Invoice, PurchaseRegisterEntry
+
+# Ingest kinds in the order the ingest routes expect them (invoices first)
+KINDS = ("invoice", "gstr1", "gstr2b", "purchase_register", "einvoice")
+
+class SyntheticNetwork:
+    """
+    n_taxpayers          GSTINs in the network
+    n_invoices           invoices drawn (self-trades are dropped, so slightly fewer are generated)
+    n_periods            monthly return periods, from 2024-01; invoices are spread evenly across them
+    fraud_rate           share of taxpayers that are fraudulent
+    label_noise          share of labels flipped
+    missing_filing_rate  chance an honest supplier leaves an invoice out of GSTR-1
+    irn_mismatch_rate    chance an honest supplier's e-invoice disagrees with the invoice's tax
+    ring_density         share of invoices traded inside the fraud rings
+    ring_length          (min, max) taxpayers per ring
+    """
+    def __init__(
+        self,
+        n_taxpayers: int = 2000,
+        n_invoices: int = 40000,
+        n_periods: int = 6,
+        fraud_rate: float = 0.08,
+        label_noise: float = 0.03,
+        missing_filing_rate: float = 0.03,
+        irn_mismatch_rate: float = 0.01,
+        ring_density: float = 0.15,
+        ring_length: Tuple[int, int] = (3, 5),
+        seed: int = 0,
+    ):
+        self.n_invoices = n_invoices
+        self.missing_filing_rate = missing_filing_rate
+        self.irn_mismatch_rate = irn_mismatch_rate
+        self.ring_density = ring_density
+        self.seed = seed
+
+        rng = random.Random(seed)
+        self.gstins = [f"SYN{i:06d}" for i in range(n_taxpayers)]
+        self.fraud: Set[str] = set(rng.sample(self.gstins, int(n_taxpayers * fraud_rate)))
+        fraud_list = sorted(self.fraud)
+        self.periods = [f"{2024 + m // 12}-{m % 12 + 1:02d}" for m in range(n_periods)]
+        # Periods each fraudulent taxpayer doesn't file GSTR-1 for at all
+        self.skipped = {g: set(rng.sample(self.periods, rng.randint(0, max(1, n_periods // 2)))) for g in fraud_list}
+
+        # Fraud rings trade among themselves in loops; everyone else trades with a skew towards
+        # a few large buyers
+        rng.shuffle(fraud_list)
+        low, high = ring_length
+        step = max(1, (low + high) // 2)
+        self.rings = [ring for ring in (fraud_list[i:i + rng.randint(low, high)] for i in range(0, len(fraud_list), step))
+                      if len(ring) > 1]
+        # Cumulative once, so drawing a pair is O(log n) instead of O(n) per invoice
+        self.cum_weights = list(itertools.accumulate(1.0 / (1 + i) ** 0.5 for i in range(n_taxpayers)))
+
+        self.labels: Dict[str, int] = {g: int(g in self.fraud) for g in self.gstins}
+        for g in rng.sample(self.gstins, int(n_taxpayers * label_noise)):
+            self.labels[g] = 1 - self.labels[g]
+
+    def batches(self, batch_size: int = 5000) -> Iterator[Dict[str, List[BaseModel]]]:
+        """Records by ingest kind, for `batch_size` invoices at a time."""
+        rng = random.Random(self.seed + 1)
+        batch = _empty()
+        for i in range(self.n_invoices):
+            self._invoice(rng, i, batch)
+            if (i + 1) % batch_size == 0:
+                yield batch
+                batch = _empty()
+        if batch["invoice"]:
+            yield batch
+
+    def _invoice(self, rng: random.Random, i: int, records: Dict[str, List[BaseModel]]):
+        period = self.periods[i * len(self.periods) // self.n_invoices]
+        if self.rings and rng.random() < self.ring_density:
+            ring = rng.choice(self.rings)
+            k = rng.randrange(len(ring))
+            supplier, buyer = ring[k], ring[(k + 1) % len(ring)]
+        else:
+            supplier, buyer = rng.choices(self.gstins, cum_weights=self.cum_weights, k=2)
+            if supplier == buyer:
+                return
+        is_fraud = supplier in self.fraud
+        taxable = round(rng.lognormvariate(10, 1.2), 2)
+        tax = round(taxable * rng.choice((0.05, 0.12, 0.18, 0.28)), 2)
+        invoice_id = f"SYN-{i:08d}"
+        records["invoice"].append(Invoice(invoice_id=invoice_id, supplier_gstin=supplier, buyer_gstin=buyer,
+                                          date=f"{period}-{rng.randint(1, 28):02d}", total_value=taxable,
+                                          tax_value=tax, period=period))
+
+        files_rate = 0.55 if is_fraud else 1.0 - self.missing_filing_rate
+        files = rng.random() < files_rate and not (is_fraud and period in self.skipped[supplier])
+        if files:
+            reported = tax * (rng.uniform(0.3, 0.9) if is_fraud and rng.random() < 0.4 else 1.0)
+            records["gstr1"].append(GSTR1Record(invoice_id=invoice_id, supplier_gstin=supplier, buyer_gstin=buyer,
+                                                period=period, tax_value=round(reported, 2)))
+            records["gstr2b"].append(GSTR2BRecord(invoice_id=invoice_id, supplier_gstin=supplier, buyer_gstin=buyer,
+                                                  period=period, itc_available=round(reported, 2)))
+        if rng.random() < 0.95:
+            claimed = tax * (rng.uniform(1.2, 2.0) if buyer in self.fraud and rng.random() < 0.5 else 1.0)
+            records["purchase_register"].append(PurchaseRegisterEntry(invoice_id=invoice_id, supplier_gstin=supplier,
+                                                                      buyer_gstin=buyer, period=period, tax_paid=round(claimed, 2)))
+        if rng.random() < (0.4 if is_fraud else 0.9):
+            matches_rate = 0.7 if is_fraud else 1.0 - self.irn_mismatch_rate
+            irn_tax = tax if rng.random() < matches_rate else round(tax * rng.uniform(0.5, 0.95), 2)
+            records["einvoice"].append(EInvoiceRecord(irn=f"IRN-{i:08d}", invoice_id=invoice_id, supplier_gstin=supplier,
+                                                      buyer_gstin=buyer, tax_value=irn_tax, date=f"{period}-01"))
+
+def _empty() -> Dict[str, List[BaseModel]]:
+    return {kind: [] for kind in KINDS}
+
+def generate_network(
+    n_taxpayers: int = 2000,
+    n_invoices: int = 40000,
+    n_periods: int = 6,
+    fraud_rate: float = 0.08,
+    label_noise: float = 0.03,
+    seed: int = 0,
+    **params,
+) -> Tuple[Dict[str, List[BaseModel]], Dict[str, int]]:
+    """
+    Returns (records by ingest kind, label by GSTIN: 1 = fraudulent). Records are in the
+    order the ingest routes expect (invoices first). `params` are the other SyntheticNetwork
+    parameters.
+    """
+    network = SyntheticNetwork(n_taxpayers=n_taxpayers, n_invoices=n_invoices, n_periods=n_periods,
+                               fraud_rate=fraud_rate, label_noise=label_noise, seed=seed, **params)
+    records = _empty()
+    for batch in network.batches():
+        for kind, recs in batch.items():
+            records[kind].extend(recs)
+    return records, network.labels
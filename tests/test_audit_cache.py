@@ -0,0 +1,67 @@
+import networkx as nx
+from agent.orchestrator import AuditContext, _audit_invoice
+from models.schemas import GSTR1Record, Invoice
+from services.audit_cache import AuditCache
+from services.graph_store import GraphStore
+from services.ingest_service import IngestService
+from services.persistence import GraphPersistence
+
+def _invoice(invoice_id: str, supplier: str, buyer: str) -> Invoice:
+    return Invoice(invoice_id=invoice_id, supplier_gstin=supplier, buyer_gstin=buyer,
+                   date="2024-09-01", total_value=1000.0, tax_value=180.0, period="2024-09")
+
+def _setup(invoices):
+    store = GraphStore(nx.DiGraph(), fork_interval=0)
+    ingest = IngestService(store, GraphPersistence())
+    ingest.apply("invoice", invoices)
+    cache = AuditCache(max_entries=100, max_lag=100)
+    store.on_publish(cache.on_publish)
+    return store, ingest, cache
+
+def _cache_audits(store, cache, invoice_ids):
+    with store.read() as gs:
+        ctx = AuditContext(gs)
+        for invoice_id in invoice_ids:
+            response, dependencies = _audit_invoice(gs, invoice_id, ctx)
+            cache.put(gs, invoice_id, response, dependencies)
+            assert cache.get(gs, invoice_id) is response
+
+def _cached(store, cache, invoice_id) -> bool:
+    with store.read() as gs:
+        return cache.get(gs, invoice_id) is not None
+
+def test_filing_evicts_only_its_invoice():
+    store, ingest, cache = _setup([_invoice("INV-AB", "GSTIN_A", "GSTIN_B"), _invoice("INV-CD", "GSTIN_C", "GSTIN_D")])
+    _cache_audits(store, cache, ["INV-AB", "INV-CD"])
+
+    ingest.apply("gstr1", [GSTR1Record(invoice_id="INV-AB", supplier_gstin="GSTIN_A", buyer_gstin="GSTIN_B",
+                                       tax_value=180.0, period="2024-09")])
+
+    assert not _cached(store, cache, "INV-AB")
+    assert _cached(store, cache, "INV-CD")
+
+def test_edge_closing_a_loop_evicts_audits_of_its_members():
+    # A -> B -> C, plus an unrelated D -> E
+    store, ingest, cache = _setup([_invoice("INV-AB", "GSTIN_A", "GSTIN_B"), _invoice("INV-BC", "GSTIN_B", "GSTIN_C"),
+                                   _invoice("INV-DE", "GSTIN_D", "GSTIN_E")])
+    _cache_audits(store, cache, ["INV-BC", "INV-DE"])
+
+    # C -> A closes A -> B -> C -> A. B is neither end of the new edge; only the loop check finds it
+    ingest.apply("invoice", [_invoice("INV-CA", "GSTIN_C", "GSTIN_A")])
+
+    assert not _cached(store, cache, "INV-BC")
+    assert _cached(store, cache, "INV-DE")
+    with store.read() as gs:
+        response, _ = _audit_invoice(gs, "INV-BC", AuditContext(gs))
+    assert response.overall_risk == "Critical (Cycle Detected)"
+
+def test_loop_longer_than_audit_limit_keeps_entries():
+    # T0 -> T1 -> ... -> T6: closing it with T6 -> T0 makes a 7-taxpayer loop, longer than the
+    # 6 the audit reports, so T3's invoice audit is unchanged
+    gstins = [f"GSTIN_T{i}" for i in range(7)]
+    store, ingest, cache = _setup([_invoice(f"INV-{i}", gstins[i], gstins[i + 1]) for i in range(6)])
+    _cache_audits(store, cache, ["INV-3"])
+
+    ingest.apply("invoice", [_invoice("INV-6", gstins[6], gstins[0])])
+
+    assert _cached(store, cache, "INV-3")
@@ -0,0 +1,120 @@
+import networkx as nx
+import pytest
+from services.graph_store import GraphStore
+
+def _add_invoice(gs, invoice_id: str, supplier: str = "GSTIN_A", buyer: str = "GSTIN_B"):
+    gs.add_invoice(invoice_id, supplier, buyer, "2024-09", {"tax_value": 180.0, "total_value": 1000.0})
+
+def _store(fork_interval: float = 0.0) -> GraphStore:
+    store = GraphStore(nx.DiGraph(), fork_interval=fork_interval)
+    with store.write() as gs:
+        _add_invoice(gs, "INV-1")
+    return store
+
+def test_pinned_reader_sees_no_later_writes():
+    store = _store()
+    with store.read() as pinned:
+        version = pinned.version
+        with store.write() as gs:
+            _add_invoice(gs, "INV-2", buyer="GSTIN_C")
+        assert pinned.version == version
+        assert pinned.get_node("Invoice:INV-2") is None
+        assert not pinned.trade_graph.has_edge("Taxpayer:GSTIN_A", "Taxpayer:GSTIN_C")
+        # The write went to a fork, published for readers that pin from now on
+        assert store.forks == 1
+        with store.read() as fresh:
+            assert fresh.get_node("Invoice:INV-2") is not None
+    with store.read() as gs:
+        assert gs.version > version
+
+def test_failed_write_on_fork_is_not_published():
+    store = _store()
+    published = []
+    store.on_publish(lambda gs, previous, changes: published.append(changes))
+    with store.read() as pinned:
+        version = pinned.version
+        with pytest.raises(RuntimeError):
+            with store.write() as gs:
+                _add_invoice(gs, "INV-2")
+                raise RuntimeError("batch failed")
+    assert store.version == version
+    assert published == []
+    with store.read() as gs:
+        assert gs.get_node("Invoice:INV-2") is None
+    # The next write starts from the published version, not the dropped fork
+    with store.write() as gs:
+        _add_invoice(gs, "INV-3")
+    with store.read() as gs:
+        assert gs.get_node("Invoice:INV-3") is not None
+        assert gs.get_node("Invoice:INV-2") is None
+
+def test_failed_write_in_place_is_published():
+    store = _store()
+    published = []
+    store.on_publish(lambda gs, previous, changes: published.append(changes))
+    with pytest.raises(RuntimeError):
+        with store.write() as gs:
+            _add_invoice(gs, "INV-2")
+            raise RuntimeError("batch failed")
+    # Nobody had the graph pinned, so there was no copy to drop; listeners still hear about it
+    assert "Invoice:INV-2" in published[0]["nodes"]
+    with store.read() as gs:
+        assert gs.get_node("Invoice:INV-2") is not None
+
+def test_publish_listener_gets_changes():
+    store = _store()
+    published = []
+    store.on_publish(lambda gs, previous, changes: published.append((previous, gs.version, changes)))
+    version = store.version
+    with store.write() as gs:
+        _add_invoice(gs, "INV-2", buyer="GSTIN_C")
+        gs.add_taxpayer("GSTIN_D", {"risk_score": 50.0})
+    assert len(published) == 1
+    previous, new_version, changes = published[0]
+    assert previous == version
+    assert new_version == store.version > version
+    assert changes["nodes"] == {"Invoice:INV-2"}
+    assert changes["taxpayers"] == {"Taxpayer:GSTIN_A", "Taxpayer:GSTIN_C", "Taxpayer:GSTIN_D"}
+    assert changes["trade_edges"] == {("Taxpayer:GSTIN_A", "Taxpayer:GSTIN_C")}
+    assert changes["all"] is False
+
+def test_clear_reports_all_changed():
+    store = _store()
+    published = []
+    store.on_publish(lambda gs, previous, changes: published.append(changes))
+    with store.write() as gs:
+        gs.clear_graph()
+    assert published[0]["all"] is True
+
+def test_held_fork_batches_writes_and_merges_changes():
+    store = _store(fork_interval=3600)
+    published = []
+    store.on_publish(lambda gs, previous, changes: published.append((previous, changes)))
+    version = store.version
+    with store.read() as pinned:
+        with store.write() as gs:
+            _add_invoice(gs, "INV-2")
+        with store.write() as gs:
+            _add_invoice(gs, "INV-3")
+        # Both batches went into one fork that is not published yet
+        assert store.forks == 1
+        assert published == []
+        with store.read() as gs:
+            assert gs.get_node("Invoice:INV-2") is None
+        assert pinned.get_node("Invoice:INV-3") is None
+    # The last reader of the old version unpinned: the fork is published, with one merged record
+    assert len(published) == 1
+    previous, changes = published[0]
+    assert previous == version
+    assert changes["nodes"] == {"Invoice:INV-2", "Invoice:INV-3"}
+    with store.read() as gs:
+        assert gs.get_node("Invoice:INV-3") is not None
+
+def test_flush_publishes_held_fork():
+    store = _store(fork_interval=3600)
+    with store.read():
+        with store.write() as gs:
+            _add_invoice(gs, "INV-2")
+        store.flush()
+        with store.read() as gs:
+            assert gs.get_node("Invoice:INV-2") is not None
@@ -0,0 +1,68 @@
+import pandas as pd
+from services.invoice_matching import InvoiceMatcher, normalize_invoice_number
+
+def _frame(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["invoice_id", "supplier_gstin", "buyer_gstin", "period", "amount"])
+
+def _match(left, right) -> pd.DataFrame:
+    return InvoiceMatcher(threshold=0.75, tolerance=0.01).match(_frame(left), _frame(right), "amount", "amount")
+
+def _pairs(result: pd.DataFrame) -> dict:
+    return {(l, r): method for l, r, method in zip(result["left"], result["right"], result["method"])}
+
+def test_normalize_invoice_number():
+    assert normalize_invoice_number("INV/00042/2024-25") == "42"
+    assert normalize_invoice_number("42") == "42"
+    assert normalize_invoice_number("SYN-0042") == "SYN42"
+    # Not consecutive years, so not a fiscal-year tag
+    assert normalize_invoice_number("12-34") == "1234"
+
+def test_each_tier_matches():
+    left = [("INV-9", "A", "B", "2024-09", 100.0),
+            ("INV/00042", "A", "B", "2024-09", 100.0),
+            ("SYN-0077", "A", "B", "2024-09", 100.0),
+            ("ABCX-123", "A", "B", "2024-09", 100.0)]
+    right = [("INV-9", "A", "B", "2024-09", 100.0),
+             ("42", "A", "B", "2024-09", 100.0),
+             ("INV/77", "A", "B", "2024-09", 100.0),
+             ("ABCX-132", "A", "B", "2024-09", 100.0)]
+    result = _match(left, right)
+    assert _pairs(result) == {(0, 0): "exact", (1, 1): "normalised", (2, 2): "numeric", (3, 3): "fuzzy"}
+    confidence = dict(zip(result["method"], result["confidence"]))
+    assert confidence["exact"] == 1.0
+    assert confidence["exact"] > confidence["normalised"] > confidence["numeric"] > confidence["fuzzy"] >= 0.75
+
+def test_amount_disagreement_lowers_confidence():
+    same = _match([("INV/42", "A", "B", "2024-09", 100.0)], [("42", "A", "B", "2024-09", 100.0)])
+    off = _match([("INV/42", "A", "B", "2024-09", 100.0)], [("42", "A", "B", "2024-09", 150.0)])
+    assert off["confidence"][0] < same["confidence"][0]
+
+def test_assignment_is_one_to_one_best_first():
+    # Two filings of number 42 compete for one invoice; the one whose amount agrees wins
+    left = [("INV/42", "A", "B", "2024-09", 100.0), ("42", "A", "B", "2024-09", 200.0)]
+    right = [("00042", "A", "B", "2024-09", 200.0)]
+    result = _match(left, right)
+    assert _pairs(result) == {(1, 0): "normalised"}
+
+def test_each_row_used_once_across_tiers():
+    left = [("INV-7", "A", "B", "2024-09", 100.0), ("INV-8", "A", "B", "2024-09", 100.0)]
+    right = [("INV-7", "A", "B", "2024-09", 100.0)]
+    result = _match(left, right)
+    assert list(result["right"]) == [0]
+    assert _pairs(result) == {(0, 0): "exact"}
+
+def test_no_matches_across_blocks():
+    left = [("INV-1", "A", "B", "2024-09", 100.0),
+            ("INV-2", "A", "B", "2024-09", 100.0),
+            ("INV-3", "A", "B", "2024-09", 100.0)]
+    # Same numbers, but another buyer, another supplier and another period
+    right = [("INV-1", "A", "C", "2024-09", 100.0),
+             ("INV-2", "D", "B", "2024-09", 100.0),
+             ("INV-3", "A", "B", "2024-10", 100.0)]
+    assert _match(left, right).empty
+
+def test_index_labels_are_returned():
+    left = _frame([("INV/42", "A", "B", "2024-09", 100.0)]).set_axis(["filing-x"])
+    right = _frame([("42", "A", "B", "2024-09", 100.0)]).set_axis(["invoice-y"])
+    result = InvoiceMatcher(threshold=0.75).match(left, right, "amount", "amount")
+    assert list(zip(result["left"], result["right"])) == [("filing-x", "invoice-y")]
@@ -0,0 +1,33 @@
+import networkx as nx
+from models.schemas import GSTR1Record, GSTR2BRecord, Invoice, PurchaseRegisterEntry
+from services.graph_store import GraphStore
+from services.ingest_service import IngestService
+from services.ledger import LedgerReconciliation
+from services.persistence import GraphPersistence
+
+PARTIES = {"supplier_gstin": "GSTIN_A", "buyer_gstin": "GSTIN_B", "period": "2024-09"}
+
+def _mismatched(invoice_tax: float, gstr1=None, gstr2b=None, pr=None) -> bool:
+    store = GraphStore(nx.DiGraph(), fork_interval=0)
+    ingest = IngestService(store, GraphPersistence())
+    ingest.apply("invoice", [Invoice(invoice_id="INV-1", date="2024-09-01", total_value=1000.0, tax_value=invoice_tax, **PARTIES)])
+    if gstr1 is not None:
+        ingest.apply("gstr1", [GSTR1Record(invoice_id="INV-1", tax_value=gstr1, **PARTIES)])
+    if gstr2b is not None:
+        ingest.apply("gstr2b", [GSTR2BRecord(invoice_id="INV-1", itc_available=gstr2b, **PARTIES)])
+    if pr is not None:
+        ingest.apply("purchase_register", [PurchaseRegisterEntry(invoice_id="INV-1", tax_paid=pr, **PARTIES)])
+    with store.read() as gs:
+        frame = LedgerReconciliation(gs).frame("2024-09")
+    return bool(frame["mismatched"].iloc[0])
+
+def test_matching_amounts_are_not_mismatched():
+    assert not _mismatched(180.0, gstr1=180.0, gstr2b=180.0, pr=180.0)
+
+def test_difference_across_a_missing_dataset_is_mismatched():
+    # No GSTR-1 between the invoice and GSTR-2B
+    assert _mismatched(180.0, gstr2b=250.0)
+
+def test_small_drifts_that_add_up_are_mismatched():
+    # Each neighbouring pair is within the one-rupee tolerance; the invoice and the Purchase Register are not
+    assert _mismatched(180.0, gstr1=180.9, gstr2b=181.8, pr=182.7)
@@ -0,0 +1,109 @@
+import os
+import networkx as nx
+from models.schemas import GSTR1Record, Invoice
+from services.graph_store import GraphStore
+from services.ingest_service import IngestService
+from services.persistence import GraphPersistence
+
+def _invoice(invoice_id: str) -> Invoice:
+    return Invoice(invoice_id=invoice_id, supplier_gstin="GSTIN_A", buyer_gstin="GSTIN_B",
+                   date="2024-09-01", total_value=1000.0, tax_value=180.0, period="2024-09")
+
+def _gstr1(invoice_id: str) -> GSTR1Record:
+    return GSTR1Record(invoice_id=invoice_id, supplier_gstin="GSTIN_A", buyer_gstin="GSTIN_B",
+                       tax_value=180.0, period="2024-09")
+
+def _open(data_dir) -> GraphPersistence:
+    persistence = GraphPersistence()
+    persistence.open(str(data_dir))
+    return persistence
+
+def _recover(data_dir):
+    persistence = _open(data_dir)
+    store = GraphStore(nx.DiGraph())
+    try:
+        return persistence.recover(store), store.service()
+    finally:
+        persistence.close()
+
+def test_recover_loads_snapshot_then_replays_later_wal(tmp_path):
+    persistence = _open(tmp_path)
+    store = GraphStore(nx.DiGraph())
+    ingest = IngestService(store, persistence)
+    ingest.apply("invoice", [_invoice("INV-1"), _invoice("INV-2")])
+    assert persistence.snapshot(store) is not None
+    # Logged after the snapshot, so only the WAL has it
+    ingest.apply("gstr1", [_gstr1("INV-1")])
+    ingest.apply("invoice", [_invoice("INV-3")])
+    persistence.close()
+
+    result, gs = _recover(tmp_path)
+
+    assert result["snapshot"] is not None
+    assert result["wal_batches"] == 2
+    assert result["wal_rows"] == 2
+    for invoice_id in ("INV-1", "INV-2", "INV-3"):
+        assert gs.get_node(f"Invoice:{invoice_id}") is not None
+    assert gs.get_gstr1_entries("INV-1")
+    assert not gs.get_gstr1_entries("INV-2")
+
+def test_recover_without_snapshot_replays_whole_wal(tmp_path):
+    persistence = _open(tmp_path)
+    IngestService(GraphStore(nx.DiGraph()), persistence).apply("invoice", [_invoice("INV-1")])
+    persistence.close()
+
+    result, gs = _recover(tmp_path)
+
+    assert result["snapshot"] is None
+    assert result["wal_batches"] == 1
+    assert gs.get_node("Invoice:INV-1") is not None
+
+def test_recover_ignores_torn_last_wal_record(tmp_path):
+    persistence = _open(tmp_path)
+    ingest = IngestService(GraphStore(nx.DiGraph()), persistence)
+    ingest.apply("invoice", [_invoice("INV-1")])
+    ingest.apply("invoice", [_invoice("INV-2")])
+    persistence.close()
+    # A crash in the middle of appending the next batch
+    wal_dir = tmp_path / "wal"
+    segment = sorted(os.listdir(wal_dir))[-1]
+    with open(wal_dir / segment, "a", encoding="utf-8") as fh:
+        fh.write('{"kind": "invoice", "records": [{"invoice_id": "INV-3", "suppl')
+
+    result, gs = _recover(tmp_path)
+
+    assert result["wal_batches"] == 2
+    assert gs.get_node("Invoice:INV-1") is not None
+    assert gs.get_node("Invoice:INV-2") is not None
+    assert gs.get_node("Invoice:INV-3") is None
+
+def test_held_snapshot_survives_pruning_until_released(tmp_path, monkeypatch):
+    monkeypatch.setattr("config.SNAPSHOT_RETAIN", 1)
+    persistence = _open(tmp_path)
+    store = GraphStore(nx.DiGraph())
+    ingest = IngestService(store, persistence)
+    ingest.apply("invoice", [_invoice("INV-1")])
+    persistence.snapshot(store)
+    held, version = persistence.hold_snapshot()
+    assert version == store.version
+
+    ingest.apply("invoice", [_invoice("INV-2")])
+    persistence.snapshot(store)
+    assert os.path.isdir(held)
+
+    persistence.release_snapshot(held)
+    ingest.apply("invoice", [_invoice("INV-3")])
+    persistence.snapshot(store)
+    assert not os.path.exists(held)
+    persistence.close()
+
+def test_snapshot_retain_zero_still_prunes(tmp_path, monkeypatch):
+    monkeypatch.setattr("config.SNAPSHOT_RETAIN", 0)
+    persistence = _open(tmp_path)
+    store = GraphStore(nx.DiGraph())
+    ingest = IngestService(store, persistence)
+    for invoice_id in ("INV-1", "INV-2", "INV-3"):
+        ingest.apply("invoice", [_invoice(invoice_id)])
+        latest = persistence.snapshot(store)
+    assert os.listdir(os.path.join(str(tmp_path), "snapshots")) == [os.path.basename(latest)]
+    persistence.close()